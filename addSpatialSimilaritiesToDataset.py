@@ -6,11 +6,11 @@
 import os
 import sys
 import logging
-import pickle
 import json
 import numpy as np
 from namedEntityRecognition import ner
-from spatialEmbeddings import getCosineSimilarity, retrieveSpatial, createSpatialEmbeddingForLocations
+from spatialEmbeddings import createSpatialEmbeddingForLocations, readSignatures, phraseEmbeddings, getSpatialSimilarities
+from spatialSignatureStore import spatialSignatureStore
 from gensim.models import Word2Vec
 from gensim.models import KeyedVectors
 from copy import deepcopy
@@ -21,6 +21,7 @@ from copy import deepcopy
 pathForAnnotatedDatasetsWithTemporalSimilarities = './../timeNED/diaNED-corpus/with_dbpedia_annotations_and_temporal_similarities/'
 pathForAnnotatedDatasetsWithTemporalAndLocationSimilarities = './../timeNED/diaNED-corpus/with_dbpedia_annotations_and_temporal_spatial_similarities/'
 pathForSpatialSignatures = './../resources/SpatialSignatures.pkl'
+pathForSpatialSignatureStore = './../resources/SpatialSignatures' # Used instead of the pkl file if it exists (see spatialSignatureStore.py)
 pathForWordEmbeddingModels = './../resources/wordEmbeddings/word2vec'
 model = None
 spatialSignatures = None
@@ -55,8 +56,10 @@ def loadSignatures():
 
 	# Load all signatures: 
 	logger.info("Loading spatial signatures...")
-	with open(pathForSpatialSignatures, 'rb') as f:
-		spatialSignatures = pickle.load(f)
+	if os.path.isdir(pathForSpatialSignatureStore):
+		spatialSignatures = spatialSignatureStore(pathForSpatialSignatureStore)
+	else:
+		spatialSignatures = dict(readSignatures(pathForSpatialSignatures))
 	logger.info("Spatial signatures loaded.")
 
 
@@ -78,11 +81,14 @@ def loadDataset(pathForDataset):
 def addSpatialSimilarity(dataset):
 
 	newDataset = deepcopy(dataset)
-	for x in range(len(newDataset)):
+
+	# Named entity recognition for all sentences at once (in batches)
+	locationsInDocuments = locationAnnotator.getLocationsForSentences([document['sentence'] for document in newDataset])
+
+	for x, documentLocations in enumerate(locationsInDocuments):
 		
 		document = newDataset[x]
 		sentence = document['sentence']
-		documentLocations = locationAnnotator.getListOfLocationInSentece(sentence)
 		documentDBpediaAnnotations = document['annotations_dbpedia']
 		
 		if not documentDBpediaAnnotations:
@@ -91,36 +97,18 @@ def addSpatialSimilarity(dataset):
 		if not documentLocations:
 			continue
 
-		# for each entity annotated with DBpedia Spotlight
+		try:
+			documentSpatialEmbedding = createSpatialEmbeddingForLocations(documentLocations, sentence, model)
+		except Exception as e:
+			documentSpatialEmbedding = []
+
+		# Similarities for all entities annotated with DBpedia Spotlight at once (-1 if the entity has no spatial signature)
+		entityNames = [item['URI'].split('/')[-1] for item in documentDBpediaAnnotations]
+		spatialSimilarities = getSpatialSimilarities(spatialSignatures, entityNames, documentSpatialEmbedding, model)
+
 		newDBpediaAnnotations = [] 
-		for item in documentDBpediaAnnotations:
-			entityName = item['URI'].split('/')[-1]
-			
-			try:
-				signature = retrieveSpatial(spatialSignatures, entityName, model)
-			except ValueError as e:
-				spatialSimilarity = -1
-				item.update({"spatialSimilarity":spatialSimilarity})
-				newDBpediaAnnotations.append(item)
-				continue
-
-			try:
-				documentSpatialEmbedding = createSpatialEmbeddingForLocations(documentLocations, sentence, model)
-			except Exception as e:
-				spatialSimilarity = -1
-				item.update({"spatialSimilarity":spatialSimilarity})
-				newDBpediaAnnotations.append(item)
-				continue
-
-			try:
-				spatialSimilarity = getCosineSimilarity(signature, documentSpatialEmbedding)
-			except Exception as e:
-				spatialSimilarity = -1
-				item.update({"spatialSimilarity":spatialSimilarity})
-				newDBpediaAnnotations.append(item)
-				continue
-
-			item.update({"spatialSimilarity":spatialSimilarity})
+		for item, spatialSimilarity in zip(documentDBpediaAnnotations, spatialSimilarities):
+			item.update({"spatialSimilarity":-1 if spatialSimilarity == -1 else float(spatialSimilarity)})
 			newDBpediaAnnotations.append(item)
 
 		document['annotations_dbpedia'] = newDBpediaAnnotations
@@ -152,6 +140,7 @@ if __name__ == '__main__':
 				jsonFileStr = json.dump(newDataset, jsonFile, indent=4)
 				jsonFile.close()
 
+	logger.info(phraseEmbeddings.getReport())
 	print ("All done!!!")
 
 
@@ -3,13 +3,23 @@
 # This script converts the multiple outputs generated by 'createLocationEmbeddings.py'
 # to a single pkl file with the following format:
 # {article_title:{indices:[location_mentions], counts[locations_counts]}
+# The files are converted in parallel and streamed to the pkl file: it contains one list of 
+# (article_title, {indices:[location_mentions], counts[locations_counts]}) per input file 
+# (see spatialEmbeddings.readSignatures), so the memory used does not depend on the number of files.
 #-----------------------------------------------------------------------------------------------------
 
 import os
 import sys
 import pickle
+import multiprocessing as mp
 from itertools import groupby
 
+#------------------------------------------------------------------------
+# Global and configuration values
+#------------------------------------------------------------------------
+nProcess = mp.cpu_count()
+filesInFlight = 4 * nProcess # Maximum number of files converted (or waiting to be saved) at once
+
 #------------------------------------------------------------------------
 # For each line in the file, return a dictionary with the format
 # article_id	article_title	location_mentions	locations_counts
@@ -39,37 +49,71 @@ def countAndRemoveDuplicates(embedding):
 	return article_title, dic
 
 #------------------------------------------------------------------------
+# Convert all lines of an output file of 'createLocationEmbeddings.py'. 
+# Return the number of signatures and the pickled list of (article_title, signature)
+#------------------------------------------------------------------------
+def convertFile(path):
 
-if __name__ == '__main__':
-	
+	signatures = []
+	with open(path, 'r') as embeddinsFile:
+		for embedding in embeddinsFile:
 
-	if len(sys.argv) != 3:
-		print ("Incorrect number of arguments. Please provide path to input and output files.")
+			try:
+				signatures.append(countAndRemoveDuplicates(embedding))
+			except Exception as e:
+				print("Error: " + str(e))
 
-	pathForInputFiles = sys.argv[1]
-	pathToOutputFile = sys.argv[2]
+	return len(signatures), pickle.dumps(signatures, protocol=pickle.HIGHEST_PROTOCOL)
+
+#------------------------------------------------------------------------
+# Return the paths of the .txt files in pathForInputFiles
+#------------------------------------------------------------------------
+def getInputFiles(pathForInputFiles):
 
-	n = 0
-	allEmbeddingsDic = {}
 	for root, dirs, files in os.walk(pathForInputFiles):
 		for fileName in files:
 
-			if not fileName.endswith('.txt'):
-				continue
+			if fileName.endswith('.txt'):
+				yield os.path.join(root, fileName)
 
-			print ("Converting {}".format(fileName))
+#------------------------------------------------------------------------
+# Convert the files with a pool of processes and write their signatures to outputFile in the order of the files
+# (so, as in a dictionary, the last signature of an article is the one kept). 
+# At most filesInFlight files are converted at once
+#------------------------------------------------------------------------
+def convertAllFiles(pathForInputFiles, outputFile):
+
+	n = 0
+	paths = list(getInputFiles(pathForInputFiles))
+	pool = mp.Pool(nProcess)
+	try:
+		for first in range(0, len(paths), filesInFlight):
+			window = paths[first:first + filesInFlight]
+			for path, (nSignatures, signatures) in zip(window, pool.imap(convertFile, window)):
+
+				print ("Converting {}".format(os.path.basename(path)))
+				outputFile.write(signatures)
+				n += nSignatures
+	finally:
+		pool.close()
+		pool.join()
+
+	return n
+
+#------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	
 
-			embeddinsInFile = open(os.path.join(root, fileName), 'r').readlines()
-			for embedding in embeddinsInFile:
-				
-				try:
-					title, dicAux = countAndRemoveDuplicates(embedding)
-					allEmbeddingsDic[title] = dicAux 
-				except Exception as e:
-					print("Error: " + str(e))
+	if len(sys.argv) != 3:
+		print ("Incorrect number of arguments. Please provide path to input and output files.")
+		sys.exit()
+
+	pathForInputFiles = sys.argv[1]
+	pathToOutputFile = sys.argv[2]
 
-	print ("Saving to file")
-	pickle.dump(allEmbeddingsDic, open(pathToOutputFile, "wb" ) )
+	with open(pathToOutputFile, "wb") as outputFile:
+		n = convertAllFiles(pathForInputFiles, outputFile)
 
 	print ("All done!")
 	print (str(n) + " embeddins created so far.")
@@ -18,9 +18,11 @@ from smart_open import smart_open
 from nltk.tokenize import sent_tokenize
 import math
 import namedEntityRecognition
+import locationCache
 import time
 import multiprocessing as mp
-import signal
+import multiprocessing.connection
+import collections
 
 #---------------------------------------------------------------------
 # Configure log information
@@ -33,133 +35,615 @@ logger = logging.getLogger(__name__)
 #---------------------------------------------------------------------
 wikipediaDumpJSON = './enwiki-latest-with-id.json.gz'
 nProcess = 10
-hashSize = 20 # Do not change
-nerObj = namedEntityRecognition.ner()
+batchSize = 100 # Number of articles sent to a worker at once
+nerBatchSize = 1000 # Number of sentences processed at once by the language model
+nerTimeout = 60 # Seconds without progress before a worker is considered stuck and restarted
+maxBatchFailures = 2 # Times a worker can die with the same batch (outside NER, or in NER without a sentence to quarantine) before its articles are quarantined
+pathForQuarantineFile = './outputs/quarantinedSentences.tsv' # Sentences that timed out and articles of batches that failed
+pathForNERCache = './nerCache.sqlite' # Locations of sentences and articles analized in this or previous runs (None to disable)
+maxCacheEntries = 20000000 # The least recently used entries are evicted
+cleanerVersion = 1 # Increase it when cleanSection or the sentence splitting change, so the cache is cleared (see getCacheVersion)
+pathForOutputFiles = './outputs'
+pathForProcessedArticlesIndex = './outputs/processedArticles' # Index of the articles in the output files (.bitmap and .json)
+indexSaveInterval = 300 # Seconds between two saves of the index during the run
+statsInterval = 60 # Seconds between two summaries of the throughput of each worker
+pathForStatsFile = './outputs/workerStats.json' # Throughput of the workers, rewritten every statsInterval seconds
+profileNER = False # Report the time spent by each component of the language model
+nerObj = None # Loaded once by the main process and inherited by the workers (see namedEntityRecognition.getSharedNer)
+
+# Phases of a worker (see workerStatus)
+idlePhase = 0
+preparingPhase = 1
+nerPhase = 2
+writingPhase = 3
+
+# Metrics of a worker (see workerMetrics): number of articles and sentences and seconds spent in each step
+articlesMetric, sentencesMetric, cleaningMetric, tokenizingMetric, nerMetric, writingMetric = range(6)
+metricNames = ['articles', 'sentences', 'cleaningTime', 'tokenizingTime', 'nerTime', 'writingTime']
 
 #---------------------------------------------------------------------
-# This function interates over the wikipedia dump (conveted to json by segment_wiki.py (from gemsin)) 
-# to perform named entity recognition. 
-# Does not load the entiry file in memory. One article at the time (memory friendly) 
+# This function reads the wikipedia dump (conveted to json by segment_wiki.py (from gemsin)) once
+# and yields batches of articles (raw json lines). It is read by the main process when a worker needs a batch (see watchWorkers).
+# Does not load the entiry file in memory (memory friendly). 
+# A batch is: (batchId, index of its first article, lines, articles already written, quarantined sentences, analize one sentence at the time)
 #---------------------------------------------------------------------
-def getLocationEmbeddinsFromWikipedia(processName, existingEmbeddinsIDs, startFromFileWithIndex, stopAtFile):
+def readWikipediaArticles():
 
-	print ("Starting " + processName)
+	batch = []
+	batchId = 0
+	firstIndex = 0
+	for n, line in enumerate(smart_open(wikipediaDumpJSON)):
 
-	n = 0
-	createNewFile = True
-	for line in smart_open(wikipediaDumpJSON):
+		batch.append(line)
+		if len(batch) == batchSize:
+			yield (batchId, firstIndex, batch, frozenset(), frozenset(), False)
+			batch = []
+			batchId += 1
+			firstIndex = n + 1
 
-		# Load into a dictionary
-		article = json.loads(line.decode('utf-8'))
+	if batch:
+		yield (batchId, firstIndex, batch, frozenset(), frozenset(), False)
 
-		if n < startFromFileWithIndex:
-			n += 1
+#---------------------------------------------------------------------
+# Return the articles of a batch that were not analized yet (and not written by a worker that died with the batch)
+#---------------------------------------------------------------------
+def getArticlesInBatch(firstIndex, lines, existingEmbeddinsIDs, written=frozenset()):
+
+	articles = []
+	for n, line in enumerate(lines, firstIndex):
+
+		if n in written:
 			continue
 
-		if n > stopAtFile:
-			locationEmbeddins.close()
-			break
+		# Load into a dictionary
+		article = json.loads(line.decode('utf-8'))
 
-		if int(article['articleID']) in existingEmbeddinsIDs[int(article['articleID']) % hashSize]:
+		if int(article['articleID']) in existingEmbeddinsIDs:
 			#logger.info ("[{}] Embeddings for article with title {} is already created".format(processName, article['title']))
 			continue
 
-		if createNewFile:
-			locationEmbeddins = open('./outputs/locationEmbeddins_{}_{}.txt'.format(processName, str(n)), 'w')
-			createNewFile = False
+		articles.append((n, article))
 
-		logger.info("[{}]: Parsing article {}: {}".format(processName, str(n), article['title']))
+	return articles
 
-		locationsInArticle = []
-		for section_title, section_text in zip(article['section_titles'], article['section_texts']):
+#---------------------------------------------------------------------
+# Remove wiki markups, HTML tags and parenthesis from the text of a section
+#---------------------------------------------------------------------
+def cleanSection(section_text):
+
+	# Remove wiki markups and HTML tags
+	section_text = unwiki.loads(section_text, compress_spaces=True)
+	section_text = re.sub(r'<.*?>', '', section_text)
 
-			# Remove wiki markups and HTML tags
-			section_text = unwiki.loads(section_text, compress_spaces=True)
-			section_text = re.sub(r'<.*?>', '', section_text)
+	# Remove parethesis
+	return re.sub("[($@*&?].*[$)@*&?]", "", section_text)
+
+#---------------------------------------------------------------------
+# Return the sentences in the sections of an article (as the worker splits them)
+#---------------------------------------------------------------------
+def getSentencesInArticle(article):
 
-			# Remove parethesis 
-			section_text = re.sub("[($@*&?].*[$)@*&?]", "", section_text)
+	sentencesInArticle = []
+	for section_text in article['section_texts']:
+		sentencesInArticle.extend(sent_tokenize(cleanSection(section_text)))
 
-			# Tokenize into sentences
-			senteces_in_section = sent_tokenize(section_text)
+	return sentencesInArticle
+
+#---------------------------------------------------------------------
+# Return the version of the locations in the cache: the language model and the cleaning of the text
+#---------------------------------------------------------------------
+def getCacheVersion():
+	return "{}; cleaner {}".format(nerObj.getVersion(), cleanerVersion)
+
+#---------------------------------------------------------------------
+# NER worker: receives batches of articles from its pipe (until the stop signal) 
+# and performs named entity recognition on each article. 
+# The main process sends a new batch as soon as the worker reports the previous one, so all of them are busy until the end of the dump. 
+# Articles and sentences in the cache are not analized again. 
+# Output files that are opened and closed and batches that are done are reported through the same pipe. 
+# The worker reports its progress in status: [batchId, phase, time of the last progress, 
+# article and sentence being analized], so the watchdog can detect (and restart) a stuck worker. 
+# The hits and misses of the cache are added to cacheStats: [article hits, article misses, sentence hits, sentence misses]
+# and the throughput of the worker to metrics (see metricNames), which is summarized every statsInterval seconds
+#---------------------------------------------------------------------
+def getLocationEmbeddinsFromWikipedia(processName, existingEmbeddinsIDs, connection, status, cacheStats, metrics):
 
-			# Perform Named entity recoginition at a sentence level:
-			for sentence in senteces_in_section:
-				signal.signal(signal.SIGALRM, handler)
-				signal.alarm(10)
-				try:
-					listOfLocations = nerObj.getListOfLocationInSentece(sentence)
-				except:
-					continue
-				signal.alarm(0)
-				locationsInArticle.extend(listOfLocations)
+	print ("Starting " + processName)
 
-		n += 1
-		locationEmbeddins.write("{}\t{}\t{}\n".format(article['articleID'], article['title'], ";".join(locationsInArticle)))
+	cache = None
+	if pathForNERCache:
+		cache = locationCache.locationCache(pathForNERCache, maxEntries=maxCacheEntries, version=getCacheVersion())
 
-		# Create new file every 10000 interations (just in case the script crash in the middle)
-		if n % 1000 == 0:
-			locationEmbeddins.close()
-			createNewFile = True
+	nInFile = 0
+	createNewFile = True
+	lastSummary, metricsInLastSummary = time.time(), list(metrics)
+	for batchId, firstIndex, lines, written, quarantined, oneSentenceAtTheTime in iter(connection.recv, None):
+
+		status[0], status[1], status[2], status[3], status[4] = batchId, preparingPhase, time.time(), -1, -1
+
+		# Articles of the batch that were not analized yet
+		articles = getArticlesInBatch(firstIndex, lines, existingEmbeddinsIDs, written)
+
+		# Articles that did not change since they were analized are in the cache
+		articleKeys = [locationCache.getKey('article', json.dumps(article['section_texts'])) for n, article in articles]
+		cachedArticles = cache.get('article', articleKeys) if cache else {}
+
+		# Sentences of the other articles, as (article, index of the sentence in the article, sentence), except the quarantined ones
+		sentencesInArticles = {}
+		sentences = []
+		for (n, article), articleKey in zip(articles, articleKeys):
+			if articleKey not in cachedArticles:
+				sentencesInArticles[n] = []
+				for section_text in article['section_texts']:
+					start = time.time()
+					section_text = cleanSection(section_text)
+					metrics[cleaningMetric] += time.time() - start
+					start = time.time()
+					sentencesInArticles[n].extend(sent_tokenize(section_text))
+					metrics[tokenizingMetric] += time.time() - start
+				sentences.extend((n, x, sentence) for x, sentence in enumerate(sentencesInArticles[n]) if (n, x) not in quarantined)
+
+		# Repeated sentences are in the cache
+		sentenceKeys = [locationCache.getKey('sentence', sentence) for n, x, sentence in sentences]
+		cachedSentences = cache.get('sentence', sentenceKeys) if cache else {}
+		locationsInSentences = {}
+		sentencesToAnalize = []
+		for (n, x, sentence), sentenceKey in zip(sentences, sentenceKeys):
+			if sentenceKey in cachedSentences:
+				locationsInSentences[(n, x)] = cachedSentences[sentenceKey]
+			else:
+				sentencesToAnalize.append((n, x, sentence, sentenceKey))
+
+		# Perform Named entity recoginition on the other sentences of all articles at once:
+		if sentencesToAnalize:
+			status[3], status[4] = sentencesToAnalize[0][0], sentencesToAnalize[0][1]
+		status[2], status[1] = time.time(), nerPhase
+		start = time.time()
+		newSentences = {}
+		locations = nerObj.getLocationsForSentences((sentence for n, x, sentence, sentenceKey in sentencesToAnalize), batch_size=1 if oneSentenceAtTheTime else nerBatchSize)
+		for position, locationsInSentence in enumerate(locations):
+			n, x, sentence, sentenceKey = sentencesToAnalize[position]
+			locationsInSentences[(n, x)] = locationsInSentence
+			newSentences[sentenceKey] = locationsInSentence
+			if position + 1 < len(sentencesToAnalize):
+				status[3], status[4] = sentencesToAnalize[position + 1][0], sentencesToAnalize[position + 1][1]
+			status[2] = time.time()
+		metrics[nerMetric] += time.time() - start
+
+		status[1] = writingPhase
+		start = time.time()
+		newArticles = {}
+		for (n, article), articleKey in zip(articles, articleKeys):
+
+			if createNewFile:
+				locationEmbeddinsPath = os.path.join(pathForOutputFiles, 'locationEmbeddins_{}_{}.txt'.format(processName, str(n)))
+				locationEmbeddins = open(locationEmbeddinsPath, 'w')
+				connection.send(('open', locationEmbeddinsPath))
+				createNewFile = False
+
+			logger.debug("[{}]: Parsing article {}: {}".format(processName, str(n), article['title']))
+
+			if articleKey in cachedArticles:
+				locationsInArticle = cachedArticles[articleKey]
+			else:
+				locationsInArticle = []
+				for x in range(len(sentencesInArticles[n])):
+					locationsInArticle.extend(locationsInSentences.get((n, x), []))
+				# Articles with quarantined sentences are not cached
+				if not any((n, x) in quarantined for x in range(len(sentencesInArticles[n]))):
+					newArticles[articleKey] = locationsInArticle
+
+			nInFile += 1
+			locationEmbeddins.write("{}\t{}\t{}\n".format(article['articleID'], article['title'], ";".join(locationsInArticle)))
+
+			# Create new file every 1000 articles (just in case the script crash in the middle)
+			if nInFile % 1000 == 0:
+				locationEmbeddins.close()
+				connection.send(('file', locationEmbeddinsPath))
+				createNewFile = True
+
+		# Results of the batch are on disk before the batch is reported as done
+		if not createNewFile:
+			locationEmbeddins.flush()
+		if cache:
+			cache.put(newSentences)
+			cache.put(newArticles)
+			cacheStats[0] += len(cachedArticles)
+			cacheStats[1] += len(set(articleKeys)) - len(cachedArticles)
+			cacheStats[2] += len(cachedSentences)
+			cacheStats[3] += len(set(sentenceKeys)) - len(cachedSentences)
+		metrics[writingMetric] += time.time() - start
+		metrics[articlesMetric] += len(articles)
+		metrics[sentencesMetric] += len(sentences)
+		status[1] = idlePhase
+		connection.send(('batch', batchId))
+
+		if time.time() - lastSummary > statsInterval:
+			logger.info("[{}]: {}".format(processName, getMetricsSummary(metrics, metricsInLastSummary, time.time() - lastSummary)))
+			lastSummary, metricsInLastSummary = time.time(), list(metrics)
+
+	if not createNewFile:
+		locationEmbeddins.close()
+		connection.send(('file', locationEmbeddinsPath))
+
+	if cache:
+		print ("[{}]: {}".format(processName, cache.getReport()))
+		cache.close()
+
+	if profileNER:
+		print ("[{}]: {}".format(processName, nerObj.getTimingReport()))
 
 	print ("Exiting " + processName)
 
 #---------------------------------------------------------------------
-# Register an handler for the timeout
+# Log a sentence that timed out to the quarantine file (instead of dropping it silently)
+#---------------------------------------------------------------------
+def quarantineSentence(batch, n, sentenceIndex):
+
+	batchId, firstIndex, lines, written, quarantined, oneSentenceAtTheTime = batch
+	article = json.loads(lines[n - firstIndex].decode('utf-8'))
+
+	sentence = getSentencesInArticle(article)[sentenceIndex].replace('\t', ' ').replace('\n', ' ')
+	print ("Sentence timeout. Sentence of article {} quarantined: {}".format(article['title'], sentence))
+	with open(pathForQuarantineFile, 'a') as quarantineFile:
+		quarantineFile.write("{}\t{}\t{}\n".format(article['articleID'], article['title'], sentence))
+
+#---------------------------------------------------------------------
+# Log the articles of a batch that were not written to the quarantine file (the workers died with the batch too many times)
+#---------------------------------------------------------------------
+def quarantineArticles(batch, reason):
+
+	batchId, firstIndex, lines, written, quarantined, oneSentenceAtTheTime = batch
+	with open(pathForQuarantineFile, 'a') as quarantineFile:
+		for n, line in enumerate(lines, firstIndex):
+			if n in written:
+				continue
+			try:
+				article = json.loads(line.decode('utf-8'))
+				articleID, title = article['articleID'], article['title']
+			except (ValueError, KeyError):
+				articleID, title = '', 'Line {} of the dump'.format(n)
+			quarantineFile.write("{}\t{}\t{}\n".format(articleID, title, reason))
+
+#---------------------------------------------------------------------
+# Return the articles of a batch (index in the dump) that are in the index of processed articles
 #---------------------------------------------------------------------
-def handler(signum, frame):
-	print ("Function timeout. Sentence not analized")
-	raise Exception("Timeout exception")
+def getWrittenArticles(batch, existingEmbeddinsIDs):
+
+	batchId, firstIndex, lines, written, quarantined, oneSentenceAtTheTime = batch
+	for n, line in enumerate(lines, firstIndex):
+		try:
+			if int(json.loads(line.decode('utf-8'))['articleID']) in existingEmbeddinsIDs:
+				written = written | frozenset([n])
+		except (ValueError, KeyError):
+			pass
 
+	return written
 
 #---------------------------------------------------------------------
-# Return a hash table of wikipedia articles (by IDs) that have already been analized. 
+# Return the throughput of a worker in the last interval (seconds), given its metrics now and at the start of the interval
+#---------------------------------------------------------------------
+def getMetricsSummary(metrics, metricsBefore, interval):
+
+	delta = [now - before for now, before in zip(metrics, metricsBefore)]
+	stepsTime = sum(delta[cleaningMetric:]) or 1.0
+	return "{:.0f} articles ({:.1f}/s), {:.0f} sentences ({:.1f}/s). Time: cleaning {:.0%}, tokenizing {:.0%}, NER {:.0%}, writing {:.0%}".format(
+		delta[articlesMetric], delta[articlesMetric] / interval, delta[sentencesMetric], delta[sentencesMetric] / interval,
+		delta[cleaningMetric] / stepsTime, delta[tokenizingMetric] / stepsTime, delta[nerMetric] / stepsTime, delta[writingMetric] / stepsTime)
+
+#---------------------------------------------------------------------
+# Write the throughput of each worker (since the start of the run and in the last interval) to pathForStatsFile (json). 
+# Metrics are kept by slot, so they include the workers that were restarted
+#---------------------------------------------------------------------
+def writeWorkerStats(workerMetrics, metricsInLastStats, interval, elapsed, nTimeouts, nRestarts, queueDepth, nPendingBatches):
+
+	workers = []
+	for slot in range(len(workerMetrics)):
+		stats = dict(zip(metricNames, workerMetrics[slot]))
+		stats['slot'] = slot
+		stats['articlesPerSecond'] = stats['articles'] / elapsed
+		stats['sentencesPerSecond'] = stats['sentences'] / elapsed
+		stats['articlesPerSecondInLastInterval'] = (workerMetrics[slot][articlesMetric] - metricsInLastStats[slot][articlesMetric]) / interval
+		stats['sentencesPerSecondInLastInterval'] = (workerMetrics[slot][sentencesMetric] - metricsInLastStats[slot][sentencesMetric]) / interval
+		stats['timeouts'] = nTimeouts[slot]
+		stats['restarts'] = nRestarts[slot]
+		workers.append(stats)
+
+	stats = {'time': time.time(), 'elapsed': elapsed, 'queueDepth': queueDepth, 'pendingBatches': nPendingBatches, 'workers': workers}
+	for name in metricNames + ['articlesPerSecond', 'sentencesPerSecond', 'articlesPerSecondInLastInterval', 'sentencesPerSecondInLastInterval', 'timeouts', 'restarts']:
+		stats[name] = sum(worker[name] for worker in workers)
+
+	with open(pathForStatsFile + '.tmp', 'w') as statsFile:
+		json.dump(stats, statsFile, indent=1)
+	os.replace(pathForStatsFile + '.tmp', pathForStatsFile)
+
+	return stats
+
+#---------------------------------------------------------------------
+# Handle a message of the worker in a slot: ('batch', batchId) when a batch is done, ('open', path) when an output file
+# is opened or ('file', path) when it is closed. assignedBatches and openFiles have the batch and the output file of each slot
+#---------------------------------------------------------------------
+def handleWorkerMessage(slot, message, pendingBatches, assignedBatches, openFiles, existingEmbeddinsIDs):
+
+	kind, value = message
+	if kind == 'batch':
+		pendingBatches.pop(value, None)
+		assignedBatches[slot] = None
+	elif kind == 'open':
+		openFiles[slot] = value
+	else:
+		openFiles[slot] = None
+		existingEmbeddinsIDs.addFile(value)
+		if time.time() - existingEmbeddinsIDs.lastSave > indexSaveInterval:
+			existingEmbeddinsIDs.save()
+
+#---------------------------------------------------------------------
+# Start the NER workers and watch them until all batches read from the dump are done. 
+# The main process reads the dump and sends one batch at a time to each worker, through a pipe of its own. It has no other
+# thread, so forking a worker (also to restart it) is safe, and a worker that is terminated can only break its own pipe. 
+# A worker without progress for nerTimeout seconds during NER (or that died during NER) is restarted and its batch is
+# queued again, to be analized one sentence at the time. If that times out again, the offending sentence
+# is known: it is quarantined and the batch is queued again without it. 
+# If a worker dies while preparing or writing a batch, the output file it was writing is added to the index and the batch
+# is queued again without the articles already written. After maxBatchFailures such deaths, its articles are quarantined. 
+# The output files closed by the workers are added to the index of processed articles (existingEmbeddinsIDs). 
+# Every statsInterval seconds, the throughput of the workers and the number of waiting batches are written to pathForStatsFile
+#---------------------------------------------------------------------
+def watchWorkers(existingEmbeddinsIDs):
+
+	# The workers are forked, so they inherit the language model loaded by the main process
+	context = mp.get_context('fork')
+	batchesInDump = readWikipediaArticles()
+	readerDone = False
+	waitingBatches = collections.deque()
+	pendingBatches = {}
+	nBatchFailures = collections.Counter()
+
+	workers = [None] * nProcess
+	connections = [None] * nProcess
+	assignedBatches = [None] * nProcess
+	openFiles = [None] * nProcess
+	workerStatus = [context.RawArray('d', [-1, idlePhase, 0, -1, -1]) for slot in range(nProcess)]
+	cacheStats = [context.RawArray('d', 4) for slot in range(nProcess)]
+	workerMetrics = [context.RawArray('d', len(metricNames)) for slot in range(nProcess)]
+	nRestarts = [0] * nProcess
+	nTimeouts = [0] * nProcess
+
+	def startWorker(slot):
+		processName = "Process_{}_{}".format(str(slot), str(nRestarts[slot]))
+		workerStatus[slot][1] = idlePhase
+		connections[slot], workerConnection = context.Pipe()
+		workers[slot] = context.Process(target=getLocationEmbeddinsFromWikipedia, args=(processName, existingEmbeddinsIDs, workerConnection, workerStatus[slot], cacheStats[slot], workerMetrics[slot]))
+		workers[slot].start()
+		# Only the worker has its end of the pipe, so the pipe is closed when it dies
+		workerConnection.close()
+		assignedBatches[slot] = None
+		openFiles[slot] = None
+
+	def receiveMessages(slot):
+		try:
+			while connections[slot].poll():
+				handleWorkerMessage(slot, connections[slot].recv(), pendingBatches, assignedBatches, openFiles, existingEmbeddinsIDs)
+		except (EOFError, OSError):
+			# The worker died (see below)
+			pass
+
+	for slot in range(nProcess):
+		startWorker(slot)
+
+	startTime = lastStats = time.time()
+	metricsInLastStats = [list(metrics) for metrics in workerMetrics]
+	while True:
+
+		# Batches are read from the dump when a worker is free (batches queued again go first)
+		for slot in range(nProcess):
+			if assignedBatches[slot] is not None or not workers[slot].is_alive():
+				continue
+			if not waitingBatches and not readerDone:
+				batch = next(batchesInDump, None)
+				if batch is None:
+					readerDone = True
+				else:
+					pendingBatches[batch[0]] = batch
+					waitingBatches.append(batch)
+			if not waitingBatches:
+				break
+			batch = waitingBatches.popleft()
+			try:
+				connections[slot].send(batch)
+				assignedBatches[slot] = batch[0]
+			except OSError:
+				waitingBatches.appendleft(batch)
+
+		if readerDone and not pendingBatches:
+			break
+
+		for connection in mp.connection.wait(connections, timeout=1):
+			receiveMessages(connections.index(connection))
+
+		if time.time() - lastStats > statsInterval:
+			stats = writeWorkerStats(workerMetrics, metricsInLastStats, time.time() - lastStats, time.time() - startTime, nTimeouts, nRestarts, len(waitingBatches), len(pendingBatches))
+			print ("{:.0f} articles ({:.1f}/s), {:.0f} sentences ({:.1f}/s), {} batches waiting, {} timeouts".format(stats['articles'], stats['articlesPerSecondInLastInterval'], stats['sentences'], stats['sentencesPerSecondInLastInterval'], stats['queueDepth'], stats['timeouts']))
+			lastStats, metricsInLastStats = time.time(), [list(metrics) for metrics in workerMetrics]
+
+		for slot in range(nProcess):
+
+			batchId, phase, lastProgress, n, sentenceIndex = workerStatus[slot]
+			isStuck = phase == nerPhase and time.time() - lastProgress > nerTimeout
+			if not isStuck and workers[slot].is_alive():
+				continue
+
+			workers[slot].terminate()
+			workers[slot].join()
+			# Messages sent before the worker died (e.g., its batch was done)
+			receiveMessages(slot)
+			connections[slot].close()
+			batch = pendingBatches.get(assignedBatches[slot])
+
+			# The output file of the worker will not be written anymore
+			if openFiles[slot] is not None:
+				existingEmbeddinsIDs.addFile(openFiles[slot])
+
+			nRestarts[slot] += 1
+			if isStuck:
+				nTimeouts[slot] += 1
+			startWorker(slot)
+			print ("Worker {} restarted (stuck: {})".format(slot, isStuck))
+
+			if batch is None:
+				continue
+
+			# The first time the worker dies in NER, the batch is analized again one sentence at the time,
+			# so the sentence that got the worker stuck is known the next time and only that sentence is quarantined
+			batchId = batch[0]
+			if phase == nerPhase and (not batch[5] or sentenceIndex >= 0):
+				quarantined = batch[4]
+				if batch[5]:
+					quarantineSentence(batch, int(n), int(sentenceIndex))
+					quarantined = quarantined | frozenset([(int(n), int(sentenceIndex))])
+				pendingBatches[batchId] = (batch[0], batch[1], batch[2], batch[3], quarantined, True)
+				waitingBatches.appendleft(pendingBatches[batchId])
+				continue
+
+			# Other failures (outside NER, or in NER without a sentence to quarantine) are counted, so a batch is not sent again forever.
+			# Some results of the batch may be on disk, those articles are not analized again
+			nBatchFailures[batchId] += 1
+			written = getWrittenArticles(batch, existingEmbeddinsIDs)
+			if nBatchFailures[batchId] >= maxBatchFailures:
+				reason = "Worker died {} times with the batch".format(nBatchFailures[batchId])
+				quarantineArticles((batch[0], batch[1], batch[2], written, batch[4], batch[5]), reason)
+				pendingBatches.pop(batchId)
+				print ("Batch {} failed {} times. {} articles quarantined".format(batchId, nBatchFailures[batchId], len(batch[2]) - len(written)))
+				continue
+
+			pendingBatches[batchId] = (batch[0], batch[1], batch[2], written, batch[4], batch[5])
+			waitingBatches.appendleft(pendingBatches[batchId])
+			print ("Worker {} died {}. Batch {} queued again ({} articles already written)".format(slot, "in NER without a sentence to quarantine" if phase == nerPhase else "outside NER", batchId, len(written)))
+
+	# One stop signal per worker
+	for slot in range(nProcess):
+		try:
+			connections[slot].send(None)
+		except OSError:
+			pass
+
+	# Files closed by the workers when they stopped (until their pipe is closed)
+	for slot in range(nProcess):
+		try:
+			while True:
+				handleWorkerMessage(slot, connections[slot].recv(), pendingBatches, assignedBatches, openFiles, existingEmbeddinsIDs)
+		except (EOFError, OSError):
+			pass
+		workers[slot].join()
+		connections[slot].close()
+	existingEmbeddinsIDs.save()
+	writeWorkerStats(workerMetrics, metricsInLastStats, time.time() - lastStats, time.time() - startTime, nTimeouts, nRestarts, 0, len(pendingBatches))
+
+	if pathForNERCache:
+		hits = {'article': int(sum(stats[0] for stats in cacheStats)), 'sentence': int(sum(stats[2] for stats in cacheStats))}
+		misses = {'article': int(sum(stats[1] for stats in cacheStats)), 'sentence': int(sum(stats[3] for stats in cacheStats))}
+		print (locationCache.getHitRateReport(hits, misses))
+
+#---------------------------------------------------------------------
+# Class with the IDs of the wikipedia articles that have already been analized (a bitmap over article IDs). 
+# It is saved with the output files it covers (and their size), so a restart only reads
+# the output files that were written or changed after the last save
+#---------------------------------------------------------------------
+class processedArticles:
+
+	def __init__(self, path):
+		self.path = path
+		self.bitmap = bytearray()
+		self.coveredFiles = {}
+		self.n = 0
+		self.lastSave = time.time()
+
+	def __contains__(self, articleID):
+		return (articleID >> 3) < len(self.bitmap) and bool(self.bitmap[articleID >> 3] & (1 << (articleID & 7)))
+
+	def add(self, articleID):
+
+		if (articleID >> 3) >= len(self.bitmap):
+			# Grow at least twice, so a growing range of IDs does not copy the bitmap every time
+			self.bitmap.extend(bytearray(max((articleID >> 3) + 1 - len(self.bitmap), len(self.bitmap))))
+
+		if articleID not in self:
+			self.bitmap[articleID >> 3] |= 1 << (articleID & 7)
+			self.n += 1
+
+	#---------------------------------------------------------------------
+	# Add the articles of an output file. An incomplete last line (the file is being written) is ignored
+	#---------------------------------------------------------------------
+	def addFile(self, path):
+
+		size = 0
+		with open(path, 'rb') as outputFile:
+			for line in outputFile:
+				if not line.endswith(b'\n'):
+					break
+				self.add(int(line.split(b'\t')[0]))
+				size += len(line)
+
+		self.coveredFiles[os.path.relpath(path, pathForOutputFiles)] = size
+
+	#---------------------------------------------------------------------
+	# Save the bitmap (<path>.bitmap) and the covered files (<path>.json). 
+	# Files are replaced atomically and the covered files are saved last
+	#---------------------------------------------------------------------
+	def save(self):
+
+		with open(self.path + '.bitmap.tmp', 'wb') as bitmapFile:
+			bitmapFile.write(self.bitmap)
+		os.replace(self.path + '.bitmap.tmp', self.path + '.bitmap')
+
+		with open(self.path + '.json.tmp', 'w') as coveredFilesFile:
+			json.dump(self.coveredFiles, coveredFilesFile)
+		os.replace(self.path + '.json.tmp', self.path + '.json')
+
+		self.lastSave = time.time()
+
+#---------------------------------------------------------------------
+# Return the index of wikipedia articles (by IDs) that have already been analized. 
+# The saved index is updated with the output files it does not cover
 #---------------------------------------------------------------------
 def getExistingEmbeddins():
 
 	print ("Getting list of existing embeddings.")
 
-	pathForOutputFiles = './outputs'
-	existingEmbeddinsIDs = [[] for i in range(hashSize)]
-	n = 0
+	existingEmbeddinsIDs = processedArticles(pathForProcessedArticlesIndex)
+	if os.path.exists(pathForProcessedArticlesIndex + '.json') and os.path.exists(pathForProcessedArticlesIndex + '.bitmap'):
+		with open(pathForProcessedArticlesIndex + '.bitmap', 'rb') as bitmapFile:
+			existingEmbeddinsIDs.bitmap = bytearray(bitmapFile.read())
+		with open(pathForProcessedArticlesIndex + '.json', 'r') as coveredFilesFile:
+			existingEmbeddinsIDs.coveredFiles = json.load(coveredFilesFile)
+		existingEmbeddinsIDs.n = sum(bin(byte).count('1') for byte in existingEmbeddinsIDs.bitmap)
+
+	nFiles = 0
 	for root, dirs, files in os.walk(pathForOutputFiles):
 		for fileName in files:
 
 			if not fileName.endswith('.txt'):
 				continue
 
-			embeddinsInFile = open(os.path.join(root, fileName), 'r').readlines()
-			for embedding in embeddinsInFile:
+			path = os.path.join(root, fileName)
+			if existingEmbeddinsIDs.coveredFiles.get(os.path.relpath(path, pathForOutputFiles)) == os.path.getsize(path):
+				continue
 
-				article_id = int(embedding.split('\t')[0])
-				n += 1
-				index = article_id % hashSize
-				existingEmbeddinsIDs[index].append(article_id)
+			existingEmbeddinsIDs.addFile(path)
+			nFiles += 1
 
-	print (str(n) + " article where already processed.")
+	existingEmbeddinsIDs.save()
+	print ("{} article where already processed ({} output files read).".format(existingEmbeddinsIDs.n, nFiles))
 
-	return existingEmbeddinsIDs			
+	return existingEmbeddinsIDs
 
 
 if __name__ == '__main__':
 
 	existingEmbeddinsIDs = getExistingEmbeddins()
 		
-	processes = []
-	for processID in range(nProcess): 
-
-		startIndex = processID * 600000
-		endIndex = (processID + 1) * 600000
-		processName = "Process_{}_{}".format(str(startIndex), str(endIndex))
-
-		process = mp.Process(target=getLocationEmbeddinsFromWikipedia, args=(processName, existingEmbeddinsIDs, startIndex, endIndex))
-		processes.append(process)
-
-	for process in processes:
-		process.start()
-
-	for process in processes:
-		process.join()
+	nerObj = namedEntityRecognition.getSharedNer(profile=profileNER)
+	watchWorkers(existingEmbeddinsIDs)
 
 	print ("All done!!!")
 
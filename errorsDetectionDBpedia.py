@@ -2,12 +2,14 @@ import logging
 import json
 import numpy as np
 from prettytable import PrettyTable
-from copy import deepcopy
 import os
 import matplotlib.pyplot as plt
 from scipy.interpolate import griddata
 import sys
-import pickle
+import argparse
+from parameterSearch import runSearch
+from searchResults import resultSink, mergeResults, getMissingBlocks
+from errorsDetectionEngine import buildGoldIndex, extractAnnotationArrays, loadAnnotationTable, saveAnnotationTable, scoreThresholdSweep, getExamples, searchParameterGrid
 
 #------------------------------------------------------------------------------------
 # Global and configuration values
@@ -17,6 +19,7 @@ incorrectAnnotations = None
 incorrectAnnotationsAux = None
 correctAnnotationsAux = None
 correctAnnotations = None
+goldIndex = None # Hash index of the correct and incorrect annotations (see buildGoldIndex)
 temporalSignatures = None
 
 #---------------------------------------------------------------------
@@ -36,12 +39,31 @@ def loadDataset(datasetName):
 
 	return dataset
 
+#---------------------------------------------------------------------
+# Load the annotation table of a dataset (see errorsDetectionEngine.extractAnnotationArrays).
+# The table is compiled from the json file the first time and saved next to it, so the next runs 
+# do not need to load the json file. It is compiled again if the json file changes
+#---------------------------------------------------------------------
+def loadAnnotations(datasetName):
+
+	pathForDataset = os.path.join(pathForDBpediaAnnotatedDataset, datasetName)
+	annotations = loadAnnotationTable(pathForDataset)
+
+	if annotations is None:
+		logger.info("Compiling the annotation table for {}".format(datasetName))
+		dataset = loadDataset(datasetName)
+		computePerformance(dataset) # This is only usefull to create the list of correct and incorrect annotations
+		annotations = extractAnnotationArrays(dataset, goldIndex)
+		saveAnnotationTable(annotations, pathForDataset)
+
+	return annotations
+
 #---------------------------------------------------------------------
 # Return the accuracy of the disambiguation of the annotations made automatically
 # Uses the manual annotations as ground truth
 #---------------------------------------------------------------------
 def computePerformance(dataset):
-	global incorrectAnnotations, correctAnnotations, incorrectAnnotationsAux, correctAnnotationsAux
+	global incorrectAnnotations, correctAnnotations, incorrectAnnotationsAux, correctAnnotationsAux, goldIndex
 
 	disambiguationCorrect = 0
 	disambiguationIncorrect = 0
@@ -62,14 +84,12 @@ def computePerformance(dataset):
 		if not automaticAnnotations:
 			automaticAnnotations = []
 
-		# for each entity annotated manually
-		manuallyAnnotatedEntities = []
-		manuallyAnnotatedTerms = []
+		# for each entity annotated manually (the first annotation of a term is the one used)
+		manuallyAnnotatedEntities = {}
 		for item in manualAnnotations:
 			entityName = item['taIdentRef'].split('/')[-1]
 			surfaceForm = item['anchor'].replace(' ', '_').strip().lower()
-			manuallyAnnotatedEntities.append(entityName)
-			manuallyAnnotatedTerms.append(surfaceForm)
+			manuallyAnnotatedEntities.setdefault(surfaceForm, entityName)
 
 		# for each entity annotated automatically
 		automaticallyAnnotatedEntities = []
@@ -84,17 +104,16 @@ def computePerformance(dataset):
 			
 			term = automaticallyAnnotatedTerms[x]
 			
-			if term in manuallyAnnotatedTerms:
+			if term in manuallyAnnotatedEntities:
 				
-				index = manuallyAnnotatedTerms.index(term)
-				if automaticallyAnnotatedEntities[x] == manuallyAnnotatedEntities[index]:
+				if automaticallyAnnotatedEntities[x] == manuallyAnnotatedEntities[term]:
 					disambiguationCorrect += 1
 					if createList:
 						auxDic = {}
 						auxDic.update({"surfaceForm": term})
 						auxDic.update({"entityName": automaticallyAnnotatedEntities[x]})
 						auxDic.update({"sentence": document['sentence']})
-						correctAnnotationsAux.append(manuallyAnnotatedEntities[index])
+						correctAnnotationsAux.append(manuallyAnnotatedEntities[term])
 						correctAnnotations.append(auxDic)
 				else:
 					disambiguationIncorrect += 1
@@ -103,9 +122,12 @@ def computePerformance(dataset):
 						auxDic.update({"surfaceForm": term})
 						auxDic.update({"entityName": automaticallyAnnotatedEntities[x]})
 						auxDic.update({"sentence": document['sentence']})
-						incorrectAnnotationsAux.append(manuallyAnnotatedEntities[index])
+						incorrectAnnotationsAux.append(manuallyAnnotatedEntities[term])
 						incorrectAnnotations.append(auxDic)
 
+	if createList:
+		goldIndex = buildGoldIndex(correctAnnotations, correctAnnotationsAux, incorrectAnnotations, incorrectAnnotationsAux)
+
 	try:
 		accuracy = float(disambiguationCorrect) / float (disambiguationIncorrect + disambiguationCorrect)
 	except ZeroDivisionError:
@@ -114,143 +136,15 @@ def computePerformance(dataset):
 	return accuracy
 	
 
-#---------------------------------------------------------------------
-# Remove annotations made by dbpedia if fs is bellow a given threshold. 
-# Where:
-# fs = {(c * gama) + (alpha * t) + (beta * s))}/(gama + alpha + beta)
-# where t and s are temporal and spatial similarities between the annotated 
-# sentence and annotated entities. c is the confidence score of the annotation
-# provided by dbpedia spotlight
-# Alpha, beta and gama are paramether to be ajusted
-#---------------------------------------------------------------------
-def removeWrongAnnotations(threshold, dataset, alpha, beta, gama):
-
-	nAnnotations = 0 # Number of annotations made by dbpedia
-	idkRemovals = 0 # Number of times an annotation that I don't know if it correct or not is removed
-	correctRemovals = 0 # Number of times a correct annotation is correctly removed
-	incorrectRemovals = 0 # Number of times a correct annotation is removed by mistake
-	missingDetection = 0 # Number of times the method fails in indentify an error in dbpedia annotation
-	goodExamples = [] # If the annotation is incorrect and it is removed, save it. It is usefull to show that the technique works. 
-	badExamples = [] 
-
-	# Copy the values of original alpha and beta. 
-	# This is important because in some cases (in case of errors) we change these weights to zero for a specific document, 
-	# but we want to use the original values for the remaining documents in the dataset
-	alphaValue = alpha
-	betaValue = beta
-
-	# A copy of the dataset. We don't want to modify the original one because we gonna use it again in the next test 
-	# (with different threshold, alpha, beta and gama values)
-	newDataset = deepcopy(dataset) 
-
-
-	# For each document in the dataset... 
-	for x in range(len(newDataset)):
-		
-		document = newDataset[x]
-		documentYear = document['year']
-		documentDBpediaAnnotations = document['annotations_dbpedia']
-		
-		# If the document has no annotations, there is nothing to be done. Continue
-		if not documentDBpediaAnnotations:
-			continue
-
-		dbpediaAnnoationsCleaned = [] # This will store the annotations that have final score above the threshold 
-		# and, therefore, should not be removed. 
-
-		# For each entity annotated with DBpedia Spotlight, check if 
-		# the annotation make sense using temporal and spatial similarity and 
-		# the similarity score provided by dbpedia
-		for item in documentDBpediaAnnotations:
-			
-			alphaValue = alpha
-			betaValue = beta
-			nAnnotations += 1
-			
-			entityName = item['URI'].split('/')[-1]
-			similarityScore = item['similarityScore']
-			temporalSimilarity = item['temporalSimilarity']
-			surfaceForm = item['surfaceForm'].replace(' ', '_').strip().lower()
-
-			
-			# Check if the spatial similarity was computed for that annotation. 
-			# The spatial simiality will not be computed if the document has no mentions to any locations
-			# OR if no spatial signature was found for the annotated entity 
-			if 'spatialSimilarity' in item.keys():
-				spatialSimilarity = item['spatialSimilarity']
-			else:
-				spatialSimilarity = -1
-
-
-			# If either temporal similarity of spatial similarity, assign its weight to Zero
-			# (so the missing value does not impact the score)
-			if temporalSimilarity == -1:
-				alphaValue = 0.0
-			if spatialSimilarity == -1:
-				betaValue = 0.0
-
-			
-			# This dictionary is used to compare the annotation made by dbpedia with the annotation
-			# for the same entity that was made by the human annotator
-			auxDic = {}
-			auxDic.update({"surfaceForm": surfaceForm})
-			auxDic.update({"entityName": entityName})
-			auxDic.update({"sentence": document['sentence']})
-
-			# final score calculation
-			fs = ((alphaValue*temporalSimilarity) + (gama * similarityScore) + (betaValue*spatialSimilarity))/(gama + alpha + beta)
-			
-			# If the final score for the annotation is above the threshold, consider the annotation correct and keep it. 
-			if fs >= threshold:
-				dbpediaAnnoationsCleaned.append(item)
-
-				# If the final score is above the threshold but the annotation is correct, 
-				# it means that the technique fail to identify an error with a dbpedia annotations. 
-				# We want to keep track of how many times that happens
-				if auxDic in incorrectAnnotations:
-					missingDetection += 1
-
-			# If the final score for the annotation is bellow the threshold, it is considered an incorrect annotation. So do not keep it. 
-			else:
-
-				# If the annotation that we are not keeping is actually correct, it means that or method is removing correct annotations
-				# We want to keep track of how many times that happens to evaluate the method. 
-				if auxDic in correctAnnotations:
-					incorrectRemovals += 1
-					index = correctAnnotations.index(auxDic)
-					correctAnnotation = correctAnnotationsAux[index]
-					auxDic.update({"correctAnnotation":correctAnnotation})
-					auxDic.update({"temporalSimilarity":temporalSimilarity})
-					auxDic.update({"spatialSimilarity":spatialSimilarity})
-					auxDic.update({"similarityScore":similarityScore})
-					auxDic.update({"documentYear":documentYear})
-					badExamples.append(auxDic)
-
-				# If the annotation is in fact incorrec, the method succeeds in detecting it. 
-				# Besides keep tracking of how many times that happens, we save the sentence and the annotations, 
-				# so we can show that the method works. 
-				elif auxDic in incorrectAnnotations:
-					correctRemovals += 1
-					index = incorrectAnnotations.index(auxDic)
-					correctAnnotation = incorrectAnnotationsAux[index]
-					auxDic.update({"correctAnnotation":correctAnnotation})
-					auxDic.update({"temporalSimilarity":temporalSimilarity})
-					auxDic.update({"spatialSimilarity":spatialSimilarity})
-					auxDic.update({"similarityScore":similarityScore})
-					auxDic.update({"documentYear":documentYear})
-					goodExamples.append(auxDic)
-				else:
-					idkRemovals += 1
-
-		document['annotations_dbpedia'] = dbpediaAnnoationsCleaned
-		newDataset[x] = document
-
-	return newDataset, nAnnotations, idkRemovals, correctRemovals, incorrectRemovals, missingDetection, goodExamples, badExamples
-
 #---------------------------------------------------------------------
 # Run all tests for temporal and spatial similarity
+# With more than one worker, the grid is searched in parallel
+# A search strategy other than 'grid' (see parameterSearch.searchStrategies) searches the normalized 
+# weights with a budget of evaluations instead of the exhaustive grid (in a single process, without results file)
+# The grid search is saved to resultsName (see searchResults.resultSink). With resume, the blocks of 
+# the grid completed by a previous run are skipped. With shard = (i, n) only part of the grid is searched
 #---------------------------------------------------------------------
-def runTests(dataset):
+def runTests(annotations, workers=1, strategy='grid', budget=10000, resultsName='hn_10', resume=False, shard=None):
 
 	# Those ranges were defined empirically (by testing multiple options)
 	testThresholds = np.arange(0.01, 0.95, 0.01)
@@ -258,40 +152,38 @@ def runTests(dataset):
 	testBetas = np.arange(0.01, 0.95, 0.01)
 	testGamas = np.arange(0.01, 0.95, 0.01)
 
-	auxListAverage = []
-	nAnnotations = 0
-	printRow = [] 
-	for threshold in testThresholds:
-		for alpha in testAlphas:
-			for beta in testBetas:
-				for gama in testGamas:
-					newDataset, nAnnotations, idkRemovals, correctRemovals, incorrectRemovals, missingDetection, goodExamples, badExamples = removeWrongAnnotations(threshold, dataset, alpha, beta, gama)
-					accuracy = computePerformance(newDataset)
-					printRow.append(["{0:0.4f}".format(threshold), "{0:0.4f}".format(alpha), "{0:0.4f}".format(beta), "{0:0.4f}".format(gama), nAnnotations, correctRemovals, incorrectRemovals, missingDetection, "{0:0.8f}".format(accuracy)])
-					auxListAverage.append([threshold, alpha, beta, gama, nAnnotations, idkRemovals, correctRemovals, incorrectRemovals, missingDetection, goodExamples, badExamples, accuracy])
-
-	pickle.dump(auxListAverage, open('hn_10.pkl', "wb" ) )
-
-	print ("Using average beween temporal similarity and confidence score: \n")
-	t = PrettyTable(['Threshold', 'alpha', 'beta', 'gama', 'nAnnotations', 'correctRemovals', 'incorrectRemovals', 'missingDetection', 'Accuracy'])
-	for item in printRow:
-		t.add_row(item)
-	print (t)
-
-	accuracies = list(map(list, zip(*auxListAverage)))[-1]
-	thresholds = list(map(list, zip(*auxListAverage)))[0]
-	alphas = list(map(list, zip(*auxListAverage)))[1]
-	betas = list(map(list, zip(*auxListAverage)))[2]
-	gamas = list(map(list, zip(*auxListAverage)))[3]
-
-	# Get the highest possible alpha and beta that leads to the maximum accuracy
-	highestAccuracy = max(accuracies)
-	#indices = [i for i, x in enumerate(accuracies) if x == highestAccuracy]
-	x = accuracies.index(highestAccuracy)
-	bestAlpha = alphas[x]
-	bestBeta = betas[x]
-	bestGama = gamas[x]
-	bestThreshold = thresholds[x]
+	# The annotations are extracted once (see loadAnnotations) and all the configurations are scored with the vectorized engine
+	nAnnotations = len(annotations['confidence'])
+
+	if strategy != 'grid':
+		if workers > 1 or resume or shard is not None:
+			raise ValueError("Workers, resume and shard are only used by the grid search, not by the strategy %s." % strategy)
+		best = runSearch(annotations, testThresholds, strategy=strategy, budget=budget)
+
+	else:
+		# The counts of every configuration are streamed to hn_10.bin (see searchResults.loadResults)
+		# and only the top configurations are kept in memory. The examples are only derived for the best configuration (see below)
+		sink = resultSink(resultsName, testThresholds, testAlphas, testBetas, testGamas, nAnnotations, resume=resume, datasetHash=annotations.get('datasetHash'))
+		best = searchParameterGrid(annotations, testThresholds, testAlphas, testBetas, testGamas, workers=workers, sink=sink, shard=shard)
+		sink.close()
+
+		print ("Using average beween temporal similarity and confidence score (top %s configurations): \n" % sink.topK)
+		t = PrettyTable(['Threshold', 'alpha', 'beta', 'gama', 'nAnnotations', 'correctRemovals', 'incorrectRemovals', 'missingDetection', 'Accuracy'])
+		for record in sink.top:
+			threshold, alpha, beta, gama = sink.getConfiguration(record)
+			t.add_row(["{0:0.4f}".format(threshold), "{0:0.4f}".format(alpha), "{0:0.4f}".format(beta), "{0:0.4f}".format(gama), nAnnotations, record['correctRemovals'], record['incorrectRemovals'], record['missingDetection'], "{0:0.8f}".format(record['accuracy'])])
+		print (t)
+
+	# Nothing to report if no configuration was evaluated (e.g., a shard without blocks or a budget of 0)
+	if best is None:
+		print ("No configuration was evaluated (strategy: %s, budget: %s, shard: %s), so there is no best configuration to report." % (strategy, budget, "%s/%s" % shard if shard else None))
+		return
+
+	highestAccuracy = best['accuracy']
+	bestAlpha = best['alpha']
+	bestBeta = best['beta']
+	bestGama = best['gama']
+	bestThreshold = best['threshold']
 
 	print ("Max accuracy: %s" % highestAccuracy)
 	print ("Best alpha: %s" % bestAlpha)
@@ -299,27 +191,15 @@ def runTests(dataset):
 	print ("Best gama: %s" % bestGama)
 	print ("Best threshold: %s" % bestThreshold)
 
-	accuracies = []
-	thresholds = []
-	betas = []
-	alphas = []
-	correctRemovals = None
-	incorrectRemovals = None
-	idkRemovals = None
-	missingDetections = None
-	goodExamples = None
-	for item in auxListAverage:
-		if item[1] == bestAlpha and item[2] == bestBeta and item[3] == bestGama:
-			accuracies.append(item[-1])
-			thresholds.append(item[0])
-			if item[0] == bestThreshold:
-				goodExamples = item[-3]
-				badExamples = item[-2]
-				idkRemovals = item[5] 
-				correctRemovals = item[6]
-				incorrectRemovals = item[7]
-				missingDetections = item[8]
+	idkRemovals = best['idkRemovals']
+	correctRemovals = best['correctRemovals']
+	incorrectRemovals = best['incorrectRemovals']
+	missingDetections = best['missingDetection']
+	goodExamples, badExamples = getExamples(annotations, bestThreshold, bestAlpha, bestBeta, bestGama)
 
+	# Accuracy vs threshold for the best alpha, beta and gama (a single sweep over the thresholds)
+	thresholds = list(testThresholds)
+	accuracies = list(scoreThresholdSweep(annotations, testThresholds, [bestAlpha], [bestBeta], [bestGama])['accuracy'][0])
 
 	examplesFiles = open('goodExamples.txt', 'w')
 	for item in goodExamples:
@@ -347,7 +227,7 @@ def runTests(dataset):
 		examplesFiles.write('\n\n')
 	examplesFiles.close()
 
-	pMissingAnnotations = float(missingDetections)/float(len(incorrectAnnotations))
+	pMissingAnnotations = float(missingDetections)/float(annotations['accuracyIncorrect'].sum()) # Same as len(incorrectAnnotations)
 	pIncorrectRemovals = float(incorrectRemovals)/float(incorrectRemovals + correctRemovals + idkRemovals)*100.0
 	pCorrectRemovals = float(correctRemovals)/float(incorrectRemovals + correctRemovals + idkRemovals)*100.0
 	print ("Percentage of incorrect removals: %s" % pIncorrectRemovals)
@@ -369,9 +249,40 @@ if __name__ == '__main__':
 	# Change if you want to used another dataset
 	datasetFileName = 'nyt-random_dbpedia_annotated_010_with_temporal_spatial_similaties.json'
 	
+	parser = argparse.ArgumentParser(description='Detect errors in the annotations of DBpedia Spotlight using temporal and spatial similarities.')
+	parser.add_argument('-w', '--workers', help='Number of worker processes for the parameter search. Default: %(default)s.', type=int, default=1)
+	parser.add_argument('-s', '--strategy', help='Search strategy: grid or one of the strategies in parameterSearch.py. Default: %(default)s.', default='grid')
+	parser.add_argument('-b', '--budget', help='Number of (alpha, beta, gama) evaluations for strategies other than grid. Default: %(default)s.', type=int, default=10000)
+	parser.add_argument('-o', '--output', help='Name of the grid search results (without extension). Default: %(default)s.', default='hn_10')
+	parser.add_argument('-r', '--resume', help='Resume the grid search saved in --output, skipping the completed blocks.', action='store_true')
+	parser.add_argument('--shard', help='Only search part of the grid, e.g. 0/4 for the first of 4 partial runs.')
+	parser.add_argument('--merge', help='Merge the results of partial runs into --output before the report.', nargs='+')
+	parser.add_argument('--fill-missing', help='With --merge, search the blocks of the grid that are not in the merged runs.', action='store_true')
+	args = parser.parse_args()
+
+	# The other strategies run in a single process and do not save their results
+	if args.strategy != 'grid' and (args.workers > 1 or args.resume or args.shard or args.merge):
+		parser.error("--workers, --resume, --shard and --merge can only be used with --strategy grid")
+	if args.fill_missing and not args.merge:
+		parser.error("--fill-missing can only be used with --merge")
+
+	shard = None
+	if args.shard:
+		shard = tuple(int(value) for value in args.shard.split('/'))
+
+	# The report of merged runs is the resumed search of the merged results.
+	# Blocks missing in the merged runs are only searched with --fill-missing
+	if args.merge:
+		mergeResults(args.merge, args.output).close()
+		missingBlocks = getMissingBlocks(args.output)
+		if missingBlocks:
+			print ("%s blocks of the grid are not in the merged runs: %s" % (len(missingBlocks), ", ".join("%s-%s" % block for block in missingBlocks[:10]) + (", ..." if len(missingBlocks) > 10 else "")))
+			if not args.fill_missing:
+				sys.exit("Run the missing shards and merge them too, or use --fill-missing to search the missing blocks.")
+		args.resume = True
+
 	print ("Tests for file " + datasetFileName)
-	dataset = loadDataset(datasetFileName)
-	computePerformance(dataset) # This is only usefull to create the list of correct and incorrect annotations
-	runTests(dataset)
+	annotations = loadAnnotations(datasetFileName)
+	runTests(annotations, args.workers, args.strategy, args.budget, args.output, args.resume, shard)
 
 	
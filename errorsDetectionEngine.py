@@ -0,0 +1,531 @@
+#--------------------------------------------------------------------------------------------------------------------
+# Description: This script contains the evaluation engine used by 'errorsDetectionDBpedia.py'.
+# The annotations of a dataset are extracted once into flat numpy arrays, so whole blocks of
+# (threshold, alpha, beta, gama) configurations can be scored at once without copying the dataset.
+#--------------------------------------------------------------------------------------------------------------------
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import numpy as np
+from searchResults import getAccuracy, getResultRecords
+
+#---------------------------------------------------------------------
+# Configure log information
+#---------------------------------------------------------------------
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#---------------------------------------------------------------------
+# Build a hash index of the ground truth, keyed on (surfaceForm, entityName, sentence).
+# For each key it stores the entity linked by the human annotator. Only the first occurrence
+# of a key is kept, which is the one returned by list.index
+#---------------------------------------------------------------------
+def buildGoldIndex(correctAnnotations, correctAnnotationsAux, incorrectAnnotations, incorrectAnnotationsAux):
+
+	goldIndex = {'correct': {}, 'incorrect': {}}
+	for x in range(len(correctAnnotations)):
+		goldIndex['correct'].setdefault(getAnnotationKey(correctAnnotations[x]), correctAnnotationsAux[x])
+	for x in range(len(incorrectAnnotations)):
+		goldIndex['incorrect'].setdefault(getAnnotationKey(incorrectAnnotations[x]), incorrectAnnotationsAux[x])
+
+	return goldIndex
+
+#---------------------------------------------------------------------
+# Key of an annotation in the gold index
+#---------------------------------------------------------------------
+def getAnnotationKey(auxDic):
+	return (auxDic['surfaceForm'], auxDic['entityName'], auxDic['sentence'])
+
+#---------------------------------------------------------------------
+# Return the label ('correct', 'incorrect' or None if unknown) and the entity linked by the human
+# annotator for an annotation. An annotation in both lists is considered correct
+#---------------------------------------------------------------------
+def lookupGoldAnnotation(goldIndex, key):
+
+	if key in goldIndex['correct']:
+		return 'correct', goldIndex['correct'][key]
+	if key in goldIndex['incorrect']:
+		return 'incorrect', goldIndex['incorrect'][key]
+
+	return None, None
+
+#---------------------------------------------------------------------
+# Types of the arrays of the annotation table (see extractAnnotationArrays)
+#---------------------------------------------------------------------
+arrayTypes = {
+	'confidence': np.float64,
+	'temporalSimilarity': np.float64,
+	'spatialSimilarity': np.float64,
+	'confidenceIsInteger': bool,
+	'temporalIsInteger': bool,
+	'spatialIsInteger': bool,
+	'inCorrect': bool,
+	'inIncorrect': bool,
+	'accuracyCorrect': bool,
+	'accuracyIncorrect': bool,
+	'entityIds': np.int32,
+	'goldEntityIds': np.int32,
+	'surfaceFormIds': np.int32,
+	'sentenceIds': np.int32,
+	'years': np.int32,
+}
+
+#---------------------------------------------------------------------
+# Extract, for each annotation made by dbpedia, the values used by the fusion score and its labels.
+# The labels reproduce exactly the checks done by 'computePerformance':
+# inCorrect/inIncorrect: the annotation is in the list of correct/incorrect annotations (ground truth)
+# accuracyCorrect/accuracyIncorrect: how the annotation counts for the accuracy of its own document
+# Entities, surface forms and sentences are interned (the arrays store ids of the vocabularies), so the
+# examples can be created without the dataset. The *IsInteger arrays keep the type of the similarities
+# in the json file, so the examples print them exactly as before (e.g., -1 and not -1.0)
+#---------------------------------------------------------------------
+def extractAnnotationArrays(dataset, goldIndex):
+
+	vocabularies = {'entities': {}, 'surfaceForms': {}, 'sentences': {}}
+	arrays = {}
+	for name in arrayTypes:
+		arrays[name] = []
+
+	for x in range(len(dataset)):
+
+		document = dataset[x]
+		documentDBpediaAnnotations = document['annotations_dbpedia']
+		if not documentDBpediaAnnotations:
+			continue
+
+		# First manual annotation for each surface form in the document
+		manualAnnotations = {}
+		for item in document['annotations']:
+			surfaceForm = item['anchor'].replace(' ', '_').strip().lower()
+			manualAnnotations.setdefault(surfaceForm, item['taIdentRef'].split('/')[-1])
+
+		for item in documentDBpediaAnnotations:
+
+			entityName = item['URI'].split('/')[-1]
+			surfaceForm = item['surfaceForm'].replace(' ', '_').strip().lower()
+			key = (surfaceForm, entityName, document['sentence'])
+			spatialSimilarity = item.get('spatialSimilarity', -1)
+
+			arrays['confidence'].append(item['similarityScore'])
+			arrays['temporalSimilarity'].append(item['temporalSimilarity'])
+			arrays['spatialSimilarity'].append(spatialSimilarity)
+			arrays['confidenceIsInteger'].append(isinstance(item['similarityScore'], int))
+			arrays['temporalIsInteger'].append(isinstance(item['temporalSimilarity'], int))
+			arrays['spatialIsInteger'].append(isinstance(spatialSimilarity, int))
+
+			label, goldEntity = lookupGoldAnnotation(goldIndex, key)
+			arrays['inCorrect'].append(label == 'correct')
+			arrays['inIncorrect'].append(key in goldIndex['incorrect'])
+
+			arrays['accuracyCorrect'].append(surfaceForm in manualAnnotations and manualAnnotations[surfaceForm] == entityName)
+			arrays['accuracyIncorrect'].append(surfaceForm in manualAnnotations and manualAnnotations[surfaceForm] != entityName)
+
+			arrays['entityIds'].append(vocabularies['entities'].setdefault(entityName, len(vocabularies['entities'])))
+			arrays['surfaceFormIds'].append(vocabularies['surfaceForms'].setdefault(surfaceForm, len(vocabularies['surfaceForms'])))
+			arrays['sentenceIds'].append(vocabularies['sentences'].setdefault(document['sentence'], len(vocabularies['sentences'])))
+			if goldEntity is None:
+				arrays['goldEntityIds'].append(-1)
+			else:
+				arrays['goldEntityIds'].append(vocabularies['entities'].setdefault(goldEntity, len(vocabularies['entities'])))
+			arrays['years'].append(document['year'])
+
+	annotations = {}
+	for name in arrayTypes:
+		annotations[name] = np.array(arrays[name], dtype=arrayTypes[name])
+	for name in vocabularies:
+		# Python dictionaries keep the insertion order, so the position of a word is its id
+		annotations[name] = list(vocabularies[name])
+
+	logger.info("{} annotations extracted from the dataset".format(len(annotations['confidence'])))
+
+	return annotations
+
+#---------------------------------------------------------------------
+# The annotation table of a dataset is saved in the folder <dataset>.table, next to the json file:
+# one .npy file per array (loaded memory-mapped) and metadata.json with the vocabularies and the
+# modification time, size and hash of the json file it was compiled from.
+# The hash is also returned in annotations['datasetHash'], so the results of a search can be checked against the dataset
+#---------------------------------------------------------------------
+def getAnnotationTablePath(pathForDataset):
+	return pathForDataset + '.table'
+
+#---------------------------------------------------------------------
+# Return the sha1 of a file
+#---------------------------------------------------------------------
+def getFileHash(pathForFile):
+
+	sha1 = hashlib.sha1()
+	with open(pathForFile, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			sha1.update(chunk)
+
+	return sha1.hexdigest()
+
+#---------------------------------------------------------------------
+# Save the annotation table of the dataset in pathForDataset
+#---------------------------------------------------------------------
+def saveAnnotationTable(annotations, pathForDataset):
+
+	pathForTable = getAnnotationTablePath(pathForDataset)
+	pathForMetadata = os.path.join(pathForTable, 'metadata.json')
+	if not os.path.exists(pathForTable):
+		os.makedirs(pathForTable)
+
+	# The metadata is written last, so a table without it is never used
+	if os.path.exists(pathForMetadata):
+		os.remove(pathForMetadata)
+
+	for name in arrayTypes:
+		np.save(os.path.join(pathForTable, name + '.npy'), annotations[name])
+
+	metadata = {}
+	metadata['source'] = {'mtime': os.path.getmtime(pathForDataset), 'size': os.path.getsize(pathForDataset), 'sha1': getFileHash(pathForDataset)}
+	annotations['datasetHash'] = metadata['source']['sha1']
+	for name in ['entities', 'surfaceForms', 'sentences']:
+		metadata[name] = annotations[name]
+	with open(pathForMetadata, 'w') as metadataFile:
+		json.dump(metadata, metadataFile)
+
+	logger.info("Annotation table saved to {}".format(pathForTable))
+
+#---------------------------------------------------------------------
+# Load the annotation table of the dataset in pathForDataset. Returns None if there is no table
+# or if the json file changed since the table was compiled (same modification time and size, or same hash)
+#---------------------------------------------------------------------
+def loadAnnotationTable(pathForDataset):
+
+	pathForTable = getAnnotationTablePath(pathForDataset)
+	pathForMetadata = os.path.join(pathForTable, 'metadata.json')
+	if not os.path.exists(pathForMetadata):
+		return None
+
+	with open(pathForMetadata, 'r') as metadataFile:
+		metadata = json.load(metadataFile)
+
+	source = metadata['source']
+	if source['mtime'] != os.path.getmtime(pathForDataset) or source['size'] != os.path.getsize(pathForDataset):
+		if source['size'] != os.path.getsize(pathForDataset) or source['sha1'] != getFileHash(pathForDataset):
+			logger.info("Annotation table {} is out of date".format(pathForTable))
+			return None
+
+		# Only the modification time changed
+		source['mtime'] = os.path.getmtime(pathForDataset)
+		with open(pathForMetadata, 'w') as metadataFile:
+			json.dump(metadata, metadataFile)
+
+	annotations = {}
+	for name in arrayTypes:
+		annotations[name] = np.load(os.path.join(pathForTable, name + '.npy'), mmap_mode='r')
+	for name in ['entities', 'surfaceForms', 'sentences']:
+		annotations[name] = metadata[name]
+	annotations['datasetHash'] = source['sha1']
+
+	logger.info("{} annotations loaded from {}".format(len(annotations['confidence']), pathForTable))
+
+	return annotations
+
+#---------------------------------------------------------------------
+# Return a value of the annotation table as it was in the json file
+#---------------------------------------------------------------------
+def getRawValue(value, isInteger):
+	if isInteger:
+		return int(value)
+	return float(value)
+
+#---------------------------------------------------------------------
+# Return a matrix with the final score (fs) of every annotation (columns) for every configuration (rows).
+# Alphas, betas and gamas are 1-D arrays with one value per configuration:
+# fs = {(c * gama) + (alpha * t) + (beta * s))}/(gama + alpha + beta)
+# where t and s are the temporal and spatial similarities and c the confidence score of dbpedia spotlight.
+# An annotation is removed if fs is bellow the threshold (or is not a number)
+#---------------------------------------------------------------------
+def computeFusedScores(annotations, alphas, betas, gamas):
+
+	alphas = np.asarray(alphas, dtype=np.float64)[:, None]
+	betas = np.asarray(betas, dtype=np.float64)[:, None]
+	gamas = np.asarray(gamas, dtype=np.float64)[:, None]
+
+	temporalSimilarity = annotations['temporalSimilarity']
+	spatialSimilarity = annotations['spatialSimilarity']
+
+	# If either temporal similarity of spatial similarity is missing, its weight is Zero (but not in the denominator)
+	alphaValues = np.where(temporalSimilarity == -1, 0.0, alphas)
+	betaValues = np.where(spatialSimilarity == -1, 0.0, betas)
+
+	fs = ((alphaValues*temporalSimilarity) + (gamas*annotations['confidence']) + (betaValues*spatialSimilarity))/(gamas + alphas + betas)
+
+	return fs
+
+#---------------------------------------------------------------------
+# Label masks used to count removals and accuracy with a single matrix product
+#---------------------------------------------------------------------
+def getLabelMasks(annotations):
+
+	inCorrect = annotations['inCorrect']
+	inIncorrect = annotations['inIncorrect']
+
+	masks = np.stack([inIncorrect, # missing detections (when kept)
+		inCorrect, # incorrect removals (when removed)
+		inIncorrect & ~inCorrect, # correct removals (when removed)
+		~inIncorrect & ~inCorrect, # removals of annotations that we don't know if are correct or not
+		annotations['accuracyCorrect'],
+		annotations['accuracyIncorrect']], axis=1).astype(np.float64)
+
+	return masks
+
+#---------------------------------------------------------------------
+# Compute the removals and the accuracy (as in 'computePerformance') from the number of kept
+# annotations of each label (one row per configuration)
+#---------------------------------------------------------------------
+def countsToMetrics(keptCounts, totals):
+
+	keptCounts = np.rint(keptCounts).astype(np.int64)
+	totals = np.rint(totals).astype(np.int64)
+
+	results = {}
+	results['missingDetection'] = keptCounts[:, 0]
+	results['incorrectRemovals'] = totals[1] - keptCounts[:, 1]
+	results['correctRemovals'] = totals[2] - keptCounts[:, 2]
+	results['idkRemovals'] = totals[3] - keptCounts[:, 3]
+
+	results['disambiguationCorrect'] = keptCounts[:, 4]
+	results['disambiguationTotal'] = keptCounts[:, 4] + keptCounts[:, 5]
+	results['accuracy'] = getAccuracy(results['disambiguationCorrect'], results['disambiguationTotal'])
+
+	return results
+
+#---------------------------------------------------------------------
+# Score a block of configurations. Thresholds, alphas, betas and gamas are 1-D arrays
+# with one value per configuration. Returns a dictionary of arrays (one value per configuration)
+# with accuracy, correctRemovals, incorrectRemovals, missingDetection and idkRemovals
+# It scores each configuration directly and is the reference for the optimized search
+# (scoreThresholdSweep and searchParameterGrid, see tests/test_errorsDetectionEngine.py)
+#---------------------------------------------------------------------
+def scoreConfigurations(annotations, thresholds, alphas, betas, gamas, masks=None):
+
+	if masks is None:
+		masks = getLabelMasks(annotations)
+
+	fs = computeFusedScores(annotations, alphas, betas, gamas)
+	kept = (fs >= np.asarray(thresholds, dtype=np.float64)[:, None]).astype(np.float64)
+
+	return countsToMetrics(kept.dot(masks), masks.sum(axis=0))
+
+#---------------------------------------------------------------------
+# Split the flattened grid of configurations in blocks of at most blockSize configurations
+#---------------------------------------------------------------------
+def iterateGridBlocks(gridShape, blockSize):
+
+	nConfigurations = int(np.prod(gridShape))
+	for start in range(0, nConfigurations, blockSize):
+		yield start, min(start + blockSize, nConfigurations)
+
+#---------------------------------------------------------------------
+# Return the (threshold, alpha, beta, gama) values for the configurations [start, stop) of the grid.
+# The grid is flattened in the same order as the nested loops of 'runTests' (threshold outermost, gama innermost)
+#---------------------------------------------------------------------
+def getGridConfigurations(thresholds, alphas, betas, gamas, start, stop):
+
+	gridShape = (len(thresholds), len(alphas), len(betas), len(gamas))
+	t, a, b, g = np.unravel_index(np.arange(start, stop), gridShape)
+
+	return np.asarray(thresholds)[t], np.asarray(alphas)[a], np.asarray(betas)[b], np.asarray(gamas)[g]
+
+#---------------------------------------------------------------------
+# Score every threshold for each (alpha, beta, gama) configuration in a single pass.
+# The final score does not depend on the threshold, so it is computed once, sorted, and the
+# cumulative number of annotations of each label gives the removals at every threshold: O(n log n).
+# Annotations whose final score is not a number are sorted first, as they are removed at every threshold.
+# Alphas, betas and gamas are 1-D arrays with one value per configuration. Returns a dictionary
+# of arrays with shape (number of configurations, number of thresholds)
+#---------------------------------------------------------------------
+def scoreThresholdSweep(annotations, thresholds, alphas, betas, gamas, masks=None):
+
+	if masks is None:
+		masks = getLabelMasks(annotations)
+
+	thresholds = np.asarray(thresholds, dtype=np.float64)
+	fs = computeFusedScores(annotations, alphas, betas, gamas)
+	totals = masks.sum(axis=0)
+
+	keptCounts = np.empty((len(fs), len(thresholds), masks.shape[1]), dtype=np.float64)
+	for x in range(len(fs)):
+		isNaN = np.isnan(fs[x])
+		nNaN = int(isNaN.sum())
+		# NaN scores first, then the other scores in increasing order
+		order = np.lexsort((fs[x], ~isNaN))
+		# Number of annotations of each label among the k annotations with the lowest final scores
+		removedCumulative = np.vstack([np.zeros((1, masks.shape[1])), np.cumsum(masks[order], axis=0)])
+		# Annotations with fs < threshold (or with a NaN fs) are removed
+		nRemoved = nNaN + np.searchsorted(fs[x][order[nNaN:]], thresholds, side='left')
+		keptCounts[x] = totals - removedCumulative[nRemoved]
+
+	results = countsToMetrics(keptCounts.reshape(-1, masks.shape[1]), totals)
+	for name in results:
+		results[name] = results[name].reshape(len(fs), len(thresholds))
+
+	return results
+
+#---------------------------------------------------------------------
+# Return the good (incorrect annotations removed) and bad (correct annotations removed) examples for one configuration.
+# The values are read from the annotation table (see extractAnnotationArrays)
+#---------------------------------------------------------------------
+def getExamples(annotations, threshold, alpha, beta, gama):
+
+	goodExamples = []
+	badExamples = []
+
+	fs = computeFusedScores(annotations, [alpha], [beta], [gama])[0]
+	for x in np.flatnonzero(~(fs >= threshold)):
+
+		if not (annotations['inCorrect'][x] or annotations['inIncorrect'][x]):
+			continue
+
+		auxDic = {}
+		auxDic.update({"surfaceForm": annotations['surfaceForms'][annotations['surfaceFormIds'][x]]})
+		auxDic.update({"entityName": annotations['entities'][annotations['entityIds'][x]]})
+		auxDic.update({"sentence": annotations['sentences'][annotations['sentenceIds'][x]]})
+		auxDic.update({"correctAnnotation": annotations['entities'][annotations['goldEntityIds'][x]]})
+		auxDic.update({"temporalSimilarity": getRawValue(annotations['temporalSimilarity'][x], annotations['temporalIsInteger'][x])})
+		auxDic.update({"spatialSimilarity": getRawValue(annotations['spatialSimilarity'][x], annotations['spatialIsInteger'][x])})
+		auxDic.update({"similarityScore": getRawValue(annotations['confidence'][x], annotations['confidenceIsInteger'][x])})
+		auxDic.update({"documentYear": int(annotations['years'][x])})
+
+		if annotations['inCorrect'][x]:
+			badExamples.append(auxDic)
+		else:
+			goodExamples.append(auxDic)
+
+	return goodExamples, badExamples
+
+#---------------------------------------------------------------------
+# Return the best configuration of a block of results: highest accuracy and, in case of a tie,
+# the first configuration in the order of the nested loops of 'runTests' (same as list.index(max))
+#---------------------------------------------------------------------
+def getBestInBlock(blockResults, flatIndices, thresholds, alphas, betas, gamas):
+
+	accuracy = blockResults['accuracy'].ravel()
+	flatIndices = flatIndices.ravel()
+	candidates = np.flatnonzero(accuracy == accuracy.max())
+	x = candidates[np.argmin(flatIndices[candidates])]
+
+	threshold, alpha, beta, gama = [values[0] for values in getGridConfigurations(thresholds, alphas, betas, gamas, flatIndices[x], flatIndices[x] + 1)]
+
+	best = {}
+	best['index'] = int(flatIndices[x])
+	best['threshold'] = threshold
+	best['alpha'] = alpha
+	best['beta'] = beta
+	best['gama'] = gama
+	for name in ['accuracy', 'correctRemovals', 'incorrectRemovals', 'missingDetection', 'idkRemovals']:
+		best[name] = blockResults[name].ravel()[x]
+
+	return best
+
+#---------------------------------------------------------------------
+# Keep the best of two configurations (see getBestInBlock)
+#---------------------------------------------------------------------
+def reduceBest(best, candidate):
+
+	if best is None:
+		return candidate
+	if candidate['accuracy'] > best['accuracy'] or (candidate['accuracy'] == best['accuracy'] and candidate['index'] < best['index']):
+		return candidate
+
+	return best
+
+#---------------------------------------------------------------------
+# State of a search worker. It is set before the workers are forked, so the read-only
+# annotation arrays are shared with them instead of being pickled for every task
+#---------------------------------------------------------------------
+searchWorkerState = None
+
+def initSearchWorker(state):
+	global searchWorkerState
+	searchWorkerState = state
+
+#---------------------------------------------------------------------
+# Score the (alpha, beta, gama) configurations [start, stop) for every threshold and return the block, its best
+# configuration and, if the results are saved, the records of all configurations (see searchResults)
+#---------------------------------------------------------------------
+def searchWeightBlock(block):
+
+	start, stop = block
+	state = searchWorkerState
+	thresholds, alphas, betas, gamas = state['thresholds'], state['alphas'], state['betas'], state['gamas']
+	weightsShape = (len(alphas), len(betas), len(gamas))
+
+	a, b, g = np.unravel_index(np.arange(start, stop), weightsShape)
+	blockResults = scoreThresholdSweep(state['annotations'], thresholds, alphas[a], betas[b], gamas[g], state['masks'])
+
+	# Position of each (weights, threshold) result in the flattened grid
+	flatIndices = np.arange(len(thresholds))[None, :] * int(np.prod(weightsShape)) + np.arange(start, stop)[:, None]
+
+	records = None
+	if state['resultDtype'] is not None:
+		records = getResultRecords(blockResults, state['resultDtype'])
+
+	return block, getBestInBlock(blockResults, flatIndices, thresholds, alphas, betas, gamas), records
+
+#---------------------------------------------------------------------
+# Search the grid thresholds x alphas x betas x gamas using a pool of workers processes.
+# The (alpha, beta, gama) configurations are split in blocks of blockSize, each worker scores all
+# the thresholds of a block and returns only its best configuration, which are then reduced to the best one.
+# If a sink is given (see searchResults.resultSink), the metrics of every configuration are streamed to it
+# and the blocks already completed in the sink (from a previous run) are skipped.
+# With shard = (i, n), only the blocks i, i+n, i+2n, ... are searched, so the grid can be split in n partial
+# runs (see searchResults.mergeResults).
+# Returns a dictionary with the best threshold, alpha, beta, gama and its metrics
+#---------------------------------------------------------------------
+def searchParameterGrid(annotations, thresholds, alphas, betas, gamas, workers=1, blockSize=256, sink=None, shard=None):
+
+	state = {}
+	state['annotations'] = {name: annotations[name] for name in ['confidence', 'temporalSimilarity', 'spatialSimilarity']}
+	state['masks'] = getLabelMasks(annotations)
+	state['thresholds'] = np.asarray(thresholds, dtype=np.float64)
+	state['alphas'] = np.asarray(alphas, dtype=np.float64)
+	state['betas'] = np.asarray(betas, dtype=np.float64)
+	state['gamas'] = np.asarray(gamas, dtype=np.float64)
+	state['resultDtype'] = sink.dtype if sink is not None else None
+
+	if sink is not None and sink.blockSize != blockSize:
+		raise ValueError("The block size of the search (%s) and of the results (%s) must be the same." % (blockSize, sink.blockSize))
+
+	blocks = list(iterateGridBlocks((len(alphas), len(betas), len(gamas)), blockSize))
+	if shard is not None:
+		blocks = blocks[shard[0]::shard[1]]
+	if sink is not None:
+		blocks = [block for block in blocks if not sink.isDone(block)]
+	nConfigurations = sum(stop - start for start, stop in blocks) * len(thresholds)
+	logger.info("Searching {} configurations in {} blocks with {} workers".format(nConfigurations, len(blocks), workers))
+
+	best = None
+	if workers > 1:
+		# With fork the workers inherit the state, otherwise it is pickled once per worker
+		if 'fork' in multiprocessing.get_all_start_methods():
+			context = multiprocessing.get_context('fork')
+		else:
+			context = multiprocessing.get_context()
+		pool = context.Pool(workers, initializer=initSearchWorker, initargs=(state,))
+		try:
+			for block, blockBest, records in pool.imap_unordered(searchWeightBlock, blocks):
+				best = reduceBest(best, blockBest)
+				if sink is not None:
+					sink.add(records, block)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		initSearchWorker(state)
+		for block, blockBest, records in map(searchWeightBlock, blocks):
+			best = reduceBest(best, blockBest)
+			if sink is not None:
+				sink.add(records, block)
+
+	# The sink also has the results of the previous runs
+	if sink is not None:
+		best = sink.getBest()
+
+	return best
@@ -0,0 +1,148 @@
+#--------------------------------------------------------------------------------------------------------------------
+# Description: This script contains an on-disk cache for the locations found by named entity recognition
+# (see namedEntityRecognition.py). The cache is content-addressed: the key is a hash of the text (a cleaned sentence
+# or the sections of an article), so repeated sentences and articles that did not change since the last run
+# do not need to be analized again. It is a sqlite database, so it can be shared by several processes.
+# The number of entries is bounded: the least recently used entries are evicted.
+# The locations depend on the language model and on how the text is cleaned, so the cache records their version
+# and is cleared when it is opened with another one.
+#--------------------------------------------------------------------------------------------------------------------
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+#---------------------------------------------------------------------
+# Configure log information
+#---------------------------------------------------------------------
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#---------------------------------------------------------------------
+# Return the key of a text in the cache. The kind ('sentence' or 'article') is part of the key
+#---------------------------------------------------------------------
+def getKey(kind, text):
+	return hashlib.sha1((kind + '\n' + text).encode('utf-8')).digest()
+
+#---------------------------------------------------------------------
+# Return a report with the hit rate of each kind, given the hits and misses ({kind: count})
+#---------------------------------------------------------------------
+def getHitRateReport(hits, misses):
+
+	report = []
+	for kind in sorted(set(hits) | set(misses)):
+		nLookups = hits.get(kind, 0) + misses.get(kind, 0)
+		hitRate = float(hits.get(kind, 0)) / nLookups if nLookups else 0.0
+		report.append("{}: {} hits / {} lookups ({:.2%})".format(kind, hits.get(kind, 0), nLookups, hitRate))
+
+	return "Cache " + ("; ".join(report) if report else "not used")
+
+#---------------------------------------------------------------------
+# Class to store the list of locations of a text. Hits and misses are counted by kind. 
+# version describes how the locations were found (None to not check it)
+#---------------------------------------------------------------------
+class locationCache:
+
+	def __init__(self, path, maxEntries=20000000, evictEvery=100000, version=None):
+		self.path = path
+		self.version = version
+		self.maxEntries = maxEntries
+		self.evictEvery = evictEvery
+		self.nWrites = 0
+		self.hits = {}
+		self.misses = {}
+
+		self.connection = sqlite3.connect(path, timeout=600)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+		self.connection.execute('CREATE TABLE IF NOT EXISTS locations (key BLOB PRIMARY KEY, locations TEXT, lastUsed REAL)')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS locationsByLastUsed ON locations (lastUsed)')
+		self.connection.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)')
+		self.connection.commit()
+
+		if version is not None:
+			self.checkVersion()
+
+	#---------------------------------------------------------------------
+	# Remove all the entries if the cache was created with another version
+	#---------------------------------------------------------------------
+	def checkVersion(self):
+
+		# In one transaction, so only the first process that opens the cache clears it
+		with self.connection:
+			self.connection.execute('BEGIN IMMEDIATE')
+			row = self.connection.execute("SELECT value FROM metadata WHERE name = 'version'").fetchone()
+			nRemoved = 0
+			if row is None or row[0] != self.version:
+				nRemoved = self.connection.execute('DELETE FROM locations').rowcount
+				self.connection.execute("INSERT OR REPLACE INTO metadata VALUES ('version', ?)", (self.version,))
+
+		if nRemoved:
+			logger.info("{} entries removed from the cache {}: they were created with {} (now {})".format(nRemoved, self.path, row[0] if row else "an unknown version", self.version))
+
+	#---------------------------------------------------------------------
+	# Return {key: list of locations} for the keys in the cache. The entries found are marked as used
+	#---------------------------------------------------------------------
+	def get(self, kind, keys):
+
+		found = {}
+		keys = list(set(keys))
+		# sqlite limits the number of parameters of a query
+		for start in range(0, len(keys), 900):
+			chunk = keys[start:start + 900]
+			query = 'SELECT key, locations FROM locations WHERE key IN ({})'.format(','.join('?' * len(chunk)))
+			for key, locations in self.connection.execute(query, chunk):
+				found[bytes(key)] = json.loads(locations)
+
+		if found:
+			now = time.time()
+			with self.connection:
+				self.connection.executemany('UPDATE locations SET lastUsed = ? WHERE key = ?', [(now, key) for key in found])
+
+		self.hits[kind] = self.hits.get(kind, 0) + len(found)
+		self.misses[kind] = self.misses.get(kind, 0) + len(keys) - len(found)
+
+		return found
+
+	#---------------------------------------------------------------------
+	# Add {key: list of locations} to the cache
+	#---------------------------------------------------------------------
+	def put(self, items):
+
+		if not items:
+			return
+
+		now = time.time()
+		with self.connection:
+			self.connection.executemany('INSERT OR REPLACE INTO locations VALUES (?, ?, ?)', [(key, json.dumps(locations), now) for key, locations in items.items()])
+
+		self.nWrites += len(items)
+		if self.nWrites >= self.evictEvery:
+			self.evict()
+
+	#---------------------------------------------------------------------
+	# Remove the least recently used entries if the cache has more than maxEntries
+	#---------------------------------------------------------------------
+	def evict(self):
+
+		self.nWrites = 0
+		# Counting and deleting in the same transaction, so processes do not evict the same entries twice
+		with self.connection:
+			self.connection.execute('BEGIN IMMEDIATE')
+			nEntries = self.connection.execute('SELECT COUNT(*) FROM locations').fetchone()[0]
+			if nEntries > self.maxEntries:
+				self.connection.execute('DELETE FROM locations WHERE key IN (SELECT key FROM locations ORDER BY lastUsed LIMIT ?)', (nEntries - self.maxEntries,))
+
+		if nEntries > self.maxEntries:
+			logger.info("{} entries evicted from the cache {}".format(nEntries - self.maxEntries, self.path))
+
+	#---------------------------------------------------------------------
+	# Return a report with the hit rate of each kind
+	#---------------------------------------------------------------------
+	def getReport(self):
+		return getHitRateReport(self.hits, self.misses)
+
+	def close(self):
+		self.evict()
+		self.connection.close()
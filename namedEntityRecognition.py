@@ -1,13 +1,31 @@
+import gc
+import os
+import time
 import spacy
 
+#---------------------------------------------------------------------------
+# Language model shared by all the code of a process (see getSharedNer)
+#---------------------------------------------------------------------------
+sharedNer = {}
+
 #---------------------------------------------------------------------------
 # Class to perfom entity named recognition using spacy
 #---------------------------------------------------------------------------
 class ner:
 
-	def __init__(self, model='xx_ent_wiki_sm'):
+	#---------------------------------------------------------------------
+	# Only the components in 'components' are loaded (location extraction only needs the entity recognizer
+	# and, for some models, the token-to-vector layer it listens to). 
+	# If profile is True, the time spent by each component is measured (see getTimingReport)
+	#---------------------------------------------------------------------
+	def __init__(self, model='xx_ent_wiki_sm', components=('tok2vec', 'ner'), profile=False):
 		self.model = model
+		self.components = components
+		self.profile = profile
 		self.nlp = None
+		self.loadTime = None
+		self.componentTimes = {}
+		self.nSentences = 0
 
 		self.loadLanguageModel()
 
@@ -18,8 +36,23 @@ class ner:
 	def loadLanguageModel(self):
 
 		print ("Loading language model")
-		self.nlp = spacy.load(self.model, disable=['parser'])
-		print ("Language model loaded")
+		start = time.time()
+
+		# Components of the model that are not needed are not loaded
+		try:
+			modelPath = self.model if os.path.isdir(self.model) else spacy.util.get_package_path(self.model)
+			pipeline = spacy.util.get_model_meta(modelPath)['pipeline']
+			exclude = [name for name in pipeline if name not in self.components]
+		except Exception:
+			exclude = ['parser']
+
+		# spacy 2 can only disable components (spacy.load accepts any keyword, so exclude would be ignored)
+		if int(spacy.__version__.split('.')[0]) >= 3:
+			self.nlp = spacy.load(self.model, exclude=exclude)
+		else:
+			self.nlp = spacy.load(self.model, disable=exclude)
+		self.loadTime = time.time() - start
+		print ("Language model loaded in {:.2f} seconds. Components: {}".format(self.loadTime, ", ".join(self.nlp.pipe_names)))
 
 		return 
 
@@ -29,8 +62,93 @@ class ner:
 	#---------------------------------------------------------------------
 	def getListOfLocationInSentece(self, sentence):
 
+		if self.profile:
+			return next(self.getLocationsForSentences([sentence]))
+
 		doc = self.nlp(sentence)
 
+		return self.getListOfLocationInDoc(doc)
+
+	#---------------------------------------------------------------------
+	# Return the lists of locations mentioned in each sentence of an iterable, in the same order. 
+	# The sentences are processed in batches with nlp.pipe (and n_process processes), which is much faster 
+	# than one call per sentence 
+	# See https://spacy.io/usage/processing-pipelines#processing for library documentation
+	#---------------------------------------------------------------------
+	def getLocationsForSentences(self, sentences, batch_size=1000, n_process=1):
+
+		if self.profile:
+			docs = self.pipeWithTiming(sentences, batch_size)
+		elif n_process == 1:
+			docs = self.nlp.pipe(sentences, batch_size=batch_size)
+		else:
+			docs = self.nlp.pipe(sentences, batch_size=batch_size, n_process=n_process)
+
+		for doc in docs:
+			yield self.getListOfLocationInDoc(doc)
+
+	#---------------------------------------------------------------------
+	# Same as nlp.pipe, but the components are applied one after the other on each batch
+	# and the time spent by each of them (and by the tokenizer) is accumulated in componentTimes
+	#---------------------------------------------------------------------
+	def pipeWithTiming(self, sentences, batch_size=1000):
+
+		batch = []
+		for sentence in sentences:
+			batch.append(sentence)
+			if len(batch) == batch_size:
+				for doc in self.processBatchWithTiming(batch):
+					yield doc
+				batch = []
+
+		if batch:
+			for doc in self.processBatchWithTiming(batch):
+				yield doc
+
+	def processBatchWithTiming(self, batch):
+
+		start = time.time()
+		docs = [self.nlp.make_doc(sentence) for sentence in batch]
+		self.componentTimes['tokenizer'] = self.componentTimes.get('tokenizer', 0.0) + time.time() - start
+
+		for name, component in self.nlp.pipeline:
+			start = time.time()
+			if hasattr(component, 'pipe'):
+				docs = list(component.pipe(docs, batch_size=len(docs)))
+			else:
+				docs = [component(doc) for doc in docs]
+			self.componentTimes[name] = self.componentTimes.get(name, 0.0) + time.time() - start
+
+		self.nSentences += len(batch)
+
+		return docs
+
+	#---------------------------------------------------------------------
+	# Return a report with the load time and the time spent by each component (only if profile is True)
+	#---------------------------------------------------------------------
+	def getTimingReport(self):
+
+		report = "Language model {} loaded in {:.2f} seconds.".format(self.model, self.loadTime)
+		if self.nSentences:
+			report += " {} sentences analized:".format(self.nSentences)
+			for name, seconds in self.componentTimes.items():
+				report += " {} {:.2f} s ({:.3f} ms/sentence);".format(name, seconds, 1000.0 * seconds / self.nSentences)
+
+		return report
+
+	#---------------------------------------------------------------------
+	# Return the name and version of the language model and of spacy (the locations found depend on them)
+	#---------------------------------------------------------------------
+	def getVersion(self):
+
+		meta = self.nlp.meta
+		return "{}_{} {} (spacy {})".format(meta.get('lang'), meta.get('name'), meta.get('version'), spacy.__version__)
+
+	#---------------------------------------------------------------------
+	# Return a list of locations in a document processed by the language model
+	#---------------------------------------------------------------------
+	def getListOfLocationInDoc(self, doc):
+
 		listOfLocations = []
 		for ent in doc.ents:
 			if ent.label_ == 'LOC':
@@ -41,3 +159,17 @@ class ner:
 
 		return listOfLocations
 
+#---------------------------------------------------------------------------
+# Return the ner object of this process for a model, loading the model only once. 
+# Call it in the parent process before forking the workers: they inherit the loaded model 
+# (the memory is shared copy-on-write) instead of loading it again
+#---------------------------------------------------------------------------
+def getSharedNer(model='xx_ent_wiki_sm', profile=False):
+
+	if model not in sharedNer:
+		sharedNer[model] = ner(model, profile=profile)
+		# Objects of the model are not tracked by the garbage collector of the workers, so their pages are not copied
+		if hasattr(gc, 'freeze'):
+			gc.freeze()
+
+	return sharedNer[model]
@@ -0,0 +1,217 @@
+#--------------------------------------------------------------------------------------------------------------------
+# Description: This script contains adaptive search strategies for the fusion weights used by 'errorsDetectionDBpedia.py'.
+# The final score fs = {(c * gama) + (alpha * t) + (beta * s))}/(gama + alpha + beta) does not change if alpha, beta
+# and gama are scaled by the same factor, so the strategies search on the normalized weights (alpha + beta + gama = 1).
+# Every (alpha, beta, gama) configuration is scored for all thresholds at once (see scoreThresholdSweep).
+# Each strategy has a budget: the maximum number of (alpha, beta, gama) configurations to be evaluated.
+#--------------------------------------------------------------------------------------------------------------------
+import logging
+import math
+import numpy as np
+from errorsDetectionEngine import getLabelMasks, scoreThresholdSweep
+
+#---------------------------------------------------------------------
+# Configure log information
+#---------------------------------------------------------------------
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#---------------------------------------------------------------------
+# Class to evaluate (alpha, beta, gama) configurations within a budget.
+# It keeps track of the number of evaluations and of the best configuration found so far
+#---------------------------------------------------------------------
+class searchEvaluator:
+
+	def __init__(self, annotations, thresholds, budget):
+		self.annotations = {name: annotations[name] for name in ['confidence', 'temporalSimilarity', 'spatialSimilarity']}
+		self.masks = getLabelMasks(annotations)
+		self.thresholds = np.asarray(thresholds, dtype=np.float64)
+		self.budget = budget
+		self.nEvaluations = 0
+		self.best = None
+
+	#---------------------------------------------------------------------
+	# Number of evaluations that can still be done
+	#---------------------------------------------------------------------
+	def remaining(self):
+		return max(0, self.budget - self.nEvaluations)
+
+	#---------------------------------------------------------------------
+	# Return a subset of the annotations (used to evaluate configurations on part of the data)
+	#---------------------------------------------------------------------
+	def getSubset(self, indices):
+
+		subset = {name: values[indices] for name, values in self.annotations.items()}
+		subset['masks'] = self.masks[indices]
+
+		return subset
+
+	#---------------------------------------------------------------------
+	# Score the configurations (alphas, betas and gamas are 1-D arrays) for all thresholds and return,
+	# for each configuration, the highest accuracy and the threshold that gives it.
+	# If a subset is given, the configurations are only scored on the subset (see getSubset) and
+	# each evaluation costs the fraction of annotations in the subset. Only evaluations with all the annotations
+	# update the best configuration. Configurations beyond the budget are not evaluated (accuracy -inf)
+	#---------------------------------------------------------------------
+	def evaluate(self, alphas, betas, gamas, subset=None):
+
+		alphas = np.asarray(alphas, dtype=np.float64)
+		betas = np.asarray(betas, dtype=np.float64)
+		gamas = np.asarray(gamas, dtype=np.float64)
+
+		accuracies = np.full(len(alphas), -np.inf)
+		bestThresholds = np.full(len(alphas), np.nan)
+
+		if subset is None:
+			annotations, masks, cost = self.annotations, self.masks, 1.0
+		else:
+			annotations, masks = subset, subset['masks']
+			cost = float(len(masks)) / float(len(self.masks))
+
+		nConfigurations = min(len(alphas), int(self.remaining() / cost))
+		if nConfigurations == 0:
+			return accuracies, bestThresholds
+
+		results = scoreThresholdSweep(annotations, self.thresholds, alphas[:nConfigurations], betas[:nConfigurations], gamas[:nConfigurations], masks)
+		self.nEvaluations += int(math.ceil(nConfigurations * cost))
+
+		# First threshold with the highest accuracy for each configuration
+		bestColumns = np.argmax(results['accuracy'], axis=1)
+		rows = np.arange(nConfigurations)
+		accuracies[:nConfigurations] = results['accuracy'][rows, bestColumns]
+		bestThresholds[:nConfigurations] = self.thresholds[bestColumns]
+
+		if subset is None:
+			x = int(np.argmax(accuracies[:nConfigurations]))
+			if self.best is None or accuracies[x] > self.best['accuracy']:
+				best = {}
+				best['threshold'] = bestThresholds[x]
+				best['alpha'] = alphas[x]
+				best['beta'] = betas[x]
+				best['gama'] = gamas[x]
+				for name in ['accuracy', 'correctRemovals', 'incorrectRemovals', 'missingDetection', 'idkRemovals']:
+					best[name] = results[name][x, bestColumns[x]]
+				self.best = best
+
+		return accuracies, bestThresholds
+
+#---------------------------------------------------------------------
+# Return the points of a regular grid on the simplex alpha + beta + gama = 1 with all weights > 0.
+# The grid has step 1/divisions, which gives (divisions-1)*(divisions-2)/2 points
+#---------------------------------------------------------------------
+def getSimplexGrid(divisions):
+
+	i, j = np.meshgrid(np.arange(1, divisions), np.arange(1, divisions), indexing='ij')
+	i, j = i.ravel(), j.ravel()
+	valid = i + j < divisions
+	i, j = i[valid], j[valid]
+
+	alphas = i / float(divisions)
+	betas = j / float(divisions)
+	gamas = (divisions - i - j) / float(divisions)
+
+	return alphas, betas, gamas
+
+#---------------------------------------------------------------------
+# Exhaustive search on a regular grid of the normalized weights.
+# The grid is as fine as possible within the budget
+#---------------------------------------------------------------------
+def simplexSearch(evaluator, rng):
+
+	divisions = 3
+	while divisions * (divisions - 1) // 2 <= evaluator.remaining():
+		divisions += 1
+
+	logger.info("Simplex search with step {}".format(1.0 / divisions))
+	alphas, betas, gamas = getSimplexGrid(divisions)
+	evaluator.evaluate(alphas, betas, gamas)
+
+#---------------------------------------------------------------------
+# Start with a coarse grid of the normalized weights and refine it around the best configuration,
+# halving the step each time, until the budget is over
+#---------------------------------------------------------------------
+def coarseToFineSearch(evaluator, rng, divisions=10, radius=2):
+
+	alphas, betas, gamas = getSimplexGrid(divisions)
+	evaluator.evaluate(alphas, betas, gamas)
+
+	step = 1.0 / divisions
+	while evaluator.remaining() > 0 and evaluator.best is not None and step > 1e-6:
+
+		step = step / 2.0
+		offsets = np.arange(-radius, radius + 1) * step
+		alphas, betas = np.meshgrid(evaluator.best['alpha'] + offsets, evaluator.best['beta'] + offsets, indexing='ij')
+		alphas, betas = alphas.ravel(), betas.ravel()
+		gamas = 1.0 - alphas - betas
+
+		valid = (alphas > 0) & (betas > 0) & (gamas > 0)
+		logger.info("Refining with step {} around alpha={}, beta={}, gama={}".format(step, evaluator.best['alpha'], evaluator.best['beta'], evaluator.best['gama']))
+		evaluator.evaluate(alphas[valid], betas[valid], gamas[valid])
+
+#---------------------------------------------------------------------
+# Evaluate normalized weights sampled uniformly from the simplex until the budget is over
+#---------------------------------------------------------------------
+def randomSearch(evaluator, rng, batchSize=256):
+
+	while evaluator.remaining() > 0:
+		weights = rng.dirichlet([1.0, 1.0, 1.0], size=min(batchSize, evaluator.remaining()))
+		evaluator.evaluate(weights[:, 0], weights[:, 1], weights[:, 2])
+
+#---------------------------------------------------------------------
+# Successive halving: random normalized weights are first evaluated on a small random subset
+# of the annotations. After each round only the best 1/eta configurations are kept and the subset
+# grows eta times, so the last round evaluates the few remaining configurations on all annotations
+#---------------------------------------------------------------------
+def successiveHalvingSearch(evaluator, rng, eta=3, rounds=4):
+
+	nAnnotations = len(evaluator.masks)
+	# Each round costs about the same, one share of the budget is left as a margin for rounding
+	nConfigurations = max(1, int(evaluator.budget * eta ** (rounds - 1) / (rounds + 1)))
+	weights = rng.dirichlet([1.0, 1.0, 1.0], size=nConfigurations)
+	order = rng.permutation(nAnnotations)
+
+	for roundIndex in range(rounds):
+
+		fraction = float(eta) ** (roundIndex - rounds + 1)
+		isLastRound = roundIndex == rounds - 1 or len(weights) == 1
+		logger.info("Successive halving round {}: {} configurations on {:.2%} of the annotations".format(roundIndex, len(weights), fraction))
+
+		if isLastRound:
+			evaluator.evaluate(weights[:, 0], weights[:, 1], weights[:, 2])
+			break
+
+		subset = evaluator.getSubset(np.sort(order[:max(1, int(nAnnotations * fraction))]))
+		accuracies, _ = evaluator.evaluate(weights[:, 0], weights[:, 1], weights[:, 2], subset)
+
+		# Keep the best configurations (stable, so ties keep the sampling order)
+		nKeep = max(1, len(weights) // eta)
+		keep = np.sort(np.argsort(-accuracies, kind='stable')[:nKeep])
+		weights = weights[keep]
+
+#---------------------------------------------------------------------
+# Available search strategies. A strategy is a function (evaluator, rng) that
+# evaluates configurations with evaluator.evaluate until the budget is over
+#---------------------------------------------------------------------
+searchStrategies = {
+	'simplex': simplexSearch,
+	'coarseToFine': coarseToFineSearch,
+	'random': randomSearch,
+	'successiveHalving': successiveHalvingSearch,
+}
+
+#---------------------------------------------------------------------
+# Search the best threshold, alpha, beta and gama with one of the searchStrategies.
+# Returns a dictionary with the best configuration and its metrics (same as searchParameterGrid)
+#---------------------------------------------------------------------
+def runSearch(annotations, thresholds, strategy='coarseToFine', budget=10000, seed=0):
+
+	if strategy not in searchStrategies:
+		raise ValueError("Unknown search strategy %s. Available strategies: %s" % (strategy, ", ".join(sorted(searchStrategies))))
+
+	evaluator = searchEvaluator(annotations, thresholds, budget)
+	rng = np.random.RandomState(seed)
+	searchStrategies[strategy](evaluator, rng)
+
+	logger.info("Search {} finished after {} evaluations".format(strategy, evaluator.nEvaluations))
+
+	return evaluator.best
@@ -0,0 +1,323 @@
+#--------------------------------------------------------------------------------------------------------------------
+# Description: This script contains the result sink for the parameter search of 'errorsDetectionDBpedia.py'.
+# The counts of every (threshold, alpha, beta, gama) configuration are appended to a binary file with fixed size
+# records (<name>.bin), described by a small json file (<name>.json) with the grid values. The accuracy is not
+# stored, it is derived from the counts (see getAccuracy). Only the top-k configurations are kept in memory.
+#--------------------------------------------------------------------------------------------------------------------
+import json
+import logging
+import os
+import numpy as np
+
+#---------------------------------------------------------------------
+# Configure log information
+#---------------------------------------------------------------------
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#---------------------------------------------------------------------
+# Counts of a record. disambiguationCorrect and disambiguationTotal are the kept annotations used
+# for the accuracy (see getAccuracy)
+#---------------------------------------------------------------------
+countNames = ['correctRemovals', 'incorrectRemovals', 'missingDetection', 'idkRemovals', 'disambiguationCorrect', 'disambiguationTotal']
+
+#---------------------------------------------------------------------
+# Return the format of a record for a dataset of nAnnotations annotations (16 bytes if the counts fit in 16 bits).
+# The index is the position of the record in its block of configurations (see expandRecords),
+# so the grid values are not repeated in every record
+#---------------------------------------------------------------------
+def getResultDtype(nAnnotations):
+
+	countType = '<u2' if nAnnotations < 2 ** 16 else '<u4'
+
+	return np.dtype([('index', '<u4')] + [(name, countType) for name in countNames])
+
+#---------------------------------------------------------------------
+# Format of the records kept in memory: the index is the position of the configuration in the flattened grid
+# (threshold outermost, gama innermost) and the accuracy is computed
+#---------------------------------------------------------------------
+topDtype = np.dtype([('index', '<i8')] + [(name, '<i8') for name in countNames] + [('accuracy', '<f8')])
+
+#---------------------------------------------------------------------
+# Return the accuracy of the disambiguation (-1 if no annotation used for it is kept)
+#---------------------------------------------------------------------
+def getAccuracy(disambiguationCorrect, disambiguationTotal):
+
+	disambiguationCorrect = np.asarray(disambiguationCorrect)
+	disambiguationTotal = np.asarray(disambiguationTotal)
+	accuracy = np.full(disambiguationTotal.shape, -1.0)
+	valid = disambiguationTotal > 0
+	accuracy[valid] = disambiguationCorrect[valid].astype(np.float64) / disambiguationTotal[valid].astype(np.float64)
+
+	return accuracy
+
+#---------------------------------------------------------------------
+# Convert the results of a block of configurations (see errorsDetectionEngine.searchWeightBlock) to records.
+# The results have one row per (alpha, beta, gama) configuration and one column per threshold
+#---------------------------------------------------------------------
+def getResultRecords(blockResults, dtype):
+
+	records = np.empty(blockResults['accuracy'].size, dtype=dtype)
+	records['index'] = np.arange(len(records))
+	for name in countNames:
+		records[name] = blockResults[name].ravel()
+
+	return records
+
+#---------------------------------------------------------------------
+# Convert the records of the block (start, stop) of (alpha, beta, gama) configurations to records with
+# the position of the configuration in the flattened grid and the accuracy (see topDtype)
+#---------------------------------------------------------------------
+def expandRecords(records, block, nThresholds, nWeights):
+
+	expanded = np.empty(len(records), dtype=topDtype)
+	weights, thresholds = np.divmod(records['index'].astype(np.int64), nThresholds)
+	expanded['index'] = thresholds * nWeights + block[0] + weights
+	for name in countNames:
+		expanded[name] = records[name]
+	expanded['accuracy'] = getAccuracy(records['disambiguationCorrect'], records['disambiguationTotal'])
+
+	return expanded
+
+#---------------------------------------------------------------------
+# Sort records by accuracy (highest first) and, for the same accuracy, by position in the grid
+#---------------------------------------------------------------------
+def sortRecords(records):
+	return records[np.lexsort((records['index'], -records['accuracy']))]
+
+#---------------------------------------------------------------------
+# Class that streams the records of a grid search to disk and keeps the top-k configurations.
+# It is also a checkpoint of the search: each completed block of (alpha, beta, gama) configurations
+# is logged to <name>.done (start, stop and the range of its records in <name>.bin) once its records are
+# on disk. The records file is synced every syncSize bytes (and when the sink is closed), not after every block.
+# With resume, a new sink reuses the files of a previous run and the completed blocks can be skipped.
+# datasetHash is the sha1 of the dataset (see errorsDetectionEngine.saveAnnotationTable): results of another dataset
+# with the same number of annotations are not resumed or merged
+#---------------------------------------------------------------------
+class resultSink:
+
+	def __init__(self, name, thresholds, alphas, betas, gamas, nAnnotations, blockSize=256, topK=20, resume=False, syncSize=64 * 2 ** 20, datasetHash=None):
+		self.name = name
+		self.grid = [np.asarray(values, dtype=np.float64) for values in [thresholds, alphas, betas, gamas]]
+		self.nWeights = len(self.grid[1]) * len(self.grid[2]) * len(self.grid[3])
+		self.nAnnotations = nAnnotations
+		self.datasetHash = datasetHash
+		self.dtype = getResultDtype(nAnnotations)
+		self.blockSize = blockSize
+		self.topK = topK
+		self.syncSize = syncSize
+		self.top = np.empty(0, dtype=topDtype)
+		self.nRecords = 0
+		self.doneBlocks = {}
+		self.pendingBlocks = []
+		self.pendingSize = 0
+
+		if resume and os.path.exists(name + '.json'):
+			self.resume()
+		else:
+			with open(name + '.json', 'w') as metadataFile:
+				json.dump(self.getMetadata(), metadataFile)
+			self.recordsFile = open(name + '.bin', 'wb')
+			self.doneFile = open(name + '.done', 'w')
+
+	#---------------------------------------------------------------------
+	# Description of the records file
+	#---------------------------------------------------------------------
+	def getMetadata(self):
+
+		metadata = {}
+		metadata['dtype'] = self.dtype.descr
+		metadata['nAnnotations'] = self.nAnnotations
+		metadata['datasetHash'] = self.datasetHash
+		metadata['blockSize'] = self.blockSize
+		metadata['thresholds'] = self.grid[0].tolist()
+		metadata['alphas'] = self.grid[1].tolist()
+		metadata['betas'] = self.grid[2].tolist()
+		metadata['gamas'] = self.grid[3].tolist()
+
+		# Same types as after loading it from the json file
+		return json.loads(json.dumps(metadata))
+
+	#---------------------------------------------------------------------
+	# Continue a previous run: records of blocks that were not completed are discarded
+	# and the top-k configurations are rebuilt from the records of the completed blocks
+	#---------------------------------------------------------------------
+	def resume(self):
+
+		with open(self.name + '.json', 'r') as metadataFile:
+			if json.load(metadataFile) != self.getMetadata():
+				raise ValueError("The results in %s were created with a different grid, block size or dataset." % self.name)
+
+		self.doneBlocks = loadDoneBlocks(self.name)
+		self.nRecords = max([end for begin, end in self.doneBlocks.values()] + [0])
+
+		self.recordsFile = open(self.name + '.bin', 'ab')
+		self.recordsFile.truncate(self.nRecords * self.dtype.itemsize)
+
+		# Rewrite the log without an incomplete last line, so new lines are not appended to it
+		self.doneFile = open(self.name + '.done', 'w')
+		for block, (begin, end) in sorted(self.doneBlocks.items(), key=lambda item: item[1]):
+			self.doneFile.write("{}\t{}\t{}\t{}\n".format(block[0], block[1], begin, end))
+		self.doneFile.flush()
+
+		if self.nRecords:
+			records = np.memmap(self.name + '.bin', dtype=self.dtype, mode='r', shape=(self.nRecords,))
+			for block, (begin, end) in self.doneBlocks.items():
+				self.updateTop(expandRecords(records[begin:end], block, len(self.grid[0]), self.nWeights))
+			del records
+
+		logger.info("Resuming {}: {} blocks ({} results) already completed".format(self.name, len(self.doneBlocks), self.nRecords))
+
+	#---------------------------------------------------------------------
+	# Return True if the block (start, stop) of (alpha, beta, gama) configurations was already completed
+	#---------------------------------------------------------------------
+	def isDone(self, block):
+		return tuple(block) in self.doneBlocks
+
+	#---------------------------------------------------------------------
+	# Append the records of the block (start, stop) to the file and update the top-k configurations.
+	# The block is logged as done once the records are on disk (see sync)
+	#---------------------------------------------------------------------
+	def add(self, records, block):
+
+		begin = self.nRecords
+		records.tofile(self.recordsFile)
+		self.nRecords += len(records)
+		self.updateTop(expandRecords(records, block, len(self.grid[0]), self.nWeights))
+
+		self.doneBlocks[tuple(block)] = (begin, self.nRecords)
+		self.pendingBlocks.append((block, begin, self.nRecords))
+		self.pendingSize += records.nbytes
+		if self.pendingSize >= self.syncSize:
+			self.sync()
+
+	#---------------------------------------------------------------------
+	# Write the records to disk and log the blocks added since the last sync
+	#---------------------------------------------------------------------
+	def sync(self):
+
+		self.recordsFile.flush()
+		os.fsync(self.recordsFile.fileno())
+		for block, begin, end in self.pendingBlocks:
+			self.doneFile.write("{}\t{}\t{}\t{}\n".format(block[0], block[1], begin, end))
+		self.doneFile.flush()
+		self.pendingBlocks = []
+		self.pendingSize = 0
+
+	#---------------------------------------------------------------------
+	# Merge records in the top-k configurations
+	#---------------------------------------------------------------------
+	def updateTop(self, records):
+
+		# Only records that can enter the top-k are merged
+		if len(self.top) == self.topK:
+			records = records[records['accuracy'] >= self.top['accuracy'][-1]]
+		if len(records):
+			self.top = sortRecords(np.concatenate([self.top, records]))[:self.topK]
+
+	def close(self):
+		self.sync()
+		self.recordsFile.close()
+		self.doneFile.close()
+		logger.info("{} results saved to {}.bin".format(self.nRecords, self.name))
+
+	#---------------------------------------------------------------------
+	# Return the (threshold, alpha, beta, gama) values of a record
+	#---------------------------------------------------------------------
+	def getConfiguration(self, record):
+		positions = np.unravel_index(int(record['index']), tuple(len(values) for values in self.grid))
+		return [self.grid[x][positions[x]] for x in range(4)]
+
+	#---------------------------------------------------------------------
+	# Return the best configuration as a dictionary (same format as errorsDetectionEngine.getBestInBlock)
+	#---------------------------------------------------------------------
+	def getBest(self):
+
+		if not len(self.top):
+			return None
+
+		record = self.top[0]
+		best = {}
+		best['index'] = int(record['index'])
+		best['threshold'], best['alpha'], best['beta'], best['gama'] = self.getConfiguration(record)
+		for name in countNames + ['accuracy']:
+			best[name] = record[name]
+
+		return best
+
+#---------------------------------------------------------------------
+# Load the results saved by a resultSink. The records are memory-mapped.
+# Returns the records and the metadata (grid values and number of annotations).
+# The records of each completed block (see loadDoneBlocks) can be converted with expandRecords
+#---------------------------------------------------------------------
+def loadResults(name):
+
+	with open(name + '.json', 'r') as metadataFile:
+		metadata = json.load(metadataFile)
+	records = np.memmap(name + '.bin', dtype=getResultDtype(metadata['nAnnotations']), mode='r')
+
+	return records, metadata
+
+#---------------------------------------------------------------------
+# Return the completed blocks of a run: {(start, stop): (first record, last record + 1)}.
+# An incomplete last line (e.g., the run was killed while writing it) is ignored
+#---------------------------------------------------------------------
+def loadDoneBlocks(name):
+
+	doneBlocks = {}
+	if not os.path.exists(name + '.done'):
+		return doneBlocks
+
+	for line in open(name + '.done', 'r'):
+		values = line.rstrip('\n').split('\t')
+		if len(values) != 4 or not line.endswith('\n'):
+			continue
+		start, stop, begin, end = [int(value) for value in values]
+		doneBlocks[(start, stop)] = (begin, end)
+
+	return doneBlocks
+
+#---------------------------------------------------------------------
+# Return the blocks (start, stop) of (alpha, beta, gama) configurations of the grid that are not completed in the results 'name'
+#---------------------------------------------------------------------
+def getMissingBlocks(name):
+
+	with open(name + '.json', 'r') as metadataFile:
+		metadata = json.load(metadataFile)
+	nWeights = len(metadata['alphas']) * len(metadata['betas']) * len(metadata['gamas'])
+	blocks = [(start, min(start + metadata['blockSize'], nWeights)) for start in range(0, nWeights, metadata['blockSize'])]
+	doneBlocks = loadDoneBlocks(name)
+
+	return [block for block in blocks if block not in doneBlocks]
+
+#---------------------------------------------------------------------
+# Merge the results of several partial runs of the same grid (e.g., runs of different shards
+# of the grid or runs that were interrupted) into the results 'outputName'.
+# Blocks completed by more than one run are only copied once
+#---------------------------------------------------------------------
+def mergeResults(names, outputName):
+
+	metadata = None
+	for name in names:
+		with open(name + '.json', 'r') as metadataFile:
+			runMetadata = json.load(metadataFile)
+		if metadata is None:
+			metadata = runMetadata
+		elif runMetadata != metadata:
+			raise ValueError("The results in %s were created with a different grid, block size or dataset." % name)
+
+	sink = resultSink(outputName, metadata['thresholds'], metadata['alphas'], metadata['betas'], metadata['gamas'], metadata['nAnnotations'], blockSize=metadata['blockSize'], resume=True, datasetHash=metadata.get('datasetHash'))
+	for name in names:
+		if name == outputName:
+			continue
+		records = None
+		for block, (begin, end) in sorted(loadDoneBlocks(name).items()):
+			if sink.isDone(block):
+				continue
+			if records is None:
+				records = np.memmap(name + '.bin', dtype=sink.dtype, mode='r')
+			sink.add(np.array(records[begin:end]), block)
+		del records
+		logger.info("Results of {} merged into {}".format(name, outputName))
+
+	return sink
@@ -36,6 +36,14 @@ How to use
     >>>        print("Section title: %s" % section_title)
     >>>        print("Section text: %s" % section_text)
 
+#. Or write the output to N gzip shards with an index, to read any article without decompressing the others ::
+
+    python -m segment_wiki -f enwiki-latest-pages-articles.xml.bz2 -o enwiki-latest -n 16
+
+    >>> index = ShardIndex('enwiki-latest')
+    >>> article = read_sharded_article('enwiki-latest', *index.find(title='Anarchism'))
+    >>> article = read_sharded_article('enwiki-latest', *index.find(article_id='12'))
+
 
 Notes
 -----
@@ -52,13 +60,19 @@ Command line arguments
 """
 
 import argparse
+import bisect
+import bz2
+import gzip
 import json
 import logging
 import multiprocessing
+import os
 import re
 import sys
+import traceback
+import zlib
+from array import array
 from xml.etree import cElementTree
-from functools import partial
 
 from gensim.corpora.wikicorpus import IGNORED_NAMESPACES, WikiCorpus, filter_wiki, find_interlinks, get_namespace, utils
 from smart_open import smart_open
@@ -66,7 +80,8 @@ from smart_open import smart_open
 logger = logging.getLogger(__name__)
 
 
-def segment_all_articles(file_path, min_article_character=200, workers=None, include_interlinks=False):
+def segment_all_articles(file_path, min_article_character=200, workers=None, include_interlinks=False,
+                         index_path=None, batch_size=100, output_format=None):
     """Extract article titles and sections from a MediaWiki bz2 database dump.
 
     Parameters
@@ -84,25 +99,50 @@ def segment_all_articles(file_path, min_article_character=200, workers=None, inc
     include_interlinks: bool
         Whether or not interlinks should be included in the output
 
+    index_path : str or None
+        Path to the index of a multistream dump, typical filename is
+        <LANG>wiki-<YYYYMMDD>-pages-articles-multistream-index.txt.bz2. If given, `file_path` must be the
+        matching multistream dump and its bz2 streams are decompressed and parsed in parallel by the workers.
+
+    batch_size : int, optional
+        Number of pages sent to a worker at once.
+
+    output_format : {None, 'json', 'gzip'}, optional
+        If 'json', yield the articles already formatted as json lines by the workers (see :func:`format_article`).
+        If 'gzip', yield the articles of each batch as a gzip member compressed by the workers.
+
     Yields
     ------
     (str, list of (str, str), (Optionally) dict of str: str)
         Structure contains (title, [(section_heading, section_content), ...], (Optionally) {interlinks}).
+        If `output_format` is 'json', (title, json line) instead and if it is 'gzip',
+        ([(articleID, title, line offset), ...], gzip member) instead.
 
     """
-    with smart_open(file_path, 'rb') as xml_fileobj:
+    multistream = None if index_path is None else read_multistream_index(file_path, index_path)
+    xml_fileobj = smart_open(file_path, 'rb') if multistream is None else None
+
+    try:
         wiki_sections_corpus = _WikiSectionsCorpus(
             xml_fileobj, min_article_character=min_article_character, processes=workers,
-            include_interlinks=include_interlinks)
+            include_interlinks=include_interlinks, multistream=multistream, batch_size=batch_size)
         wiki_sections_corpus.metadata = True
-        wiki_sections_text = wiki_sections_corpus.get_texts_with_sections()
+        if output_format == 'json':
+            wiki_sections_text = wiki_sections_corpus.get_article_lines()
+        elif output_format == 'gzip':
+            wiki_sections_text = wiki_sections_corpus.get_article_blocks()
+        else:
+            wiki_sections_text = wiki_sections_corpus.get_texts_with_sections()
 
         for article in wiki_sections_text:
             yield article
+    finally:
+        if xml_fileobj is not None:
+            xml_fileobj.close()
 
 
 def segment_and_write_all_articles(file_path, output_file, min_article_character=200, workers=None,
-                                   include_interlinks=False):
+                                   include_interlinks=False, index_path=None, batch_size=100):
     """Write article title and sections to `output_file` (or stdout, if output_file is None).
 
     The output format is one article per line, in json-line format with 4 fields::
@@ -129,6 +169,12 @@ def segment_and_write_all_articles(file_path, output_file, min_article_character
 
     include_interlinks: bool
         Whether or not interlinks should be included in the output
+
+    index_path : str or None
+        Path to the index of a multistream dump (see :func:`segment_all_articles`).
+
+    batch_size : int, optional
+        Number of pages sent to a worker at once.
     """
     if output_file is None:
         outfile = getattr(sys.stdout, 'buffer', sys.stdout)  # we want write bytes, so for py3 we used 'buffer'
@@ -136,37 +182,285 @@ def segment_and_write_all_articles(file_path, output_file, min_article_character
         outfile = smart_open(output_file, 'wb')
 
     try:
+        # the articles are formatted by the workers, so only bytes are written here
         article_stream = segment_all_articles(file_path, min_article_character, workers=workers,
-                                              include_interlinks=include_interlinks)
-        for idx, article in enumerate(article_stream):
-            article_title, article_sections, articleID = article[0], article[1], article[-1]
-            if include_interlinks:
-                interlinks = article[2]
-
-            output_data = {
-                "title": article_title,
-                "section_titles": [],
-                "section_texts": [],
-                "articleID": articleID
-            }
-            if include_interlinks:
-                output_data["interlinks"] = interlinks
-
-            for section_heading, section_content in article_sections:
-                output_data["section_titles"].append(section_heading)
-                output_data["section_texts"].append(section_content)
-
+                                              include_interlinks=include_interlinks, index_path=index_path,
+                                              batch_size=batch_size, output_format='json')
+        for idx, (article_title, line) in enumerate(article_stream):
             if (idx + 1) % 100000 == 0:
                 logger.info("processed #%d articles (at %r now)", idx + 1, article_title)
-            outfile.write((json.dumps(output_data) + "\n").encode('utf-8'))
+            outfile.write(line)
 
     finally:
         if output_file is not None:
             outfile.close()
 
 
-def extract_page_xmls(f):
-    """Extract pages from a MediaWiki database dump.
+def get_shard_path(output_prefix, shard):
+    """Get the path of a shard written by :func:`segment_and_write_sharded_articles`."""
+    return "%s-%05d.json.gz" % (output_prefix, shard)
+
+
+def get_shard_index_path(output_prefix):
+    """Get the path of the index written by :func:`segment_and_write_sharded_articles`."""
+    return "%s-index.tsv" % output_prefix
+
+
+def segment_and_write_sharded_articles(file_path, output_prefix, shards, min_article_character=200, workers=None,
+                                       include_interlinks=False, index_path=None, batch_size=100):
+    """Write article title and sections to `shards` gzip files, with an index to find any article.
+
+    The articles are in the same json-line format as :func:`segment_and_write_all_articles`. Each shard
+    (<output_prefix>-<shard>.json.gz) is a concatenation of independent gzip members (one per batch of pages,
+    distributed round-robin over the shards), so it can be read as a regular gzip file and a member can be
+    decompressed on its own. The index (<output_prefix>-index.tsv) has one line per article, sorted by
+    articleID (see :class:`ShardIndex`), with 5 tab separated fields::
+
+        articleID, title, shard, offset of the gzip member in the shard, offset of the line in the member
+
+    Parameters
+    ----------
+    file_path : str
+        Path to MediaWiki dump, typical filename is <LANG>wiki-<YYYYMMDD>-pages-articles.xml.bz2
+        or <LANG>wiki-latest-pages-articles.xml.bz2.
+
+    output_prefix : str
+        Prefix of the paths of the shards and of the index.
+
+    shards : int
+        Number of shards.
+
+    min_article_character : int, optional
+        Minimal number of character for article (except titles and leading gaps).
+
+    workers: int or None
+        Number of parallel workers, max(1, multiprocessing.cpu_count() - 1) if None.
+
+    include_interlinks: bool
+        Whether or not interlinks should be included in the output
+
+    index_path : str or None
+        Path to the index of a multistream dump (see :func:`segment_all_articles`).
+
+    batch_size : int, optional
+        Number of pages sent to a worker at once.
+    """
+    shard_files = [open(get_shard_path(output_prefix, shard), 'wb') for shard in range(shards)]
+    # the index is written in the order of the dump and sorted by articleID at the end
+    unsorted_index_path = get_shard_index_path(output_prefix) + '.tmp'
+    index_file = open(unsorted_index_path, 'wb')
+    article_ids, line_starts = array('q'), array('q', [0])
+
+    try:
+        # the batches are compressed by the workers, so only bytes are written here
+        article_blocks = segment_all_articles(file_path, min_article_character, workers=workers,
+                                              include_interlinks=include_interlinks, index_path=index_path,
+                                              batch_size=batch_size, output_format='gzip')
+        n_articles = 0
+        for block_idx, (entries, data) in enumerate(article_blocks):
+            shard = block_idx % shards
+            member_offset = shard_files[shard].tell()
+            shard_files[shard].write(data)
+            for articleID, article_title, line_offset in entries:
+                line = ("%s\t%s\t%i\t%i\t%i\n" % (articleID, article_title, shard, member_offset, line_offset)).encode('utf-8')
+                index_file.write(line)
+                article_ids.append(int(articleID))
+                line_starts.append(line_starts[-1] + len(line))
+
+            if (n_articles + len(entries)) // 100000 > n_articles // 100000:
+                logger.info("processed #%d articles (at %r now)", n_articles + len(entries), entries[-1][1])
+            n_articles += len(entries)
+
+    finally:
+        for shard_file in shard_files:
+            shard_file.close()
+        index_file.close()
+
+    sort_shard_index(unsorted_index_path, get_shard_index_path(output_prefix), article_ids, line_starts)
+
+
+def sort_shard_index(unsorted_index_path, index_path, article_ids, line_starts):
+    """Sort the lines of an index by articleID. The unsorted index is replaced by the sorted one.
+
+    Parameters
+    ----------
+    unsorted_index_path : str
+        Path of the index in the order of the dump.
+    index_path : str
+        Path of the sorted index.
+    article_ids : array of int
+        articleID of each line.
+    line_starts : array of int
+        Offset of each line in the unsorted index, followed by the size of the index.
+
+    """
+    # pages of a dump are usually already in the order of their ids
+    if all(article_ids[i] <= article_ids[i + 1] for i in range(len(article_ids) - 1)):
+        os.replace(unsorted_index_path, index_path)
+        return
+
+    order = sorted(range(len(article_ids)), key=article_ids.__getitem__)
+    with open(unsorted_index_path, 'rb') as unsorted_file, open(index_path, 'wb') as index_file:
+        for i in order:
+            unsorted_file.seek(line_starts[i])
+            index_file.write(unsorted_file.read(line_starts[i + 1] - line_starts[i]))
+    os.remove(unsorted_index_path)
+
+
+def read_shard_index(output_prefix):
+    """Read the index written by :func:`segment_and_write_sharded_articles`.
+
+    Parameters
+    ----------
+    output_prefix : str
+        Prefix of the paths of the shards and of the index.
+
+    Yields
+    ------
+    (str, str, int, int, int)
+        articleID, title, shard, offset of the gzip member in the shard and offset of the line in the member.
+
+    """
+    with smart_open(get_shard_index_path(output_prefix), 'rb') as index_file:
+        for line in index_file:
+            articleID, article_title, shard, member_offset, line_offset = line.decode('utf-8').rstrip('\n').split('\t')
+            yield articleID, article_title, int(shard), int(member_offset), int(line_offset)
+
+
+class ShardIndex(object):
+    """Find the position of an article in the shards written by :func:`segment_and_write_sharded_articles`.
+
+    The index is loaded once: articles are found by articleID with a binary search over the sorted index
+    and by title with a dictionary, built on the first search by title.
+
+    Parameters
+    ----------
+    output_prefix : str
+        Prefix of the paths of the shards and of the index.
+
+    """
+    def __init__(self, output_prefix):
+        self.article_ids = array('q')
+        self.titles = []
+        self.positions = []
+        self.title_rows = None
+        for articleID, article_title, shard, member_offset, line_offset in read_shard_index(output_prefix):
+            self.article_ids.append(int(articleID))
+            self.titles.append(article_title)
+            self.positions.append((shard, member_offset, line_offset))
+        if any(self.article_ids[i] > self.article_ids[i + 1] for i in range(len(self.article_ids) - 1)):
+            raise ValueError("the index of %r is not sorted by articleID" % output_prefix)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def find(self, article_id=None, title=None):
+        """Find an article by articleID or by title.
+
+        Parameters
+        ----------
+        article_id : str or int, optional
+            articleID of the article.
+        title : str, optional
+            Title of the article.
+
+        Returns
+        -------
+        (int, int, int)
+            Shard, offset of the gzip member in the shard and offset of the line in the member
+            (the arguments of :func:`read_sharded_article`).
+
+        Raises
+        ------
+        KeyError
+            If there is no article with this articleID or title.
+
+        """
+        if article_id is not None:
+            row = bisect.bisect_left(self.article_ids, int(article_id))
+            if row == len(self.article_ids) or self.article_ids[row] != int(article_id):
+                raise KeyError(article_id)
+            return self.positions[row]
+
+        if title is None:
+            raise ValueError("either article_id or title must be given")
+        if self.title_rows is None:
+            self.title_rows = {article_title: row for row, article_title in enumerate(self.titles)}
+        return self.positions[self.title_rows[title]]
+
+
+def read_sharded_article(output_prefix, shard, member_offset, line_offset):
+    """Read one article written by :func:`segment_and_write_sharded_articles`, only decompressing its gzip member.
+
+    Parameters
+    ----------
+    output_prefix : str
+        Prefix of the paths of the shards and of the index.
+    shard : int
+        Shard of the article.
+    member_offset : int
+        Offset of the gzip member in the shard.
+    line_offset : int
+        Offset of the line in the member.
+
+    Returns
+    -------
+    dict
+        Article, in the format of :func:`segment_and_write_all_articles`.
+
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip header
+    data = []
+    with open(get_shard_path(output_prefix, shard), 'rb') as shard_file:
+        shard_file.seek(member_offset)
+        while not decompressor.eof:
+            chunk = shard_file.read(1024 * 1024)
+            if not chunk:
+                break
+            data.append(decompressor.decompress(chunk))
+    data = b''.join(data)
+
+    return json.loads(data[line_offset:data.index(b'\n', line_offset)].decode('utf-8'))
+
+
+def format_article(article, include_interlinks=False):
+    """Format an article as a line of the output of :func:`segment_and_write_all_articles`.
+
+    Parameters
+    ----------
+    article : (str, list of (str, str), (Optionally) dict of (str: str), str)
+        Article, as returned by :func:`segment`.
+    include_interlinks : bool
+        Whether or not `article` has interlinks.
+
+    Returns
+    -------
+    bytes
+        UTF-8 encoded json line.
+
+    """
+    article_title, article_sections, articleID = article[0], article[1], article[-1]
+    if include_interlinks:
+        interlinks = article[2]
+
+    output_data = {
+        "title": article_title,
+        "section_titles": [],
+        "section_texts": [],
+        "articleID": articleID
+    }
+    if include_interlinks:
+        output_data["interlinks"] = interlinks
+
+    for section_heading, section_content in article_sections:
+        output_data["section_titles"].append(section_heading)
+        output_data["section_texts"].append(section_content)
+
+    return (json.dumps(output_data) + "\n").encode('utf-8')
+
+
+def extract_page_elements(f):
+    """Extract page elements from a MediaWiki database dump.
 
     Parameters
     ----------
@@ -175,8 +469,8 @@ def extract_page_xmls(f):
 
     Yields
     ------
-    str
-        XML strings for page tags.
+    xml.etree.ElementTree.Element
+        Page tags. Each element is cleared once the next one is requested.
 
     """
     elems = (elem for _, elem in cElementTree.iterparse(f, events=("end",)))
@@ -188,7 +482,7 @@ def extract_page_xmls(f):
 
     for elem in elems:
         if elem.tag == page_tag:
-            yield cElementTree.tostring(elem)
+            yield elem
             # Prune the element tree, as per
             # http://www.ibm.com/developerworks/xml/library/x-hiperfparse/
             # except that we don't need to prune backlinks from the parent
@@ -199,6 +493,159 @@ def extract_page_xmls(f):
             elem.clear()
 
 
+def extract_page_xmls(f):
+    """Extract pages from a MediaWiki database dump.
+
+    Parameters
+    ----------
+    f : file
+        File descriptor of MediaWiki dump.
+
+    Yields
+    ------
+    str
+        XML strings for page tags.
+
+    """
+    for elem in extract_page_elements(f):
+        yield cElementTree.tostring(elem)
+
+
+def get_skip_reason(elem, min_article_character=200):
+    """Tell whether a page will certainly be skipped by :meth:`_WikiSectionsCorpus.get_texts_with_sections`,
+    only looking at its title, namespace and raw text.
+
+    Pages that are not certainly skipped (e.g. a redirect marker hidden behind markup) are left to the full
+    check after :func:`segment`. `filter_wiki` never makes a text longer, so a raw text shorter than
+    `min_article_character` is certainly a stub.
+
+    Parameters
+    ----------
+    elem : xml.etree.ElementTree.Element
+        Page tag.
+    min_article_character : int, optional
+        Minimal number of character for article (except titles and leading gaps).
+
+    Returns
+    -------
+    str or None
+        'namespace', 'redirect' or 'length', same as the counter the page would be added to, or None.
+
+    """
+    namespace = get_namespace(elem.tag)
+    ns_mapping = {"ns": namespace}
+    title = elem.find("./{%(ns)s}title" % ns_mapping).text
+    ns = elem.find("./{%(ns)s}ns" % ns_mapping).text
+    text = elem.find("./{%(ns)s}revision/{%(ns)s}text" % ns_mapping).text
+
+    if any(title.startswith(ignore + ':') for ignore in IGNORED_NAMESPACES):
+        return 'namespace'
+    if text is None or ns != '0':  # no sections at all
+        return 'redirect'
+    if text.lstrip().lower().startswith("#redirect"):
+        return 'redirect'
+    if len(text) < min_article_character and "#redirect" not in text.lower():
+        return 'length'
+    return None
+
+
+def extract_filtered_page_xmls(f, min_article_character=200):
+    """Extract pages from a MediaWiki database dump, without serializing the pages that will certainly be skipped.
+
+    Parameters
+    ----------
+    f : file
+        File descriptor of MediaWiki dump.
+    min_article_character : int, optional
+        Minimal number of character for article (except titles and leading gaps).
+
+    Yields
+    ------
+    (str, str)
+        (skip reason, None) for pages skipped by :func:`get_skip_reason`, (None, XML string) for the others.
+
+    """
+    for elem in extract_page_elements(f):
+        skip_reason = get_skip_reason(elem, min_article_character)
+        if skip_reason is None:
+            yield None, cElementTree.tostring(elem)
+        else:
+            yield skip_reason, None
+
+
+def read_multistream_index(file_path, index_path):
+    """Read the index of a multistream MediaWiki dump.
+
+    A multistream dump is a concatenation of independent bz2 streams: the first one holds the
+    <siteinfo> header and each of the others holds (up to) 100 <page> tags. The index has one line
+    per page, in the format `offset:page_id:title`, where `offset` is the byte offset of its stream.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the multistream dump.
+    index_path : str
+        Path to the index of the dump (possibly compressed).
+
+    Returns
+    -------
+    (str, str, list of (int, int))
+        Path to the dump, XML namespace of the dump and (start, end) byte offsets of the streams with pages.
+
+    """
+    offsets = set()
+    with smart_open(index_path, 'rb') as index_fileobj:
+        for line in index_fileobj:
+            offsets.add(int(line.split(b':', 1)[0]))
+    offsets = sorted(offsets)
+
+    # the last stream with pages is followed by a small stream closing the <mediawiki> tag
+    offsets.append(os.path.getsize(file_path))
+    stream_ranges = list(zip(offsets[:-1], offsets[1:]))
+
+    with open(file_path, 'rb') as dump_fileobj:
+        header = bz2.decompress(dump_fileobj.read(offsets[0]))
+    namespace = re.search(br'<mediawiki[^>]*\sxmlns="([^"]*)"', header).group(1).decode('utf-8')
+
+    logger.info("found %i streams in multistream dump %s", len(stream_ranges), file_path)
+    return file_path, namespace, stream_ranges
+
+
+def segment_stream(stream_range, file_path, namespace, include_interlinks=False):
+    """Decompress one bz2 stream of a multistream dump and parse all pages in it.
+
+    Parameters
+    ----------
+    stream_range : (int, int)
+        Start and end byte offsets of the stream.
+    file_path : str
+        Path to the multistream dump.
+    namespace : str
+        XML namespace of the dump.
+    include_interlinks : bool
+        Whether or not interlinks should be parsed.
+
+    Returns
+    -------
+    list of (str, list of (str, str), (Optionally) dict of (str: str))
+        Pages of the stream, in order, as returned by :func:`segment`.
+
+    """
+    start, end = stream_range
+    with open(file_path, 'rb') as dump_fileobj:
+        dump_fileobj.seek(start)
+        page_xmls = bz2.decompress(dump_fileobj.read(end - start)).rstrip()
+
+    # the streams have no root element, except for the closing tag at the end of the dump
+    if page_xmls.endswith(b'</mediawiki>'):
+        page_xmls = page_xmls[:-len(b'</mediawiki>')]
+    root_tag = b'<mediawiki xmlns="' + namespace.encode('utf-8') + b'">'
+    root = cElementTree.fromstring(root_tag + page_xmls + b'</mediawiki>')
+
+    page_tag = "{%(ns)s}page" % {"ns": namespace}
+    return [segment_element(elem, include_interlinks) for elem in root if elem.tag == page_tag]
+
+
 def segment(page_xml, include_interlinks=False):
     """Parse the content inside a page tag
 
@@ -216,7 +663,11 @@ def segment(page_xml, include_interlinks=False):
         Structure contains (title, [(section_heading, section_content), ...], (Optionally) {interlinks}).
 
     """
-    elem = cElementTree.fromstring(page_xml)
+    return segment_element(cElementTree.fromstring(page_xml), include_interlinks)
+
+
+def segment_element(elem, include_interlinks=False):
+    """Parse a page tag, already parsed into an element (see :func:`segment`)."""
     filter_namespaces = ('0',)
     namespace = get_namespace(elem.tag)
     ns_mapping = {"ns": namespace}
@@ -256,6 +707,126 @@ def segment(page_xml, include_interlinks=False):
         return title, sections, articleID
 
 
+def get_article_skip_reason(article, min_article_character=200):
+    """Tell whether a segmented article is skipped (non-article, redirect or stub).
+
+    Parameters
+    ----------
+    article : (str, list of (str, str), ...)
+        Article, as returned by :func:`segment`.
+    min_article_character : int, optional
+        Minimal number of character for article (except titles and leading gaps).
+
+    Returns
+    -------
+    str or None
+        'namespace', 'redirect' or 'length' if the article is skipped, None otherwise.
+
+    """
+    article_title, sections = article[0], article[1]
+
+    # article redirects are pruned here
+    if any(article_title.startswith(ignore + ':') for ignore in IGNORED_NAMESPACES):  # filter non-articles
+        return 'namespace'
+    if not sections or sections[0][1].lstrip().lower().startswith("#redirect"):  # filter redirect
+        return 'redirect'
+    if sum(len(body.strip()) for (_, body) in sections) < min_article_character:
+        # filter stubs (incomplete, very short articles)
+        return 'length'
+    return None
+
+
+def segment_batch(batch, min_article_character=200, include_interlinks=False, stream_source=None,
+                  output_format=None):
+    """Segment and filter a batch of pages.
+
+    Parameters
+    ----------
+    batch : list of (str, str) or list of (int, int)
+        Pages as yielded by :func:`extract_filtered_page_xmls` or, if `stream_source` is given,
+        byte offsets of bz2 streams of a multistream dump.
+    min_article_character : int, optional
+        Minimal number of character for article (except titles and leading gaps).
+    include_interlinks : bool, optional
+        Whether or not interlinks should be parsed.
+    stream_source : (str, str), optional
+        Path and XML namespace of a multistream dump.
+    output_format : {None, 'json', 'gzip'}, optional
+        Whether to return the articles as (title, json line) (see :func:`format_article`) or
+        as a gzip member of their json lines, with a list of (articleID, title, line offset in the member).
+
+    Returns
+    -------
+    (list, dict of (str: int))
+        Articles that are kept, in order, and counters of articles, sections and skipped pages.
+        If `output_format` is 'gzip', ([(articleID, title, line offset), ...], gzip member) instead of the list.
+
+    """
+    stats = {'articles': 0, 'sections': 0, 'namespace': 0, 'redirect': 0, 'length': 0}
+
+    if stream_source is None:
+        articles = []
+        for skip_reason, page_xml in batch:
+            if skip_reason is None:
+                articles.append(segment(page_xml, include_interlinks))
+            else:
+                stats[skip_reason] += 1  # skipped by the reader
+    else:
+        file_path, namespace = stream_source
+        articles = [
+            article for stream_range in batch
+            for article in segment_stream(stream_range, file_path, namespace, include_interlinks)
+        ]
+
+    kept = []
+    for article in articles:
+        skip_reason = get_article_skip_reason(article, min_article_character)
+        if skip_reason is not None:
+            stats[skip_reason] += 1
+            continue
+        stats['articles'] += 1
+        stats['sections'] += len(article[1])
+        if output_format is None:
+            kept.append(article)
+        else:
+            kept.append((article[-1], article[0], format_article(article, include_interlinks)))
+
+    if output_format == 'json':
+        kept = [(article_title, line) for _, article_title, line in kept]
+    elif output_format == 'gzip':
+        entries, line_offset = [], 0
+        for articleID, article_title, line in kept:
+            entries.append((articleID, article_title, line_offset))
+            line_offset += len(line)
+        kept = entries, gzip.compress(b''.join(line for _, _, line in kept))
+
+    return kept, stats
+
+
+def _read_batches(items, batch_size, batch_queue, result_queue, in_flight, workers):
+    """Reader of the pipeline of :class:`_WikiSectionsCorpus`: put numbered batches of `items` to `batch_queue`."""
+    try:
+        for seq, batch in enumerate(utils.chunkize_serial(items, batch_size)):
+            in_flight.acquire()
+            batch_queue.put((seq, batch))
+    except Exception:
+        result_queue.put(('error', None, traceback.format_exc()))
+        return
+    for _ in range(workers):
+        batch_queue.put(None)
+
+
+def _segment_batches(batch_queue, result_queue, **kwargs):
+    """Worker of the pipeline of :class:`_WikiSectionsCorpus`: segment batches until the reader is done."""
+    try:
+        for seq, batch in iter(batch_queue.get, None):
+            result_queue.put(('batch', seq, segment_batch(batch, **kwargs)))
+    except Exception:
+        result_queue.put(('error', None, traceback.format_exc()))
+        return
+    result_queue.put(('done', None, None))
+
+
 class _WikiSectionsCorpus(WikiCorpus):
     """Treat a wikipedia articles dump (<LANG>wiki-<YYYYMMDD>-pages-articles.xml.bz2
     or <LANG>wiki-latest-pages-articles.xml.bz2) as a (read-only) corpus.
@@ -265,7 +836,8 @@ class _WikiSectionsCorpus(WikiCorpus):
     """
 
     def __init__(self, fileobj, min_article_character=200, processes=None,
-                 lemmatize=utils.has_pattern(), filter_namespaces=('0',), include_interlinks=False):
+                 lemmatize=utils.has_pattern(), filter_namespaces=('0',), include_interlinks=False, multistream=None,
+                 batch_size=100, queue_size=None):
         """
         Parameters
         ----------
@@ -282,18 +854,105 @@ class _WikiSectionsCorpus(WikiCorpus):
             Enumeration of namespaces that will be ignored.
         include_interlinks: bool
             Whether or not interlinks should be included in the output
+        multistream : (str, str, list of (int, int)), optional
+            Multistream dump, as returned by :func:`read_multistream_index`. If given, `fileobj` is not used
+            and the streams of the dump are decompressed and parsed by the worker processes.
+        batch_size : int, optional
+            Number of pages sent to a worker at once (for a multistream dump, one bz2 stream per 100 pages).
+        queue_size : int, optional
+            Maximal number of batches waiting in each queue of the pipeline, 2 * processes if None.
 
         """
         self.fileobj = fileobj
+        self.multistream = multistream
         self.filter_namespaces = filter_namespaces
         self.metadata = False
         if processes is None:
             processes = max(1, multiprocessing.cpu_count() - 1)
         self.processes = processes
+        self.batch_size = batch_size
+        self.queue_size = queue_size or 2 * processes
         self.lemmatize = lemmatize
         self.min_article_character = min_article_character
         self.include_interlinks = include_interlinks
 
+    def iterate_batches(self, output_format=None):
+        """Iterate over the dump, returning batches of articles in the order of the dump.
+
+        The dump is processed by a pipeline of persistent processes: a reader puts batches of pages to a bounded
+        queue, the workers segment, filter (and optionally format) them and the batches are put back in order here.
+        The number of batches in the pipeline is bounded, so the memory used does not depend on the dump size.
+
+        Parameters
+        ----------
+        output_format : {None, 'json', 'gzip'}, optional
+            Whether the workers format the articles as json lines or gzip members (see :func:`segment_batch`).
+
+        Yields
+        ------
+        list
+            Articles of a batch that are kept (see :func:`segment_batch`).
+
+        """
+        context = multiprocessing.get_context('fork')
+        batch_queue = context.Queue(self.queue_size)
+        result_queue = context.Queue(self.queue_size)
+        # batches read but not yielded yet, this also bounds the batches waiting to be put back in order
+        in_flight = context.Semaphore(2 * self.queue_size + self.processes)
+
+        kwargs = {
+            'min_article_character': self.min_article_character,
+            'include_interlinks': self.include_interlinks,
+            'output_format': output_format,
+        }
+        if self.multistream is None:
+            items = extract_filtered_page_xmls(self.fileobj, self.min_article_character)
+            batch_size = self.batch_size
+        else:
+            # each worker decompresses and parses whole bz2 streams, of (up to) 100 pages
+            file_path, namespace, items = self.multistream
+            batch_size = max(1, self.batch_size // 100)
+            kwargs['stream_source'] = (file_path, namespace)
+
+        processes = [context.Process(
+            target=_read_batches, args=(items, batch_size, batch_queue, result_queue, in_flight, self.processes))]
+        processes += [
+            context.Process(target=_segment_batches, args=(batch_queue, result_queue), kwargs=kwargs)
+            for _ in range(self.processes)
+        ]
+        for process in processes:
+            process.daemon = True
+            process.start()
+
+        totals = {'articles': 0, 'sections': 0, 'namespace': 0, 'redirect': 0, 'length': 0}
+        pending, next_seq, running = {}, 0, self.processes
+        try:
+            while running:
+                kind, seq, payload = result_queue.get()
+                if kind == 'error':
+                    raise RuntimeError("segment_wiki pipeline failed:\n%s" % payload)
+                if kind == 'done':
+                    running -= 1
+                    continue
+
+                pending[seq] = payload
+                while next_seq in pending:
+                    articles, stats = pending.pop(next_seq)
+                    for key in totals:
+                        totals[key] += stats[key]
+                    next_seq += 1
+                    in_flight.release()
+                    yield articles
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()
+
+        logger.info(
+            "finished processing %i articles with %i sections (skipped %i redirects, %i stubs, %i ignored namespaces)",
+            totals['articles'], totals['sections'], totals['redirect'], totals['length'], totals['namespace'])
+        self.length = totals['articles']  # cache corpus length
+
     def get_texts_with_sections(self):
         """Iterate over the dump, returning titles and text versions of all sections of articles.
 
@@ -314,45 +973,35 @@ class _WikiSectionsCorpus(WikiCorpus):
             Structure contains (title, [(section_heading, section_content), ...], (Optionally){interlinks}).
 
         """
-        skipped_namespace, skipped_length, skipped_redirect = 0, 0, 0
-        total_articles, total_sections = 0, 0
-        page_xmls = extract_page_xmls(self.fileobj)
+        for articles in self.iterate_batches():
+            for article in articles:
+                yield article
 
-        pool = multiprocessing.Pool(self.processes)
-        # process the corpus in smaller chunks of docs, because multiprocessing.Pool
-        # is dumb and would load the entire input into RAM at once...
-        for group in utils.chunkize(page_xmls, chunksize=10 * self.processes, maxsize=1):
+    def get_article_lines(self):
+        """Iterate over the dump, returning articles formatted by the workers as json lines.
 
-            for article in pool.imap(partial(segment, include_interlinks=self.include_interlinks),
-                                     group):  # chunksize=10): partial(merge_names, b='Sons')
+        Yields
+        ------
+        (str, bytes)
+            Title of the article and its json line (see :func:`format_article`).
 
-                article_title, sections, articleID = article[0], article[1], article[-1]
+        """
+        for articles in self.iterate_batches(output_format='json'):
+            for article in articles:
+                yield article
 
-                # article redirects are pruned here
-                if any(article_title.startswith(ignore + ':') for ignore in IGNORED_NAMESPACES):  # filter non-articles
-                    skipped_namespace += 1
-                    continue
-                if not sections or sections[0][1].lstrip().lower().startswith("#redirect"):  # filter redirect
-                    skipped_redirect += 1
-                    continue
-                if sum(len(body.strip()) for (_, body) in sections) < self.min_article_character:
-                    # filter stubs (incomplete, very short articles)
-                    skipped_length += 1
-                    continue
-                total_articles += 1
-                total_sections += len(sections)
+    def get_article_blocks(self):
+        """Iterate over the dump, returning the articles of each batch compressed by the workers.
 
-                if self.include_interlinks:
-                    interlinks = article[2]
-                    yield (article_title, sections, interlinks, articleID)
-                else:
-                    yield (article_title, sections, articleID)
+        Yields
+        ------
+        (list of (str, str, int), bytes)
+            (articleID, title, offset of the json line) of each article and a gzip member with their json lines.
 
-        logger.info(
-            "finished processing %i articles with %i sections (skipped %i redirects, %i stubs, %i ignored namespaces)",
-            total_articles, total_sections, skipped_redirect, skipped_length, skipped_namespace)
-        pool.terminate()
-        self.length = total_articles  # cache corpus length
+        """
+        for entries, data in self.iterate_batches(output_format='gzip'):
+            if entries:
+                yield entries, data
 
 
 if __name__ == "__main__":
@@ -381,14 +1030,48 @@ if __name__ == "__main__":
              '"interlinks": {"article_title_1": "interlink_text_1", "article_title_2": "interlink_text_2", ...}',
         action='store_true'
     )
+    parser.add_argument(
+        '-x', '--index',
+        help='Path to the index of a multistream dump '
+             '(<LANG>wiki-<YYYYMMDD>-pages-articles-multistream-index.txt.bz2). '
+             'If given, --file must be the matching multistream dump and its bz2 streams are decompressed '
+             'in parallel by the workers. The output is the same as for the regular dump.'
+    )
+    parser.add_argument(
+        '-b', '--batch-size',
+        help='Number of pages sent to a worker at once. Default: %(default)s.',
+        type=int,
+        default=100
+    )
+    parser.add_argument(
+        '-n', '--shards',
+        help='Write the output to this number of gzip shards (<output>-<shard>.json.gz), with an index from '
+             'articleID and title to the position of each article (<output>-index.tsv, sorted by articleID). '
+             '--output is then the prefix of these files.',
+        type=int
+    )
     args = parser.parse_args()
+    if args.shards is not None and args.output is None:
+        parser.error("--shards requires --output")
 
     logger.info("running %s", " ".join(sys.argv))
-    segment_and_write_all_articles(
-        args.file, args.output,
-        min_article_character=args.min_article_character,
-        workers=args.workers,
-        include_interlinks=args.include_interlinks
-    )
+    if args.shards is not None:
+        segment_and_write_sharded_articles(
+            args.file, args.output, args.shards,
+            min_article_character=args.min_article_character,
+            workers=args.workers,
+            include_interlinks=args.include_interlinks,
+            index_path=args.index,
+            batch_size=args.batch_size
+        )
+    else:
+        segment_and_write_all_articles(
+            args.file, args.output,
+            min_article_character=args.min_article_character,
+            workers=args.workers,
+            include_interlinks=args.include_interlinks,
+            index_path=args.index,
+            batch_size=args.batch_size
+        )
 
     logger.info("finished running %s", sys.argv[0])
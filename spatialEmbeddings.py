@@ -6,6 +6,7 @@ import os
 import sys
 import logging
 import pickle
+from collections import OrderedDict
 from scipy import spatial
 from gensim.models import Word2Vec
 from gensim.models import KeyedVectors
@@ -18,26 +19,99 @@ logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=lo
 logger = logging.getLogger(__name__)
 
 #------------------------------------------------------------------------------------
-# Return the weighted average of the word embeddings of the locations mentioned in the article
+# Global and configuration values
 #------------------------------------------------------------------------------------
-def getAverageEmbeddingForLocations(locations, counts, model):
+maxCachedLocations = 1000000 # Location phrases whose embedding is kept in memory (see phraseEmbeddingCache)
 
-	locationEmbeddings = [] 
-	locationEmbeddingsWeights = []
-	for x in range(len(locations)):
+#------------------------------------------------------------------------------------
+# Class to memoize the embedding of location phrases (the average of the word embeddings of its words). 
+# Phrases are normalized (lowercase words separated by one space) and the least recently used ones are evicted. 
+# Phrases without any word in the model are cached too (as None). The cache is cleared if the model changes
+#------------------------------------------------------------------------------------
+class phraseEmbeddingCache:
 
-		location = locations[x].split()
+	def __init__(self, maxEntries=maxCachedLocations):
+		self.maxEntries = maxEntries
+		self.entries = OrderedDict()
+		self.model = None
+		self.hits = 0
+		self.misses = 0
 
-		# Getting the word embedding for one location mentioned in the article
+	#---------------------------------------------------------------------
+	# Return the embedding of a location phrase, or None if none of its words is in the model
+	#---------------------------------------------------------------------
+	def getEmbedding(self, location, model):
+
+		if model is not self.model:
+			self.entries.clear()
+			self.model = model
+
+		phrase = ' '.join(word.lower() for word in location.split())
+		if phrase in self.entries:
+			self.hits += 1
+			self.entries.move_to_end(phrase)
+			return self.entries[phrase]
+
+		self.misses += 1
 		embeddings = []
-		for word in location:
-			word = word.lower()
+		for word in phrase.split():
 			try:
 				embeddings.append(model[word])
 			except KeyError:
 				continue
-		embeddingForLocation = np.average(embeddings, axis=0) 
-		if embeddingForLocation.shape:
+		embedding = np.average(embeddings, axis=0) if embeddings else None
+
+		self.entries[phrase] = embedding
+		if len(self.entries) > self.maxEntries:
+			self.entries.popitem(last=False)
+
+		return embedding
+
+	#---------------------------------------------------------------------
+	# Return a report with the hit rate of the cache
+	#---------------------------------------------------------------------
+	def getReport(self):
+
+		nLookups = self.hits + self.misses
+		hitRate = float(self.hits) / nLookups if nLookups else 0.0
+		return "Location phrases: {} hits / {} lookups ({:.2%}), {} cached".format(self.hits, nLookups, hitRate, len(self.entries))
+
+#------------------------------------------------------------------------------------
+# Cache of the process, used by getAverageEmbeddingForLocations
+#------------------------------------------------------------------------------------
+phraseEmbeddings = phraseEmbeddingCache()
+
+#------------------------------------------------------------------------------------
+# Return the spatial signatures in a pkl file as (article_name, signature) pairs. 
+# The file is either a single dictionary or the lists of pairs written by convertLocationEmbeddinsToSignatures.py
+# (if an article appears more than once, the last signature is the one to keep)
+#------------------------------------------------------------------------------------
+def readSignatures(pathForSpatialSignatures):
+
+	with open(pathForSpatialSignatures, 'rb') as f:
+		while True:
+			try:
+				signatures = pickle.load(f)
+			except EOFError:
+				break
+
+			if isinstance(signatures, dict):
+				signatures = signatures.items()
+			for article_name, signature in signatures:
+				yield article_name, signature
+
+#------------------------------------------------------------------------------------
+# Return the weighted average of the word embeddings of the locations mentioned in the article
+#------------------------------------------------------------------------------------
+def getAverageEmbeddingForLocations(locations, counts, model):
+
+	locationEmbeddings = [] 
+	locationEmbeddingsWeights = []
+	for x in range(len(locations)):
+
+		# Getting the word embedding for one location mentioned in the article
+		embeddingForLocation = phraseEmbeddings.getEmbedding(locations[x], model)
+		if embeddingForLocation is not None:
 			locationEmbeddings.append(embeddingForLocation)
 			locationEmbeddingsWeights.append(counts[x])
 
@@ -62,15 +136,28 @@ def createSpatialEmbeddingForLocations(documentLocations, sentence, model):
 
 	return getAverageEmbeddingForLocations(documentLocations, counts, model)
 
+#------------------------------------------------------------------------------------
+# Return whether spatialSignatures is a store with the embeddings of the signatures computed with model
+#------------------------------------------------------------------------------------
+def hasEmbeddingsForModel(spatialSignatures, model):
+	return hasattr(spatialSignatures, 'hasEmbeddingsForModel') and spatialSignatures.hasEmbeddingsForModel(model)
+
 #------------------------------------------------------------------------------------
 # Given an article_name, this functions returns the spatial signature for 
 # the related entity. The spatial signatures are the weighted average of the word embeddings
-# of the locations mentioned in the article
+# of the locations mentioned in the article. 
+# spatialSignatures is a dictionary (see readSignatures) or a spatialSignatureStore.spatialSignatureStore. 
+# If the store has the embeddings of the signatures computed with the same model, the signature is read from them
 #------------------------------------------------------------------------------------
 def retrieveSpatial(spatialSignatures, article_name, model):
 
 	signature = None
-	if article_name in spatialSignatures.keys():
+	if hasEmbeddingsForModel(spatialSignatures, model):
+		try:
+			signature = spatialSignatures.getEmbedding(article_name)
+		except KeyError:
+			raise ValueError("Spatial signature for entity %s does not exist." % article_name)
+	elif article_name in spatialSignatures:
 		article = spatialSignatures[article_name]
 		signature = getAverageEmbeddingForLocations(article['indices'], article['counts'], model)
 	else: 
@@ -86,3 +173,89 @@ def getCosineSimilarity(vecA, vecB):
 	return (1-spatial.distance.cosine(vecA, vecB))
 
 
+
+#------------------------------------------------------------------------------------
+# Return the spatial signatures of the entities as the rows of a matrix, the positions (in entityNames)
+# of the entities with a signature and the positions of the entities with an empty signature. 
+# Entities without a signature, or with an empty one, are left out of the matrix. 
+# If the store has the embeddings of the signatures computed with the same model, all rows are read at once
+#------------------------------------------------------------------------------------
+def getSignatureMatrix(spatialSignatures, entityNames, model):
+
+	if hasEmbeddingsForModel(spatialSignatures, model):
+		rows = np.array([spatialSignatures.getRow(entityName) for entityName in entityNames], dtype=np.int64)
+		positions = np.flatnonzero(rows >= 0)
+		hasEmbedding = spatialSignatures.hasEmbedding[rows[positions]].astype(bool)
+		return np.asarray(spatialSignatures.embeddings[rows[positions[hasEmbedding]]], dtype=np.float64), positions[hasEmbedding], positions[~hasEmbedding]
+
+	signatures = []
+	positions = []
+	emptyPositions = []
+	for position, entityName in enumerate(entityNames):
+		try:
+			signature = retrieveSpatial(spatialSignatures, entityName, model)
+		except ValueError:
+			continue
+		if len(signature):
+			signatures.append(signature)
+			positions.append(position)
+		else:
+			emptyPositions.append(position)
+
+	if not signatures:
+		return np.zeros((0, 0)), np.array(positions, dtype=np.int64), np.array(emptyPositions, dtype=np.int64)
+
+	return np.array(signatures, dtype=np.float64), np.array(positions, dtype=np.int64), np.array(emptyPositions, dtype=np.int64)
+
+#------------------------------------------------------------------------------------
+# Return the cosine similarity between each row of matrixA and the same row of matrixB (or vector B), 
+# as getCosineSimilarity does (nan for a zero vector)
+#------------------------------------------------------------------------------------
+def getRowCosineSimilarities(matrixA, matrixB):
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		matrixA = matrixA / np.linalg.norm(matrixA, axis=-1, keepdims=True)
+		matrixB = matrixB / np.linalg.norm(matrixB, axis=-1, keepdims=True)
+		if matrixB.ndim == 1:
+			similarities = matrixA.dot(matrixB)
+		else:
+			similarities = np.einsum('ij,ij->i', matrixA, matrixB)
+
+	return np.clip(similarities, -1.0, 1.0)
+
+#------------------------------------------------------------------------------------
+# Return the cosine similarities between the spatial embedding of a document (see createSpatialEmbeddingForLocations)
+# and the spatial signatures of many entities, computed with a single matrix product. 
+# The similarity is -1 if the entity has no signature (or it is empty), or if the document embedding is empty. 
+# As with getCosineSimilarity, it is nan if both the signature and the document embedding are empty
+#------------------------------------------------------------------------------------
+def getSpatialSimilarities(spatialSignatures, entityNames, documentSpatialEmbedding, model):
+
+	similarities = np.full(len(entityNames), -1.0)
+	if not len(entityNames):
+		return similarities
+
+	signatures, positions, emptyPositions = getSignatureMatrix(spatialSignatures, entityNames, model)
+	if not len(documentSpatialEmbedding):
+		similarities[emptyPositions] = np.nan
+	elif len(positions) and signatures.shape[1] == len(documentSpatialEmbedding):
+		similarities[positions] = getRowCosineSimilarities(signatures, np.asarray(documentSpatialEmbedding, dtype=np.float64))
+
+	return similarities
+
+#------------------------------------------------------------------------------------
+# Return the cosine similarities of many (document spatial embedding, entity name) pairs, as getSpatialSimilarities
+#------------------------------------------------------------------------------------
+def getSpatialSimilaritiesForPairs(spatialSignatures, documentSpatialEmbeddings, entityNames, model):
+
+	similarities = np.full(len(entityNames), -1.0)
+	signatures, positions, emptyPositions = getSignatureMatrix(spatialSignatures, entityNames, model)
+	similarities[[position for position in emptyPositions if not len(documentSpatialEmbeddings[position])]] = np.nan
+
+	# Pairs whose document embedding is not empty (and has the size of the signatures)
+	valid = [k for k, position in enumerate(positions) if len(documentSpatialEmbeddings[position]) == signatures.shape[1]]
+	if valid:
+		documents = np.array([documentSpatialEmbeddings[positions[k]] for k in valid], dtype=np.float64)
+		similarities[positions[valid]] = getRowCosineSimilarities(signatures[valid], documents)
+
+	return similarities
@@ -0,0 +1,300 @@
+#--------------------------------------------------------------------------------------------------------------------
+# Description: This script contains a compact store for the spatial signatures of wikipedia entities
+# (see convertLocationEmbeddinsToSignatures.py). It is a folder of numpy arrays that are memory-mapped when the store
+# is opened, so opening it does not load the signatures:
+#	- vocabulary.npy, vocabularyOffsets.npy: the location mentions (utf-8) of all signatures, each one stored once
+#	- offsets.npy, locationIDs.npy, counts.npy: the signatures (CSR layout). The signature in row r has the locations
+#	  locationIDs[offsets[r]:offsets[r + 1]] with counts counts[offsets[r]:offsets[r + 1]]
+#	- titles.npy, titleOffsets.npy: the article title (utf-8) of each row
+#	- titleTable.npy: hash table (open addressing) from the crc32 of a title to its row (-1 for empty slots)
+#	- embeddings.npy, hasEmbedding.npy (optional): the spatial embedding (float32) of the signature in each row, computed
+#	  once with a word2vec model (see buildEmbeddings), and whether the signature has one (see getAverageEmbeddingForLocations)
+#	- metadata.json: the number of signatures and, once the embeddings are built, their description (the vector size
+#	  and the identifier of the model, see getModelId). It is written last, so the embeddings are only used if they
+#	  were completely written, and only with the model used to build them
+# Run it as a script to convert a pkl file of spatial signatures to a store, or to add the embeddings to a store:
+#	python spatialSignatureStore.py path_to_pkl_file path_to_store
+#	python spatialSignatureStore.py --embeddings path_to_store path_to_word2vec_model
+#--------------------------------------------------------------------------------------------------------------------
+import array
+import hashlib
+import json
+import logging
+import os
+import sys
+import zlib
+import numpy as np
+from gensim.models import KeyedVectors
+from spatialEmbeddings import readSignatures, getAverageEmbeddingForLocations, phraseEmbeddings
+
+#---------------------------------------------------------------------
+# Configure log information
+#---------------------------------------------------------------------
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#---------------------------------------------------------------------
+# Class to read the spatial signatures of a store.
+# store[article_name] returns the signature as in the pkl file: {'indices': [locations], 'counts': [counts]}
+# and, if the embeddings were built, store.getEmbedding(article_name) returns its spatial embedding
+# (only valid for the model used to build them, see hasEmbeddingsForModel)
+#---------------------------------------------------------------------
+class spatialSignatureStore:
+
+	def __init__(self, path):
+		self.path = path
+		self.vocabulary = self.loadArray('vocabulary')
+		self.vocabularyOffsets = self.loadArray('vocabularyOffsets')
+		self.offsets = self.loadArray('offsets')
+		self.locationIDs = self.loadArray('locationIDs')
+		self.counts = self.loadArray('counts')
+		self.titles = self.loadArray('titles')
+		self.titleOffsets = self.loadArray('titleOffsets')
+		self.titleTable = self.loadArray('titleTable')
+		self.mask = len(self.titleTable) - 1
+		self.metadata = loadMetadata(path)
+		self.embeddings = None
+		self.hasEmbedding = None
+		self.checkedModels = {}
+		if 'embeddings' in self.metadata:
+			self.embeddings = self.loadArray('embeddings')
+			self.hasEmbedding = self.loadArray('hasEmbedding')
+
+	def loadArray(self, name):
+		return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+	#---------------------------------------------------------------------
+	# Return whether the embeddings of the store were built with model. The result is kept for each model
+	# (with a reference to it, so its id is not reused), since identifying it reads all its vectors
+	#---------------------------------------------------------------------
+	def hasEmbeddingsForModel(self, model):
+
+		if self.embeddings is None:
+			return False
+
+		if id(model) not in self.checkedModels:
+			description = self.metadata['embeddings']
+			matches = description.get('vectorSize') == model.vector_size and description.get('modelId') == getModelId(model)
+			if not matches:
+				logger.warning("The embeddings of {} were built with another model. The signatures are averaged with the given model".format(self.path))
+			self.checkedModels[id(model)] = (model, matches)
+
+		return self.checkedModels[id(model)][1]
+
+	#---------------------------------------------------------------------
+	# Return the row of the signature of an article, or -1 if there is no signature for it
+	#---------------------------------------------------------------------
+	def getRow(self, article_name):
+
+		title = article_name.encode('utf-8')
+		slot = zlib.crc32(title) & self.mask
+		while True:
+			row = int(self.titleTable[slot])
+			if row < 0 or self.titles[self.titleOffsets[row]:self.titleOffsets[row + 1]].tobytes() == title:
+				return row
+			slot = (slot + 1) & self.mask
+
+	#---------------------------------------------------------------------
+	# Return the signature in a row
+	#---------------------------------------------------------------------
+	def getSignature(self, row):
+
+		start, end = self.offsets[row], self.offsets[row + 1]
+		locations = []
+		for locationID in self.locationIDs[start:end]:
+			locations.append(self.vocabulary[self.vocabularyOffsets[locationID]:self.vocabularyOffsets[locationID + 1]].tobytes().decode('utf-8'))
+
+		return {'indices': locations, 'counts': self.counts[start:end].tolist()}
+
+	#---------------------------------------------------------------------
+	# Return the spatial embedding of an article (a row of the embeddings), or [] if none of its locations is in the model
+	#---------------------------------------------------------------------
+	def getEmbedding(self, article_name):
+
+		row = self.getRow(article_name)
+		if row < 0:
+			raise KeyError(article_name)
+
+		return self.embeddings[row] if self.hasEmbedding[row] else []
+
+	def __contains__(self, article_name):
+		return self.getRow(article_name) >= 0
+
+	def __getitem__(self, article_name):
+
+		row = self.getRow(article_name)
+		if row < 0:
+			raise KeyError(article_name)
+
+		return self.getSignature(row)
+
+	def __len__(self):
+
+		# Stores converted before the number of signatures was saved
+		if 'nSignatures' not in self.metadata:
+			self.metadata['nSignatures'] = int(np.count_nonzero(self.titleTable >= 0))
+
+		return self.metadata['nSignatures']
+
+#---------------------------------------------------------------------
+# Return the metadata of the store in path ({} if it has none)
+#---------------------------------------------------------------------
+def loadMetadata(path):
+
+	if not os.path.exists(os.path.join(path, 'metadata.json')):
+		return {}
+	with open(os.path.join(path, 'metadata.json'), 'r') as metadataFile:
+		return json.load(metadataFile)
+
+#---------------------------------------------------------------------
+# Replace the metadata of the store in path (atomically)
+#---------------------------------------------------------------------
+def saveMetadata(path, metadata):
+
+	with open(os.path.join(path, 'metadata.json.tmp'), 'w') as metadataFile:
+		json.dump(metadata, metadataFile)
+	os.replace(os.path.join(path, 'metadata.json.tmp'), os.path.join(path, 'metadata.json'))
+
+#---------------------------------------------------------------------
+# Return the identifier of a word2vec model: the sha1 of its vector size, its words and its vectors
+#---------------------------------------------------------------------
+def getModelId(model):
+
+	modelHash = hashlib.sha1(str(model.vector_size).encode('utf-8'))
+	modelHash.update('\n'.join(model.index_to_key).encode('utf-8'))
+	modelHash.update(np.ascontiguousarray(model.vectors))
+
+	return modelHash.hexdigest()
+
+#---------------------------------------------------------------------
+# Return the hash table (open addressing) from titles (bytes) to rows. Its size is a power of two, at least twice the number of titles
+#---------------------------------------------------------------------
+def createTitleTable(titleRows):
+
+	size = 1
+	while size < 2 * len(titleRows):
+		size *= 2
+
+	table = array.array('q', [-1]) * size
+	for title, row in titleRows.items():
+		slot = zlib.crc32(title) & (size - 1)
+		while table[slot] >= 0:
+			slot = (slot + 1) & (size - 1)
+		table[slot] = row
+
+	return np.frombuffer(table, dtype=np.int64)
+
+#---------------------------------------------------------------------
+# Convert the spatial signatures of a pkl file (see spatialEmbeddings.readSignatures) to a store in pathForStore.
+# The signatures are read one at a time; if an article appears more than once, the last signature is kept
+#---------------------------------------------------------------------
+def convertSignatures(pathForSpatialSignatures, pathForStore):
+
+	vocabularyIDs = {}
+	vocabulary = bytearray()
+	vocabularyOffsets = array.array('q', [0])
+	offsets = array.array('q', [0])
+	locationIDs = array.array('i')
+	counts = array.array('i')
+	titles = bytearray()
+	titleOffsets = array.array('q', [0])
+	titleRows = {}
+
+	for article_name, signature in readSignatures(pathForSpatialSignatures):
+
+		for location in signature['indices']:
+			if location not in vocabularyIDs:
+				vocabularyIDs[location] = len(vocabularyIDs)
+				vocabulary.extend(location.encode('utf-8'))
+				vocabularyOffsets.append(len(vocabulary))
+			locationIDs.append(vocabularyIDs[location])
+		counts.extend(signature['counts'])
+		offsets.append(len(locationIDs))
+
+		title = article_name.encode('utf-8')
+		titleRows[title] = len(titleOffsets) - 1
+		titles.extend(title)
+		titleOffsets.append(len(titles))
+
+		if len(titleRows) % 1000000 == 0:
+			logger.info("{} signatures converted".format(len(titleRows)))
+
+	if not os.path.exists(pathForStore):
+		os.makedirs(pathForStore)
+
+	# Without metadata, the embeddings of the store are not used while the arrays are replaced
+	if os.path.exists(os.path.join(pathForStore, 'metadata.json')):
+		os.remove(os.path.join(pathForStore, 'metadata.json'))
+
+	arrays = {
+		'vocabulary': np.frombuffer(vocabulary, dtype=np.uint8),
+		'vocabularyOffsets': np.frombuffer(vocabularyOffsets, dtype=np.int64),
+		'offsets': np.frombuffer(offsets, dtype=np.int64),
+		'locationIDs': np.frombuffer(locationIDs, dtype=np.int32),
+		'counts': np.frombuffer(counts, dtype=np.int32),
+		'titles': np.frombuffer(titles, dtype=np.uint8),
+		'titleOffsets': np.frombuffer(titleOffsets, dtype=np.int64),
+		'titleTable': createTitleTable(titleRows)}
+	for name, values in arrays.items():
+		np.save(os.path.join(pathForStore, name + '.npy'), values)
+
+	# Embeddings of a previous store do not match the new rows
+	for name in ('embeddings', 'hasEmbedding'):
+		if os.path.exists(os.path.join(pathForStore, name + '.npy')):
+			os.remove(os.path.join(pathForStore, name + '.npy'))
+	saveMetadata(pathForStore, {'nSignatures': len(titleRows)})
+
+	logger.info("{} signatures and {} locations saved to {}".format(len(titleRows), len(vocabularyIDs), pathForStore))
+
+	return len(titleRows)
+
+#---------------------------------------------------------------------
+# Compute the spatial embedding of each signature of the store in pathForStore with a word2vec model 
+# and save them to the store. The embeddings are written directly to a memory-mapped temporary file.
+# Both files are renamed once they are written, and the metadata is updated last
+#---------------------------------------------------------------------
+def buildEmbeddings(pathForStore, model):
+
+	store = spatialSignatureStore(pathForStore)
+	metadata = dict(store.metadata)
+	metadata.pop('embeddings', None)
+	saveMetadata(pathForStore, metadata)
+	nRows = len(store.offsets) - 1
+	embeddings = np.lib.format.open_memmap(os.path.join(pathForStore, 'embeddings.npy.tmp'), mode='w+', dtype=np.float32, shape=(nRows, model.vector_size))
+	hasEmbedding = np.zeros(nRows, dtype=np.bool_)
+
+	# Only the rows in the title table (the last signature of each article)
+	for n, row in enumerate(store.titleTable[store.titleTable >= 0]):
+
+		signature = store.getSignature(row)
+		embedding = getAverageEmbeddingForLocations(signature['indices'], signature['counts'], model)
+		if len(embedding):
+			embeddings[row] = embedding
+			hasEmbedding[row] = True
+
+		if (n + 1) % 1000000 == 0:
+			logger.info("{} embeddings computed".format(n + 1))
+
+	embeddings.flush()
+	del embeddings
+	with open(os.path.join(pathForStore, 'hasEmbedding.npy.tmp'), 'wb') as hasEmbeddingFile:
+		np.save(hasEmbeddingFile, hasEmbedding)
+	os.replace(os.path.join(pathForStore, 'embeddings.npy.tmp'), os.path.join(pathForStore, 'embeddings.npy'))
+	os.replace(os.path.join(pathForStore, 'hasEmbedding.npy.tmp'), os.path.join(pathForStore, 'hasEmbedding.npy'))
+	metadata['embeddings'] = {'nRows': nRows, 'vectorSize': model.vector_size, 'modelId': getModelId(model)}
+	saveMetadata(pathForStore, metadata)
+
+	logger.info("{} embeddings saved to {}".format(int(np.count_nonzero(hasEmbedding)), pathForStore))
+	logger.info(phraseEmbeddings.getReport())
+
+#---------------------------------------------------------------------
+if __name__ == '__main__':
+
+	if len(sys.argv) == 4 and sys.argv[1] == '--embeddings':
+		buildEmbeddings(sys.argv[2], KeyedVectors.load_word2vec_format(sys.argv[3]))
+	elif len(sys.argv) == 3:
+		convertSignatures(sys.argv[1], sys.argv[2])
+	else:
+		print ("Incorrect usage. Please provide the path for the pkl file and for the store (or --embeddings, the path for the store and for the word2vec model).")
+		sys.exit()
+	print ("All done!!!")
@@ -0,0 +1,47 @@
+#---------------------------------------------------------------------
+# Tests of the index of processed articles (processedArticles in createLocationEmbeddings.py): the articles in the
+# output files must be in the index, and the saved index must only read again the output files that changed
+#---------------------------------------------------------------------
+import os
+import pytest
+
+# The script needs the NER and cleaning dependencies (spacy, unwiki, nltk)
+createLocationEmbeddings = pytest.importorskip('createLocationEmbeddings')
+
+def test_bitmap():
+
+	index = createLocationEmbeddings.processedArticles('unused')
+	for articleID in [0, 7, 8, 12345, 7]:
+		index.add(articleID)
+
+	assert index.n == 4
+	assert all(articleID in index for articleID in [0, 7, 8, 12345])
+	assert not any(articleID in index for articleID in [1, 9, 12344, 12346, 10 ** 9])
+
+def test_index_of_output_files(tmp_path, monkeypatch):
+
+	pathForOutputFiles = str(tmp_path / 'outputs')
+	os.makedirs(pathForOutputFiles)
+	monkeypatch.setattr(createLocationEmbeddings, 'pathForOutputFiles', pathForOutputFiles)
+	monkeypatch.setattr(createLocationEmbeddings, 'pathForProcessedArticlesIndex', os.path.join(pathForOutputFiles, 'processedArticles'))
+
+	# The last line of a file that is being written is ignored
+	with open(os.path.join(pathForOutputFiles, 'locationEmbeddins_Process_0_0_0.txt'), 'w') as outputFile:
+		outputFile.write("3\tA\tParis;Rome\n5\tB\t\n9\tC\tOs")
+
+	index = createLocationEmbeddings.getExistingEmbeddins()
+	assert (index.n, 3 in index, 5 in index, 9 in index) == (2, True, True, False)
+	assert index.coveredFiles == {'locationEmbeddins_Process_0_0_0.txt': len("3\tA\tParis;Rome\n5\tB\t\n")}
+
+	# The saved index is loaded and only the files that changed are read again
+	with open(os.path.join(pathForOutputFiles, 'locationEmbeddins_Process_0_0_0.txt'), 'a') as outputFile:
+		outputFile.write("lo\n")
+	with open(os.path.join(pathForOutputFiles, 'locationEmbeddins_Process_1_0_1.txt'), 'w') as outputFile:
+		outputFile.write("20\tD\t\n")
+	index = createLocationEmbeddings.getExistingEmbeddins()
+	assert (index.n, 3 in index, 9 in index, 20 in index) == (4, True, True, True)
+
+	# The articles come from the saved bitmap, not from the output files
+	os.remove(os.path.join(pathForOutputFiles, 'locationEmbeddins_Process_1_0_1.txt'))
+	index = createLocationEmbeddings.getExistingEmbeddins()
+	assert (index.n, 20 in index) == (4, True)
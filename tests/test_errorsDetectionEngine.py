@@ -0,0 +1,199 @@
+#---------------------------------------------------------------------
+# Tests of the evaluation engine (errorsDetectionEngine.py): the threshold sweep and the search must give
+# the same metrics as scoring every configuration directly (scoreConfigurations), and the annotation table
+# must be extracted from the dataset, saved and loaded again until the dataset changes
+#---------------------------------------------------------------------
+import hashlib
+import json
+import os
+import numpy as np
+from errorsDetectionEngine import scoreConfigurations, scoreThresholdSweep, getGridConfigurations, searchParameterGrid
+from errorsDetectionEngine import buildGoldIndex, lookupGoldAnnotation, extractAnnotationArrays, saveAnnotationTable, loadAnnotationTable, getAnnotationTablePath
+
+#---------------------------------------------------------------------
+# Random annotation table (see extractAnnotationArrays) with -1 for some missing similarities
+#---------------------------------------------------------------------
+def createAnnotations(nAnnotations=200, seed=0):
+
+	rng = np.random.default_rng(seed)
+	annotations = {}
+	annotations['confidence'] = rng.random(nAnnotations)
+	annotations['temporalSimilarity'] = np.where(rng.random(nAnnotations) < 0.2, -1.0, rng.random(nAnnotations))
+	annotations['spatialSimilarity'] = np.where(rng.random(nAnnotations) < 0.3, -1.0, rng.random(nAnnotations))
+	annotations['inCorrect'] = rng.random(nAnnotations) < 0.4
+	annotations['inIncorrect'] = ~annotations['inCorrect'] & (rng.random(nAnnotations) < 0.5)
+	annotations['accuracyCorrect'] = annotations['inCorrect'].copy()
+	annotations['accuracyIncorrect'] = annotations['inIncorrect'].copy()
+
+	return annotations
+
+#---------------------------------------------------------------------
+# Compare the sweep with the direct scoring of every configuration of a small grid
+#---------------------------------------------------------------------
+def assertSweepMatchesDirect(annotations):
+
+	thresholds = np.arange(0.05, 0.95, 0.05)
+	alphas = np.array([0.1, 0.5, 0.9])
+	betas = np.array([0.2, 0.7])
+	gamas = np.array([0.3, 0.8])
+
+	nWeights = len(alphas) * len(betas) * len(gamas)
+	a, b, g = np.unravel_index(np.arange(nWeights), (len(alphas), len(betas), len(gamas)))
+	sweep = scoreThresholdSweep(annotations, thresholds, alphas[a], betas[b], gamas[g])
+
+	nConfigurations = len(thresholds) * nWeights
+	direct = scoreConfigurations(annotations, *getGridConfigurations(thresholds, alphas, betas, gamas, 0, nConfigurations))
+
+	for name in ['accuracy', 'correctRemovals', 'incorrectRemovals', 'missingDetection', 'idkRemovals']:
+		# The grid is flattened with the threshold outermost
+		np.testing.assert_array_equal(sweep[name].T.ravel(), direct[name], err_msg=name)
+
+def test_sweep_matches_direct_scoring():
+	assertSweepMatchesDirect(createAnnotations())
+
+def test_sweep_removes_nan_scores():
+
+	annotations = createAnnotations(seed=1)
+	annotations['spatialSimilarity'][::7] = np.nan
+	assertSweepMatchesDirect(annotations)
+
+	# An annotation with a NaN score is removed at every threshold
+	sweep = scoreThresholdSweep(annotations, [0.0], [0.5], [0.5], [0.5])
+	direct = scoreConfigurations(annotations, [0.0], [0.5], [0.5], [0.5])
+	assert sweep['missingDetection'][0, 0] == direct['missingDetection'][0]
+	assert direct['missingDetection'][0] < annotations['inIncorrect'].sum()
+
+#---------------------------------------------------------------------
+# The parallel search must find the best configuration of the direct scoring
+# (highest accuracy, the first one in the order of the grid in case of a tie)
+#---------------------------------------------------------------------
+def test_search_finds_best_of_direct_scoring():
+
+	annotations = createAnnotations(seed=2)
+	thresholds = np.arange(0.05, 0.95, 0.1)
+	alphas = np.array([0.1, 0.4, 0.7])
+	betas = np.array([0.2, 0.6])
+	gamas = np.array([0.3, 0.5, 0.9])
+
+	nConfigurations = len(thresholds) * len(alphas) * len(betas) * len(gamas)
+	configurations = getGridConfigurations(thresholds, alphas, betas, gamas, 0, nConfigurations)
+	direct = scoreConfigurations(annotations, *configurations)
+	x = int(np.argmax(direct['accuracy']))
+
+	for workers in [1, 2]:
+		best = searchParameterGrid(annotations, thresholds, alphas, betas, gamas, workers=workers, blockSize=4)
+		assert best['index'] == x
+		assert (best['threshold'], best['alpha'], best['beta'], best['gama']) == tuple(values[x] for values in configurations)
+		for name in ['accuracy', 'correctRemovals', 'incorrectRemovals', 'missingDetection', 'idkRemovals']:
+			assert best[name] == direct[name][x]
+
+#---------------------------------------------------------------------
+# Small dataset (as in the json file) and its ground truth, as computePerformance creates it
+#---------------------------------------------------------------------
+dataset = [
+	{'sentence': 'Paris and Rome', 'year': 1990,
+		'annotations': [{'anchor': 'Paris', 'taIdentRef': 'http://dbpedia.org/resource/Paris'}, {'anchor': 'Rome', 'taIdentRef': 'http://dbpedia.org/resource/Rome'}],
+		'annotations_dbpedia': [
+			{'URI': 'http://dbpedia.org/resource/Paris', 'surfaceForm': 'Paris', 'similarityScore': 0.9, 'temporalSimilarity': 0.5, 'spatialSimilarity': 0.25},
+			{'URI': 'http://dbpedia.org/resource/Rome,_Georgia', 'surfaceForm': 'Rome', 'similarityScore': 1, 'temporalSimilarity': -1}]},
+	{'sentence': 'No annotations', 'year': 2000, 'annotations': [], 'annotations_dbpedia': []},
+	{'sentence': 'Paris, Texas', 'year': 1984,
+		'annotations': [{'anchor': 'Paris', 'taIdentRef': 'http://dbpedia.org/resource/Paris,_Texas'}],
+		'annotations_dbpedia': [{'URI': 'http://dbpedia.org/resource/Paris', 'surfaceForm': 'Paris', 'similarityScore': 0.7, 'temporalSimilarity': 0.1, 'spatialSimilarity': -1}]}]
+
+def getAnnotation(surfaceForm, entityName, sentence):
+	return {'surfaceForm': surfaceForm, 'entityName': entityName, 'sentence': sentence}
+
+def createGoldIndex():
+
+	correct = [getAnnotation('paris', 'Paris', 'Paris and Rome')]
+	incorrect = [getAnnotation('rome', 'Rome,_Georgia', 'Paris and Rome'), getAnnotation('paris', 'Paris', 'Paris, Texas'), getAnnotation('paris', 'Paris', 'Paris, Texas')]
+	return buildGoldIndex(correct, ['Paris'], incorrect, ['Rome', 'Paris,_Texas', 'Paris_(mythology)'])
+
+def test_gold_index():
+
+	goldIndex = createGoldIndex()
+
+	# The first occurrence of a key is kept
+	assert lookupGoldAnnotation(goldIndex, ('paris', 'Paris', 'Paris, Texas')) == ('incorrect', 'Paris,_Texas')
+	assert lookupGoldAnnotation(goldIndex, ('paris', 'Paris', 'Paris and Rome')) == ('correct', 'Paris')
+	assert lookupGoldAnnotation(goldIndex, ('paris', 'Paris', 'Unknown sentence')) == (None, None)
+
+	# An annotation in both lists is correct
+	goldIndex = buildGoldIndex([getAnnotation('a', 'A', 's')], ['A'], [getAnnotation('a', 'A', 's')], ['B'])
+	assert lookupGoldAnnotation(goldIndex, ('a', 'A', 's')) == ('correct', 'A')
+
+def test_extract_annotation_arrays():
+
+	annotations = extractAnnotationArrays(dataset, createGoldIndex())
+
+	np.testing.assert_array_equal(annotations['confidence'], [0.9, 1.0, 0.7])
+	np.testing.assert_array_equal(annotations['spatialSimilarity'], [0.25, -1, -1])
+	np.testing.assert_array_equal(annotations['confidenceIsInteger'], [False, True, False])
+	np.testing.assert_array_equal(annotations['inCorrect'], [True, False, False])
+	np.testing.assert_array_equal(annotations['inIncorrect'], [False, True, True])
+	np.testing.assert_array_equal(annotations['accuracyCorrect'], [True, False, False])
+	np.testing.assert_array_equal(annotations['accuracyIncorrect'], [False, True, True])
+	assert [annotations['entities'][x] for x in annotations['goldEntityIds']] == ['Paris', 'Rome', 'Paris,_Texas']
+	assert [annotations['sentences'][x] for x in annotations['sentenceIds']] == ['Paris and Rome', 'Paris and Rome', 'Paris, Texas']
+	np.testing.assert_array_equal(annotations['years'], [1990, 1990, 1984])
+
+#---------------------------------------------------------------------
+# Write the dataset to a json file in tmp_path and save its annotation table
+#---------------------------------------------------------------------
+def createAnnotationTable(tmp_path):
+
+	pathForDataset = str(tmp_path / 'dataset.json')
+	with open(pathForDataset, 'w') as datasetFile:
+		json.dump(dataset, datasetFile)
+
+	annotations = extractAnnotationArrays(dataset, createGoldIndex())
+	saveAnnotationTable(annotations, pathForDataset)
+
+	return pathForDataset, annotations
+
+def test_annotation_table_round_trip(tmp_path):
+
+	pathForDataset, annotations = createAnnotationTable(tmp_path)
+	loaded = loadAnnotationTable(pathForDataset)
+
+	for name in annotations:
+		if isinstance(annotations[name], np.ndarray):
+			assert loaded[name].dtype == annotations[name].dtype
+			np.testing.assert_array_equal(loaded[name], annotations[name], err_msg=name)
+		else:
+			assert loaded[name] == annotations[name], name
+	with open(pathForDataset, 'rb') as datasetFile:
+		assert loaded['datasetHash'] == hashlib.sha1(datasetFile.read()).hexdigest()
+
+	# Without the metadata (e.g., the table was not completely saved), there is no table
+	os.remove(os.path.join(getAnnotationTablePath(pathForDataset), 'metadata.json'))
+	assert loadAnnotationTable(pathForDataset) is None
+
+def test_annotation_table_is_invalidated_when_the_dataset_changes(tmp_path):
+
+	pathForDataset, annotations = createAnnotationTable(tmp_path)
+	mtime = os.path.getmtime(pathForDataset)
+
+	# Only the modification time changed: the table is still valid and records the new time
+	os.utime(pathForDataset, (mtime + 10, mtime + 10))
+	assert loadAnnotationTable(pathForDataset) is not None
+	with open(os.path.join(getAnnotationTablePath(pathForDataset), 'metadata.json'), 'r') as metadataFile:
+		assert json.load(metadataFile)['source']['mtime'] == mtime + 10
+
+	# Same size, other content
+	with open(pathForDataset, 'r') as datasetFile:
+		content = datasetFile.read()
+	with open(pathForDataset, 'w') as datasetFile:
+		datasetFile.write(content.replace('1990', '1991'))
+	os.utime(pathForDataset, (mtime + 20, mtime + 20))
+	assert os.path.getsize(pathForDataset) == len(content)
+	assert loadAnnotationTable(pathForDataset) is None
+
+	# Other size
+	saveAnnotationTable(annotations, pathForDataset)
+	assert loadAnnotationTable(pathForDataset) is not None
+	with open(pathForDataset, 'a') as datasetFile:
+		datasetFile.write('\n')
+	os.utime(pathForDataset, (mtime + 20, mtime + 20))
+	assert loadAnnotationTable(pathForDataset) is None
@@ -0,0 +1,54 @@
+#---------------------------------------------------------------------
+# Tests of the on-disk cache of the locations found by named entity recognition (locationCache.py)
+#---------------------------------------------------------------------
+from locationCache import locationCache, getKey
+
+def test_get_and_put(tmp_path):
+
+	cache = locationCache(str(tmp_path / 'cache.sqlite'))
+	keys = [getKey('sentence', 'From Paris to Rome'), getKey('sentence', 'Nowhere'), getKey('article', 'From Paris to Rome')]
+	assert len(set(keys)) == 3
+
+	cache.put({keys[0]: ['Paris', 'Rome'], keys[1]: []})
+	assert cache.get('sentence', keys) == {keys[0]: ['Paris', 'Rome'], keys[1]: []}
+	assert cache.get('article', [keys[2]]) == {}
+	assert (cache.hits, cache.misses) == ({'sentence': 2, 'article': 0}, {'sentence': 1, 'article': 1})
+	cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+
+	cache = locationCache(str(tmp_path / 'cache.sqlite'), maxEntries=2, evictEvery=10)
+	keys = [getKey('sentence', str(x)) for x in range(3)]
+	cache.put({keys[0]: ['A'], keys[1]: ['B'], keys[2]: ['C']})
+	with cache.connection:
+		cache.connection.executemany('UPDATE locations SET lastUsed = ? WHERE key = ?', [(3, keys[0]), (1, keys[1]), (2, keys[2])])
+
+	# Only evicted every evictEvery writes (and when the cache is closed)
+	assert cache.connection.execute('SELECT COUNT(*) FROM locations').fetchone()[0] == 3
+	cache.close()
+
+	cache = locationCache(str(tmp_path / 'cache.sqlite'))
+	assert cache.get('sentence', keys) == {keys[0]: ['A'], keys[2]: ['C']}
+	cache.close()
+
+def test_cache_is_cleared_for_another_version(tmp_path):
+
+	path = str(tmp_path / 'cache.sqlite')
+	key = getKey('sentence', 'From Paris to Rome')
+	cache = locationCache(path, version='model 1; cleaner 1')
+	cache.put({key: ['Paris', 'Rome']})
+	cache.close()
+
+	# Same version (as when a worker is restarted)
+	cache = locationCache(path, version='model 1; cleaner 1')
+	assert cache.get('sentence', [key]) == {key: ['Paris', 'Rome']}
+	cache.close()
+
+	cache = locationCache(path, version='model 1; cleaner 2')
+	assert cache.get('sentence', [key]) == {}
+	cache.put({key: ['Paris']})
+	cache.close()
+
+	cache = locationCache(path, version='model 1; cleaner 2')
+	assert cache.get('sentence', [key]) == {key: ['Paris']}
+	cache.close()
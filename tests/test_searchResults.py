@@ -0,0 +1,108 @@
+#---------------------------------------------------------------------
+# Tests of the result sink (searchResults.py): the records saved by a grid search, and by partial runs
+# merged together, must give the metrics of scoring every configuration directly (scoreConfigurations)
+#---------------------------------------------------------------------
+import numpy as np
+import pytest
+from errorsDetectionDBpedia import runTests
+from errorsDetectionEngine import scoreConfigurations, getGridConfigurations, searchParameterGrid
+from searchResults import resultSink, loadResults, loadDoneBlocks, expandRecords, mergeResults, getMissingBlocks
+from test_errorsDetectionEngine import createAnnotations
+
+thresholds = np.arange(0.05, 0.95, 0.1)
+alphas = np.array([0.1, 0.4, 0.7])
+betas = np.array([0.2, 0.6])
+gamas = np.array([0.3, 0.5, 0.9])
+
+#---------------------------------------------------------------------
+# Run the grid search (or a shard of it) with a sink saved to name
+#---------------------------------------------------------------------
+def runGrid(annotations, name, shard=None, resume=False):
+
+	sink = resultSink(name, thresholds, alphas, betas, gamas, len(annotations['confidence']), blockSize=4, topK=5, resume=resume, datasetHash=annotations.get('datasetHash'))
+	best = searchParameterGrid(annotations, thresholds, alphas, betas, gamas, blockSize=4, sink=sink, shard=shard)
+	sink.close()
+
+	return best
+
+#---------------------------------------------------------------------
+# Compare the saved records with the direct scoring of every configuration of the grid
+#---------------------------------------------------------------------
+def assertResultsMatchDirect(annotations, name):
+
+	nWeights = len(alphas) * len(betas) * len(gamas)
+	nConfigurations = len(thresholds) * nWeights
+	direct = scoreConfigurations(annotations, *getGridConfigurations(thresholds, alphas, betas, gamas, 0, nConfigurations))
+
+	records, metadata = loadResults(name)
+	assert records.dtype.itemsize == 16
+	expanded = np.concatenate([expandRecords(records[begin:end], block, len(thresholds), nWeights) for block, (begin, end) in loadDoneBlocks(name).items()])
+	expanded = expanded[np.argsort(expanded['index'])]
+
+	np.testing.assert_array_equal(expanded['index'], np.arange(nConfigurations))
+	for metric in ['accuracy', 'correctRemovals', 'incorrectRemovals', 'missingDetection', 'idkRemovals']:
+		np.testing.assert_array_equal(expanded[metric], direct[metric], err_msg=metric)
+
+	return direct
+
+def test_records_match_direct_scoring(tmp_path):
+
+	annotations = createAnnotations(seed=3)
+	best = runGrid(annotations, str(tmp_path / 'grid'))
+	direct = assertResultsMatchDirect(annotations, str(tmp_path / 'grid'))
+
+	assert best['index'] == int(np.argmax(direct['accuracy']))
+	assert best['accuracy'] == direct['accuracy'].max()
+
+def test_merged_shards_match_direct_scoring(tmp_path):
+
+	annotations = createAnnotations(seed=4)
+	names = [str(tmp_path / 'part0'), str(tmp_path / 'part1')]
+	runGrid(annotations, names[0], shard=(0, 2))
+	runGrid(annotations, names[1], shard=(1, 2))
+
+	sink = mergeResults(names, str(tmp_path / 'merged'))
+	best = sink.getBest()
+	sink.close()
+
+	assert getMissingBlocks(str(tmp_path / 'merged')) == []
+	direct = assertResultsMatchDirect(annotations, str(tmp_path / 'merged'))
+	assert best['index'] == int(np.argmax(direct['accuracy']))
+
+def test_missing_blocks_of_merged_shards(tmp_path):
+
+	annotations = createAnnotations(seed=5)
+	names = [str(tmp_path / 'part0'), str(tmp_path / 'part2')]
+	runGrid(annotations, names[0], shard=(0, 3))
+	runGrid(annotations, names[1], shard=(2, 3))
+	mergeResults(names, str(tmp_path / 'merged')).close()
+
+	# The 18 (alpha, beta, gama) configurations are in 5 blocks of 4, the shard 1/3 has the blocks 1 and 4
+	assert getMissingBlocks(str(tmp_path / 'merged')) == [(4, 8), (16, 18)]
+
+def test_results_of_another_dataset_are_rejected(tmp_path):
+
+	annotations = createAnnotations(seed=6)
+	annotations['datasetHash'] = 'a' * 40
+	otherAnnotations = createAnnotations(seed=7)
+	otherAnnotations['datasetHash'] = 'b' * 40
+	assert len(otherAnnotations['confidence']) == len(annotations['confidence'])
+
+	runGrid(annotations, str(tmp_path / 'part0'), shard=(0, 2))
+	runGrid(otherAnnotations, str(tmp_path / 'part1'), shard=(1, 2))
+	with pytest.raises(ValueError):
+		runGrid(otherAnnotations, str(tmp_path / 'part0'), shard=(0, 2), resume=True)
+	with pytest.raises(ValueError):
+		mergeResults([str(tmp_path / 'part0'), str(tmp_path / 'part1')], str(tmp_path / 'merged'))
+
+	# The merged results keep the hash of the runs
+	runGrid(annotations, str(tmp_path / 'part1'), shard=(1, 2))
+	mergeResults([str(tmp_path / 'part0'), str(tmp_path / 'part1')], str(tmp_path / 'merged')).close()
+	assert loadResults(str(tmp_path / 'merged'))[1]['datasetHash'] == annotations['datasetHash']
+	runGrid(annotations, str(tmp_path / 'merged'), resume=True)
+
+def test_report_without_results(tmp_path, capsys):
+
+	# A shard without any block of the grid
+	runTests(createAnnotations(seed=8), resultsName=str(tmp_path / 'empty'), shard=(10 ** 6, 10 ** 6 + 1))
+	assert "No configuration was evaluated" in capsys.readouterr().out
@@ -0,0 +1,127 @@
+#---------------------------------------------------------------------
+# Tests of the batched spatial similarities (spatialEmbeddings.py): they must give the same values as computing
+# the similarity of each entity with retrieveSpatial and getCosineSimilarity (-1 when that fails)
+#---------------------------------------------------------------------
+import pickle
+import numpy as np
+import pytest
+from gensim.models import KeyedVectors
+from spatialEmbeddings import retrieveSpatial, getCosineSimilarity, createSpatialEmbeddingForLocations, getSpatialSimilarities, getSpatialSimilaritiesForPairs
+from spatialSignatureStore import spatialSignatureStore, convertSignatures, buildEmbeddings, loadMetadata, saveMetadata
+
+# Entities with a signature, without one (Missing) and with an empty one (none of its locations is in the model)
+signatures = {
+	'Paris': {'indices': ['paris', 'rome'], 'counts': [3, 1]},
+	'New_York': {'indices': ['new york', 'atlantis'], 'counts': [2, 5]},
+	'Rome': {'indices': ['rome'], 'counts': [1]},
+	'Atlantis': {'indices': ['atlantis'], 'counts': [4]}}
+entityNames = ['Paris', 'Missing', 'Atlantis', 'New_York', 'Rome', 'Paris']
+
+@pytest.fixture
+def model():
+
+	model = KeyedVectors(8)
+	rng = np.random.default_rng(0)
+	model.add_vectors(['paris', 'rome', 'new', 'york'], rng.normal(size=(4, 8)).astype(np.float32))
+
+	return model
+
+@pytest.fixture(params=['dict', 'store'])
+def spatialSignatures(request, model, tmp_path):
+
+	if request.param == 'dict':
+		return signatures
+
+	pathForStore = createStore(tmp_path)
+	buildEmbeddings(pathForStore, model)
+
+	return spatialSignatureStore(pathForStore)
+
+#---------------------------------------------------------------------
+# Create a store of the signatures in tmp_path and return its path
+#---------------------------------------------------------------------
+def createStore(tmp_path):
+
+	with open(str(tmp_path / 'signatures.pkl'), 'wb') as signaturesFile:
+		pickle.dump(signatures, signaturesFile)
+	convertSignatures(str(tmp_path / 'signatures.pkl'), str(tmp_path / 'store'))
+
+	return str(tmp_path / 'store')
+
+#---------------------------------------------------------------------
+# Similarity of one entity, computed as addSpatialSimilaritiesToDataset did for each annotation
+#---------------------------------------------------------------------
+def getReferenceSimilarity(spatialSignatures, entityName, documentSpatialEmbedding, model):
+
+	try:
+		signature = retrieveSpatial(spatialSignatures, entityName, model)
+		# nan for two empty vectors
+		with np.errstate(invalid='ignore'):
+			return getCosineSimilarity(signature, documentSpatialEmbedding)
+	except ValueError:
+		return -1
+
+def test_similarities_match_per_entity_loop(spatialSignatures, model):
+
+	documentSpatialEmbedding = createSpatialEmbeddingForLocations(['rome', 'new york'], 'from rome to new york', model)
+	reference = [getReferenceSimilarity(spatialSignatures, entityName, documentSpatialEmbedding, model) for entityName in entityNames]
+
+	similarities = getSpatialSimilarities(spatialSignatures, entityNames, documentSpatialEmbedding, model)
+	np.testing.assert_allclose(similarities, reference, atol=1e-6)
+	assert list(similarities[1:3]) == [-1, -1]
+
+def test_empty_document_embedding(spatialSignatures, model):
+
+	documentSpatialEmbedding = createSpatialEmbeddingForLocations(['atlantis'], 'to atlantis', model)
+	assert len(documentSpatialEmbedding) == 0
+
+	reference = [getReferenceSimilarity(spatialSignatures, entityName, documentSpatialEmbedding, model) for entityName in entityNames]
+	similarities = getSpatialSimilarities(spatialSignatures, entityNames, documentSpatialEmbedding, model)
+	np.testing.assert_array_equal(similarities, reference)
+	assert np.isnan(similarities[2]) and list(np.delete(similarities, 2)) == [-1] * (len(entityNames) - 1)
+
+def test_pairs_match_per_entity_loop(spatialSignatures, model):
+
+	documents = [
+		createSpatialEmbeddingForLocations(['paris'], 'in paris', model),
+		createSpatialEmbeddingForLocations(['rome', 'paris'], 'rome and paris', model),
+		createSpatialEmbeddingForLocations(['atlantis'], 'to atlantis', model)]
+	documentSpatialEmbeddings = [documents[x % len(documents)] for x in range(len(entityNames))]
+	reference = [getReferenceSimilarity(spatialSignatures, entityName, documentSpatialEmbedding, model) for entityName, documentSpatialEmbedding in zip(entityNames, documentSpatialEmbeddings)]
+
+	similarities = getSpatialSimilaritiesForPairs(spatialSignatures, documentSpatialEmbeddings, entityNames, model)
+	np.testing.assert_allclose(similarities, reference, atol=1e-6)
+	assert np.isnan(similarities[2]) and similarities[5] == -1
+
+def test_store_metadata(model, tmp_path):
+
+	pathForStore = createStore(tmp_path)
+	assert loadMetadata(pathForStore) == {'nSignatures': len(signatures)}
+	assert len(spatialSignatureStore(pathForStore)) == len(signatures)
+	assert spatialSignatureStore(pathForStore).embeddings is None
+
+	buildEmbeddings(pathForStore, model)
+	assert spatialSignatureStore(pathForStore).embeddings is not None
+
+	# Embeddings of an interrupted build (the metadata is saved without them before they are written)
+	metadata = loadMetadata(pathForStore)
+	del metadata['embeddings']
+	saveMetadata(pathForStore, metadata)
+	assert spatialSignatureStore(pathForStore).embeddings is None
+
+def test_store_embeddings_of_another_model(model, tmp_path):
+
+	pathForStore = createStore(tmp_path)
+	buildEmbeddings(pathForStore, model)
+	store = spatialSignatureStore(pathForStore)
+	assert store.hasEmbeddingsForModel(model)
+
+	# Same words and vector size, other vectors: the signatures must be averaged with the given model
+	otherModel = KeyedVectors(8)
+	otherModel.add_vectors(model.index_to_key, np.random.default_rng(1).normal(size=(4, 8)).astype(np.float32))
+	assert not store.hasEmbeddingsForModel(otherModel)
+
+	documentSpatialEmbedding = createSpatialEmbeddingForLocations(['rome', 'new york'], 'from rome to new york', otherModel)
+	reference = [getReferenceSimilarity(signatures, entityName, documentSpatialEmbedding, otherModel) for entityName in entityNames]
+	np.testing.assert_allclose(getSpatialSimilarities(store, entityNames, documentSpatialEmbedding, otherModel), reference, atol=1e-6)
+	np.testing.assert_allclose(retrieveSpatial(store, 'Paris', otherModel), retrieveSpatial(signatures, 'Paris', otherModel))